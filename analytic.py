@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+"""Analytical cache model of the flip kernels (hflip and vflip), returning
+the counts of `cache.simulate_counts` without simulating any access.
+
+The flips read every pixel of each image exactly once, row set by row
+set (see `cache.iterate_accesses`): for each column, one pixel of each
+of the row set's `parallelism` rows.  So the line lookups of a row are
+its pixels plus those straddling two lines, and a line is only ever
+reused
+
+* by the next pixels of the same row (hits, as long as the row set's
+  active lines fit in their sets), or
+* across rows: a line shared by the end of one row and the start of the
+  next, or a row read again (rows reflected at the bottom of the last,
+  partial, row set).
+
+For the latter, the number of lines touched between the two uses
+(`parallelism` pixels of 3 bytes per column step) is compared to the
+capacity of each level (fully associative LRU).  All of this is worked
+out per row, so the cost is proportional to the number of rows, not of
+accesses.  Write-backs (with `store_to_cache`) are the L1 misses that
+evict a (dirty) line, see `flip_counts`.
+
+Axis-aligned scaling is not covered: the simulator has no such kernel.
+Use `validate` to check the model against exact simulation.
+
+Usage
+-----
+* Counts (and costs) of a flip workload::
+
+    $ python analytic.py count hflip 500 2 8 8 -p 4
+
+
+* Check against simulation over a grid of sizes, parallelism and L1
+  geometries::
+
+    $ python analytic.py validate --image_sizes 50 100 250 \\
+          --parallelisms 1 2 4 8 16 --ways 1 2 8 --l1_sizes 4096 32768
+
+"""
+
+from __future__ import division, print_function
+from math import ceil
+from time import perf_counter
+from cache_model import geometry
+
+KERNELS = ('hflip', 'vflip')
+PIXEL_SIZE = 3
+# the counters `validate` reports errors of (the others follow from them)
+ERROR_COUNTERS = (('L1', 'misses'), ('L2', 'misses'), ('L2', 'stores'),
+                  ('DRAM', 'loads'), ('DRAM', 'stores'))
+
+
+def _count_congruent(lo, hi, residue, modulus=3):
+    """Number of integers in [lo, hi] congruent to `residue`."""
+    if hi < lo:
+        return 0
+    return ((hi - residue) // modulus - (lo - 1 - residue) // modulus)
+
+
+def _lookups(a0, a1, cl_size):
+    """Line lookups of the pixels in bytes [a0, a1): one per pixel, two
+    for pixels straddling a line boundary."""
+    lo, hi = a0 // cl_size + 1, (a1 - 1) // cl_size  # boundaries inside
+    aligned = sum(_count_congruent(lo, hi, j) for j in range(3)
+                  if (j * cl_size - a0) % 3 == 0)
+    return (a1 - a0) // PIXEL_SIZE + (hi - lo + 1 if hi >= lo else 0) - aligned
+
+
+def _columns(line, a0, w, cl_size):
+    """First and last column of the row (starting at byte a0) with a
+    pixel in `line`."""
+    first = max(0, -(-(line * cl_size - (PIXEL_SIZE - 1) - a0) // PIXEL_SIZE))
+    last = min(w - 1, ((line + 1) * cl_size - 1 - a0) // PIXEL_SIZE)
+    return first, last
+
+
+def _row_sets(kernel, w, h, n_images, parallelism):
+    """Yields (first step, [global rows]) of each row set in order, where
+    a step is a column of a row set, and global row g starts at byte
+    g * w * 3 (reads of image k are at offset w*h*3*(k + n_images), as in
+    `cache.iterate_accesses`)."""
+    n_row_sets = int(ceil(h / parallelism))
+    for k in range(n_images):
+        first_row = (k + n_images) * h
+        for row_set in range(n_row_sets):
+            rows = []
+            for row in range(parallelism):
+                y = row_set * parallelism + row
+                if kernel == 'vflip':
+                    y = h - 1 - y
+                # reflect_101
+                y = abs(y) if y < 0 else (h - 2 - y % h if y >= h else y)
+                rows.append(first_row + y)
+            yield (k * n_row_sets + row_set) * w, rows
+
+
+def _reused(previous, now, capacity, bytes_per_step, cl_size):
+    """Whether a line used at step `previous` is still cached at step
+    `now` (fewer than `capacity` lines touched in between)."""
+    return (previous is not None and
+            (now - previous) * bytes_per_step / cl_size < capacity)
+
+
+def _resident(n_lines, n_sets, n_ways):
+    """Lines left in a cache after `n_lines` consecutive lines went
+    through it (each set keeps at most `n_ways` of its lines)."""
+    q, r = divmod(n_lines, n_sets)
+    return r * min(n_ways, q + 1) + (n_sets - r) * min(n_ways, q)
+
+
+def flip_counts(kernel, image_size, n_images, l1_ways, l2_ways, parallelism=1,
+                l1_block_size=64, l2_block_size=64, l1_size=32768,
+                l2_size=2097152, store_to_cache=False, seed=None,
+                warmup_images=0, warmup_accesses=0, dram=None,
+                dram_config=None, l1_policy='LRU', l2_policy='LRU'):
+    """Estimates `cache.simulate_counts` for a flip kernel (`seed` is
+    ignored, flips are deterministic).  Only LRU caches are modeled, with
+    neither warm-up nor the DRAM model.
+
+    With `store_to_cache`, every line read is written, so each L1 miss
+    evicts a dirty line once its set is full: L1 write-backs are the L1
+    misses minus the lines left in the L1, and carry the error of the L1
+    misses (up to 17% over the default `validate` grid, 45% for two
+    250-pixel images through a direct-mapped 4 KiB L1 with 16 rows).
+    Write-backs that miss a thrashing L2 are not modeled, so stores are
+    only supported if the images fit in the L2.
+
+    Returns
+    -------
+    counts (dict)
+        Same structure as `cache.simulate_counts`.
+    """
+    if kernel not in KERNELS:
+        raise ValueError('The analytical model covers %s, not %r.'
+                         '' % (', '.join(KERNELS), kernel))
+    if (warmup_images or warmup_accesses or dram is not None or
+            (l1_policy, l2_policy) != ('LRU', 'LRU')):
+        raise ValueError('The analytical model supports neither warm-up, '
+                         'the DRAM model nor policies other than LRU.')
+    if l1_block_size != l2_block_size:
+        raise ValueError('The analytical model needs equal L1 and L2 '
+                         'block sizes.')
+    cl_size = l1_block_size
+    w = h = image_size
+    row_bytes = w * PIXEL_SIZE
+    bytes_per_step = parallelism * PIXEL_SIZE
+    levels = ('L1', 'L2')
+    sets, ways, capacity = {}, {}, {}
+    for name, n_ways, size in (('L1', l1_ways, l1_size),
+                               ('L2', l2_ways, l2_size)):
+        sets[name], ways[name] = geometry(n_ways, cl_size, size)
+        capacity[name] = sets[name] * ways[name]
+
+    accesses = lookups = 0
+    misses = {'L1': 0, 'L2': 0}
+    last_use = {'L1': {}, 'L2': {}}  # step of the last use of shared lines
+    last_read = {}  # first step of the last read of each row
+    for t0, rows in _row_sets(kernel, w, h, n_images, parallelism):
+        # a row thrashes if more of the row set's active lines (one, or
+        # two, per row) map to one of its sets than there are ways
+        thrashing = {}
+        for name in levels:
+            rows_of_set = {}
+            for g in set(rows):
+                a0 = g * row_bytes
+                for line in {a0 // cl_size, (a0 + PIXEL_SIZE - 1) // cl_size}:
+                    rows_of_set.setdefault(line % sets[name], set()).add(g)
+            thrashing[name] = set().union(*[
+                rs for rs in rows_of_set.values() if len(rs) > ways[name]])
+
+        # the first and last lines of a row may be shared with other rows;
+        # their uses are decided in time order
+        shared, row_misses = [], []
+        for i, g in enumerate(rows):
+            a0, a1 = g * row_bytes, (g + 1) * row_bytes
+            first_line, last_line = a0 // cl_size, (a1 - 1) // cl_size
+            n_lookups = _lookups(a0, a1, cl_size)
+            accesses += w
+            lookups += n_lookups
+            previous = last_read.get(g)
+            last_read[g] = t0
+            n_interior = max(0, last_line - first_line - 1)
+            row_misses.append({
+                name: (0 if _reused(previous, t0, capacity[name],
+                                    bytes_per_step, cl_size)
+                       else n_interior) for name in levels})
+            row_misses[-1]['lookups'] = n_lookups
+            for line in {first_line, last_line}:
+                first, last = _columns(line, a0, w, cl_size)
+                if kernel == 'hflip':  # columns are swept right to left
+                    first, last = w - 1 - last, w - 1 - first
+                shared.append((t0 + first, t0 + last, line, i))
+        for t_first, t_last, line, i in sorted(shared):
+            for name in levels:
+                if not _reused(last_use[name].get(line), t_first,
+                               capacity[name], bytes_per_step, cl_size):
+                    row_misses[i][name] += 1
+                last_use[name][line] = t_last
+
+        for i, g in enumerate(rows):
+            counts = row_misses[i]
+            if g in thrashing['L1']:
+                misses['L1'] += counts['lookups']
+                misses['L2'] += (counts['lookups'] if g in thrashing['L2']
+                                 else counts['L2'])
+            else:
+                misses['L1'] += counts['L1']
+                misses['L2'] += counts['L2']
+
+    l1_misses, l2_misses = misses['L1'], misses['L2']
+    stores = accesses if store_to_cache else 0
+    l1_writebacks = l2_writebacks = 0
+    if store_to_cache:
+        # the images read are consecutive lines
+        first = n_images * h * row_bytes
+        n_lines = (2 * first - 1) // cl_size - first // cl_size + 1
+        if n_lines > capacity['L2']:
+            raise ValueError('The analytical model supports stores only '
+                             'if the images fit in the L2.')
+        l1_writebacks = l1_misses - _resident(n_lines, sets['L1'],
+                                              ways['L1'])
+    return {'L1': {'loads': accesses, 'stores': stores,
+                   'hits': lookups - l1_misses, 'misses': l1_misses,
+                   'writebacks': l1_writebacks},
+            'L2': {'loads': l1_misses, 'stores': l1_writebacks,
+                   'hits': l1_misses - l2_misses, 'misses': l2_misses,
+                   'writebacks': l2_writebacks},
+            'DRAM': {'loads': l2_misses, 'stores': l2_writebacks}}
+
+
+def validate(kernels=KERNELS, image_sizes=(50, 100, 250),
+             parallelisms=(1, 2, 4, 8, 16), ways=(1, 2, 8),
+             l1_sizes=(4096, 32768), n_images=1, l2_size=2097152,
+             store_to_cache=False, verbose=True):
+    """Compares `flip_counts` to `cache.simulate_counts` over a grid.
+
+    Returns
+    -------
+    rows (list of dicts)
+        Per configuration: the configuration, the largest relative error
+        of the L1 and L2 misses, L2 stores (write-backs) and DRAM loads
+        and stores ('max error'), whether all counters are exact, and the
+        time (s) each took.
+    """
+    from cache import simulate_counts
+    rows = []
+    for kernel in kernels:
+        for size in image_sizes:
+            for p in parallelisms:
+                for n_ways in ways:
+                    for l1_size in l1_sizes:
+                        config = dict(kernel=kernel, image_size=size,
+                                      n_images=n_images, l1_ways=n_ways,
+                                      l2_ways=n_ways, parallelism=p,
+                                      l1_size=l1_size, l2_size=l2_size,
+                                      store_to_cache=store_to_cache)
+                        start = perf_counter()
+                        estimate = flip_counts(**config)
+                        analytic_time = perf_counter() - start
+                        start = perf_counter()
+                        exact = simulate_counts(**config)
+                        simulation_time = perf_counter() - start
+                        errors = [abs(estimate[level][key] -
+                                      exact[level][key]) /
+                                  max(exact[level][key], 1)
+                                  for level, key in ERROR_COUNTERS]
+                        row = dict(config, **{
+                            'max error': max(errors),
+                            'exact': estimate == exact,
+                            'analytic time (s)': analytic_time,
+                            'simulation time (s)': simulation_time})
+                        rows.append(row)
+                        if verbose:
+                            print('%-6s %4s p=%-3s ways=%s l1=%-6s '
+                                  'max error %6.2f%% %s (%.2g s vs %.2g s)'
+                                  '' % (kernel, size, p, n_ways, l1_size,
+                                        100 * row['max error'],
+                                        'exact' if row['exact'] else '     ',
+                                        analytic_time, simulation_time))
+    if verbose and rows:
+        print('%s of %s configurations exact, largest error %.2f%%.'
+              '' % (sum(row['exact'] for row in rows), len(rows),
+                    100 * max(row['max error'] for row in rows)))
+    return rows
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    from pprint import pprint
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+
+    p = subparsers.add_parser('count', help='Estimate (and price) counts.')
+    p.add_argument('kernel', choices=KERNELS)
+    p.add_argument('image_size', type=int, help='Width of (square) images.')
+    p.add_argument('n_images', type=int, help='Number of images to process.')
+    p.add_argument('l1_ways', type=int)
+    p.add_argument('l2_ways', type=int)
+    p.add_argument('--block_size', type=int, default=64)
+    p.add_argument('--l1_size', type=int, default=32768)
+    p.add_argument('--l2_size', type=int, default=2097152)
+    p.add_argument('-p', '--parallelism', type=int, default=1)
+    p.add_argument('--store_to_cache', default=False, action='store_true')
+
+    p = subparsers.add_parser('validate',
+                              help='Compare against exact simulation.')
+    p.add_argument('-k', '--kernels', nargs='+', default=list(KERNELS),
+                   choices=KERNELS)
+    p.add_argument('-s', '--image_sizes', nargs='+', type=int,
+                   default=[50, 100, 250])
+    p.add_argument('-p', '--parallelisms', nargs='+', type=int,
+                   default=[1, 2, 4, 8, 16])
+    p.add_argument('--ways', nargs='+', type=int, default=[1, 2, 8])
+    p.add_argument('--l1_sizes', nargs='+', type=int, default=[4096, 32768])
+    p.add_argument('--n_images', type=int, default=1)
+    p.add_argument('--store_to_cache', default=False, action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'count':
+        from cache import price
+        workload = dict(kernel=args.kernel, image_size=args.image_size,
+                        n_images=args.n_images, l1_ways=args.l1_ways,
+                        l2_ways=args.l2_ways, parallelism=args.parallelism,
+                        l1_block_size=args.block_size,
+                        l2_block_size=args.block_size, l1_size=args.l1_size,
+                        l2_size=args.l2_size,
+                        store_to_cache=args.store_to_cache)
+        start = perf_counter()
+        counts = flip_counts(**workload)
+        print('Estimated in %.3g s' % (perf_counter() - start))
+        pprint(counts)
+        del workload['kernel'], workload['parallelism']
+        del workload['store_to_cache']
+        price(counts, verbose=True, **workload)
+    elif args.command == 'validate':
+        validate(kernels=args.kernels, image_sizes=args.image_sizes,
+                 parallelisms=args.parallelisms, ways=args.ways,
+                 l1_sizes=args.l1_sizes, n_images=args.n_images,
+                 store_to_cache=args.store_to_cache)
+    else:
+        parser.print_help()
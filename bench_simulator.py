@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""Performance benchmarks of the cache simulator, with JSON baselines.
+
+Measures
+
+* `simulate_reads` throughput (accesses/s) for every kernel, image size
+  and parallelism,
+* end-to-end `cache.main` latency (s) for every kernel and image size,
+* CACTI lookup cost (s per call, cold and memoized), and
+* sweep throughput (configurations/s) over a small ways x L1 size grid,
+
+all with fixed seeds, and writes them to a JSON file.  `compare` flags
+every benchmark more than a threshold worse than in a baseline file.
+
+CACTI is replaced by `stub_cacti/cacti` unless `--cacti_dir` is given, so
+the benchmarks run anywhere (CACTI lookup cost then measures the process
+spawn and parsing overhead).  Run it from the repository root (CACTI
+configurations are written from cache_template.cfg there).
+
+Usage
+-----
+* Record a baseline, then check a change against it::
+
+    $ python bench_simulator.py run -o results/bench/baseline.json
+    $ python bench_simulator.py run -o results/bench/new.json \\
+          --compare results/bench/baseline.json
+
+
+* Compare two stored runs (exits with status 1 on regressions)::
+
+    $ python bench_simulator.py compare results/bench/baseline.json \\
+          results/bench/new.json --threshold 0.1
+
+"""
+
+from __future__ import division, print_function
+import os
+import sys
+import json
+import random
+import platform
+from time import perf_counter, strftime
+
+STUB_CACTI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'stub_cacti')
+GEOMETRY = dict(l1_ways=8, l1_block_size=64, l1_size=32768,
+                l2_ways=8, l2_block_size=64, l2_size=2097152)
+KERNELS = ['rot', 'hflip', 'vflip']
+IMAGE_SIZES = [100, 250, 500]
+PARALLELISMS = [1, 4, 16]
+SWEEP_WAYS = [1, 2, 4, 8]
+SWEEP_L1_SIZES = [8192, 16384, 32768]
+
+
+def _best_of(repeats, fcn):
+    """Returns (smallest wall time of `repeats` calls, last return value)."""
+    best = None
+    for _ in range(repeats):
+        start = perf_counter()
+        value = fcn()
+        seconds = perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, value
+
+
+def _result(value, unit, higher_is_better):
+    return {'value': value, 'unit': unit,
+            'higher_is_better': higher_is_better}
+
+
+def bench_simulate_reads(kernel, image_size, parallelism, n_images=1,
+                         repeats=3, seed=0):
+    """Accesses per second replayed by `simulate_reads` (pycachesim)."""
+    from cache import create_cache, simulate_reads, generator_dict
+
+    def run():
+        random.seed(seed)
+        cs = create_cache(**GEOMETRY)
+        return simulate_reads(generator_dict[kernel], (image_size,) * 2,
+                              n_images, cs, parallelism=parallelism)[1]
+    seconds, n_accesses = _best_of(repeats, run)
+    return _result(n_accesses / seconds, 'accesses/s', True)
+
+
+def _clear_cacti_memo():
+    import cache
+    cache._cacti_outputs.clear()
+
+
+def bench_main(kernel, image_size, n_images=1, repeats=3, seed=0):
+    """Seconds per `cache.main` call (simulation + CACTI + pricing)."""
+    from cache import main
+
+    def run():
+        _clear_cacti_memo()
+        return main(kernel, image_size, n_images, verbose=False, seed=seed,
+                    **GEOMETRY)
+    return _result(_best_of(repeats, run)[0], 's', False)
+
+
+def bench_cacti(repeats=3):
+    """Seconds per CACTI lookup, running CACTI (cold) and memoized."""
+    from cache import get_cactus_results
+    configs = [(w, 64, s) for w in SWEEP_WAYS for s in SWEEP_L1_SIZES]
+
+    def run():
+        for config in configs:
+            get_cactus_results(*config)
+
+    def cold():
+        _clear_cacti_memo()
+        run()
+    cold_seconds = _best_of(repeats, cold)[0]
+    memo_seconds = _best_of(repeats, lambda: [run() for _ in range(100)])[0]
+    return {'cacti/cold': _result(cold_seconds / len(configs), 's', False),
+            'cacti/memoized': _result(memo_seconds / (100 * len(configs)),
+                                      's', False)}
+
+
+def bench_sweep(kernel='rot', image_size=100, n_images=1, repeats=3, seed=0):
+    """Configurations per second of a ways x L1 size sweep (as in
+    `run_cache_experiment.py`, CACTI memo cleared at the start)."""
+    from cache import main
+    configs = [(w, s) for w in SWEEP_WAYS for s in SWEEP_L1_SIZES]
+
+    def run():
+        _clear_cacti_memo()
+        for ways, l1_size in configs:
+            geometry = dict(GEOMETRY, l1_ways=ways, l2_ways=ways,
+                            l1_size=l1_size)
+            main(kernel, image_size, n_images, verbose=False, seed=seed,
+                 **geometry)
+    return _result(len(configs) / _best_of(repeats, run)[0], 'configs/s',
+                   True)
+
+
+def run_benchmarks(kernels=KERNELS, image_sizes=IMAGE_SIZES,
+                   parallelisms=PARALLELISMS, repeats=3, seed=0,
+                   only=('simulate_reads', 'main', 'cacti', 'sweep'),
+                   verbose=True):
+    """Runs the benchmarks and returns {'meta': ..., 'results': {name:
+    {'value', 'unit', 'higher_is_better'}}}."""
+    import cache
+    results = {}
+
+    def record(name, result):
+        results[name] = result
+        if verbose:
+            print('%-36s %14.6g %s' % (name, result['value'], result['unit']))
+
+    if 'simulate_reads' in only:
+        for kernel in kernels:
+            for size in image_sizes:
+                for p in parallelisms:
+                    record('simulate_reads/%s/%s/p%s' % (kernel, size, p),
+                           bench_simulate_reads(kernel, size, p,
+                                                repeats=repeats, seed=seed))
+    if 'main' in only:
+        for kernel in kernels:
+            for size in image_sizes:
+                record('main/%s/%s' % (kernel, size),
+                       bench_main(kernel, size, repeats=repeats, seed=seed))
+    if 'cacti' in only:
+        for name, result in sorted(bench_cacti(repeats=repeats).items()):
+            record(name, result)
+    if 'sweep' in only:
+        record('sweep/rot/100', bench_sweep(repeats=repeats, seed=seed))
+
+    try:
+        from importlib.metadata import version
+        pycachesim_version = version('pycachesim')
+    except Exception:
+        pycachesim_version = None
+    meta = {'date': strftime('%Y-%m-%d %H:%M:%S'),
+            'host': platform.node(), 'python': platform.python_version(),
+            'platform': platform.platform(), 'pycachesim': pycachesim_version,
+            'cacti_dir': cache.CACTI_DIR, 'repeats': repeats, 'seed': seed}
+    return {'meta': meta, 'results': results}
+
+
+def compare(baseline, current, threshold=0.1):
+    """Returns [(name, baseline value, current value, relative change,
+    regressed)] for the benchmarks in both runs.  The change is positive
+    when the current run is better; a benchmark regressed if it is more
+    than `threshold` (a fraction) worse."""
+    rows = []
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        base = baseline['results'][name]
+        value = current['results'][name]['value']
+        change = (value - base['value']) / base['value']
+        if not base['higher_is_better']:
+            change = -change
+        rows.append((name, base['value'], value, change, change < -threshold))
+    return rows
+
+
+def print_comparison(rows, threshold):
+    print('%-36s %14s %14s %9s' % ('benchmark', 'baseline', 'current',
+                                   'change'))
+    for name, base, value, change, regressed in rows:
+        print('%-36s %14.6g %14.6g %+8.1f%%%s'
+              '' % (name, base, value, 100 * change,
+                    '  REGRESSION' if regressed else ''))
+    n_regressed = sum(row[-1] for row in rows)
+    print('%s of %s benchmarks regressed by more than %s%%.'
+          '' % (n_regressed, len(rows), 100 * threshold))
+    return n_regressed
+
+
+def _load(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+
+    p = subparsers.add_parser('run', help='Run the benchmarks.')
+    p.add_argument('-o', '--out', default=None,
+                   help='Where to write the results (JSON).')
+    p.add_argument('-k', '--kernels', nargs='+', default=KERNELS)
+    p.add_argument('-s', '--image_sizes', nargs='+', type=int,
+                   default=IMAGE_SIZES)
+    p.add_argument('-p', '--parallelisms', nargs='+', type=int,
+                   default=PARALLELISMS)
+    p.add_argument('-r', '--repeats', type=int, default=3,
+                   help='Report the best of this many runs.')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--only', nargs='+',
+                   default=['simulate_reads', 'main', 'cacti', 'sweep'],
+                   choices=['simulate_reads', 'main', 'cacti', 'sweep'])
+    p.add_argument('--cacti_dir', default=STUB_CACTI_DIR,
+                   help='Directory of the CACTI binary (defaults to the '
+                        'stub).')
+    p.add_argument('--compare', default=None, metavar='BASELINE',
+                   help='Compare the results to this baseline.')
+    p.add_argument('-t', '--threshold', type=float, default=0.1)
+
+    p = subparsers.add_parser('compare', help='Compare two runs.')
+    p.add_argument('baseline')
+    p.add_argument('current')
+    p.add_argument('-t', '--threshold', type=float, default=0.1,
+                   help='Flag benchmarks worse by more than this fraction.')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        import cache
+        cache.CACTI_DIR = args.cacti_dir
+        run = run_benchmarks(kernels=args.kernels,
+                             image_sizes=args.image_sizes,
+                             parallelisms=args.parallelisms,
+                             repeats=args.repeats, seed=args.seed,
+                             only=args.only)
+        if args.out is not None:
+            out_dir = os.path.dirname(args.out)
+            if out_dir and not os.path.exists(out_dir):
+                os.makedirs(out_dir)
+            with open(args.out, 'w') as f:
+                json.dump(run, f, indent=2, sort_keys=True)
+        if args.compare is not None:
+            print()
+            rows = compare(_load(args.compare), run, args.threshold)
+            sys.exit(1 if print_comparison(rows, args.threshold) else 0)
+    elif args.command == 'compare':
+        rows = compare(_load(args.baseline), _load(args.current),
+                       args.threshold)
+        sys.exit(1 if print_comparison(rows, args.threshold) else 0)
+    else:
+        parser.print_help()
@@ -20,6 +20,39 @@ generated 200 x 200 color images::
     $ python benchmark.py path/to/image/directory all --show
 
 
+* Compare the per-image (albumentations) path against the batched NumPy/OpenCV
+path on 100 preloaded 500 x 500 images::
+
+    $ python benchmark.py none rot -g 500 -n 100 -p --compare_batch
+
+
+* Measure how the batch path scales from 1 to 8 worker processes (images are
+shared with the workers through shared memory, not pickled)::
+
+    $ python benchmark.py none rot -g 500 -n 500 -p --scaling_report -w 8
+
+
+* Compare full-frame rotation against rotation computed in cache-sized
+tiles (auto-tuned to this host's L1 and L2) across angles::
+
+    $ python benchmark.py none rot -g 1000 -n 10 -p --tiling_report
+
+
+* Decode and resize a directory of images once, then memory-map the result
+on every later run (the cache is rebuilt automatically if any image
+changes)::
+
+    $ python benchmark.py test_images rot --resize 250 -n 100 -p --dataset_cache .dataset_cache
+
+
+* Stream per-image outputs through a ring of 4 preallocated buffers (or
+a checksum) instead of keeping them all, and compare peak RSS and page
+faults of each sink::
+
+    $ python benchmark.py none rot -g 500 -n 100 -p --no_profile --sink ring
+    $ python benchmark.py none rot -g 500 -n 100 -p --sink_report
+
+
 * For more options::
 
     $ python benchmark.py -h
@@ -34,13 +67,16 @@ To install all necessary prerequisites::
 
 """
 
-import cv2 as cv  # pip install opencv-python
-from albumentations import (HorizontalFlip, VerticalFlip, ShiftScaleRotate, 
-                            RandomRotate90, Flip, OneOf, Compose, Rotate, 
-                            RandomScale, Resize)
+# cv2 (pip install opencv-python), albumentations, cProfile and
+# multiprocessing are imported where they are used, so that runs which do not
+# need them (e.g. `mode == 'none'` on generated images) do not pay for them
+# at startup.  See `check_startup_time.py`.
 import numpy as np
 import os
-import cProfile
+import json
+from time import perf_counter
+
+INTER_LINEAR = 1  # cv.INTER_LINEAR
 
 
 def preload_images_from_directory(image_dir, n_images=None, shuffle=True,
@@ -62,6 +98,7 @@ def preload_images_from_directory(image_dir, n_images=None, shuffle=True,
     -------
     images (generator of numpy arrays)
     """
+    import cv2 as cv
     image_filenames = [os.path.join(image_dir, fn) for fn in os.listdir(image_dir)
                        if os.path.splitext(fn)[-1][1:] in extensions]
 
@@ -95,6 +132,7 @@ def iterate_images_from_directory(image_dir, n_images=None, shuffle=True,
     -------
     images (list of numpy arrays)
     """
+    import cv2 as cv
     image_filenames = [os.path.join(image_dir, fn) for fn in os.listdir(image_dir)
                        if os.path.splitext(fn)[-1][1:] in extensions]
 
@@ -110,38 +148,787 @@ def iterate_images_from_directory(image_dir, n_images=None, shuffle=True,
         yield cv.imread(fn)
 
 
-def get_augmentation_fcn(mode, interpolation_method=cv.INTER_LINEAR):
-    augmentation_dict = {
-        # 'all': Compose([RandomRotate90(p=1.), 
-        #                 Flip(p=1.), 
-        #                 Rotate(p=1., interpolation=interpolation_method), 
-        #                 RandomScale(p=1., interpolation=interpolation_method), 
-        #                 ShiftScaleRotate(p=1., interpolation=interpolation_method)]),
-        # 'any': OneOf([RandomRotate90(p=1.), 
-        #               Flip(p=1.), 
-        #               Rotate(p=1., interpolation=interpolation_method), 
-        #               RandomScale(p=1., interpolation=interpolation_method), 
-        #               ShiftScaleRotate(p=1., interpolation=interpolation_method)]),
-        'no_interpolation_necessary': OneOf([RandomRotate90(p=1.), 
-                                             Flip(p=1.)]),
-        'interpolation_necessary': OneOf([Rotate(p=1., interpolation=interpolation_method), 
-                                          RandomScale(p=1., interpolation=interpolation_method), 
-                                          ShiftScaleRotate(p=1., interpolation=interpolation_method)]),
-        'affine': Compose([ShiftScaleRotate(p=1., interpolation=interpolation_method), 
-                           HorizontalFlip(p=0.5)]),
-        'rot': Rotate(p=1., interpolation=interpolation_method),
-        'rot90': RandomRotate90(p=1.),
-        'flip': Flip(p=1.),
-        'hflip': HorizontalFlip(p=1.),
-        'vflip': VerticalFlip(p=1.),
-        'scale': RandomScale(p=1., interpolation=interpolation_method),
-        'ssr': ShiftScaleRotate(p=1., interpolation=interpolation_method),
-        'none': None
-    }
-    return augmentation_dict[mode]
+def _list_image_files(image_dir, extensions=('jpg', 'jpeg', 'png')):
+    """Returns sorted [filename, mtime (ns), size (bytes)] for each image."""
+    files = []
+    for fn in sorted(os.listdir(image_dir)):
+        if os.path.splitext(fn)[-1][1:] in extensions:
+            st = os.stat(os.path.join(image_dir, fn))
+            files.append([fn, st.st_mtime_ns, st.st_size])
+    return files
+
+
+def dataset_cache_key(image_dir, size, files):
+    """Hash of the resolved path of `image_dir`, `size` and the image files
+    in it (as listed by `_list_image_files`)."""
+    import hashlib
+    record = json.dumps([os.path.realpath(image_dir), size, files])
+    return hashlib.sha1(record.encode()).hexdigest()[:16]
+
+
+def dataset_cache_paths(image_dir, size, cache_dir, key):
+    """Returns the (data, index) filenames of the cache for `image_dir`
+    with key `key` (see `dataset_cache_key`)."""
+    name = '%s_%s_%s' % (os.path.basename(os.path.realpath(image_dir)), size,
+                         key)
+    return (os.path.join(cache_dir, name + '.npy'),
+            os.path.join(cache_dir, name + '.json'))
+
+
+def _remove_stale_caches(image_dir, size, cache_dir, key):
+    """Removes the caches of `image_dir` at `size` with a key other than
+    `key` (left behind when the directory changed)."""
+    import glob
+    prefix = '%s_%s_' % (os.path.basename(os.path.realpath(image_dir)), size)
+    for index_path in glob.glob(os.path.join(glob.escape(cache_dir),
+                                             glob.escape(prefix) + '*.json')):
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            continue
+        if index.get('image_dir') != os.path.realpath(image_dir) or \
+                index.get('size') != size or index.get('key') == key:
+            continue
+        for path in (index_path[:-len('.json')] + '.npy', index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def build_dataset_cache(image_dir, size, cache_dir='.dataset_cache',
+                        extensions=('jpg', 'jpeg', 'png')):
+    """Decodes and resizes every image in `image_dir` into one .npy file.
+
+    Images are resized to `size` x `size` (as `--resize` does) and written
+    one at a time into a memory-mapped (n, size, size, 3) uint8 array, so
+    building the cache never holds the whole dataset in memory.  An index
+    file recording the directory, each image's name, mtime and size, and
+    the key they hash to (see `dataset_cache_key`, also part of the file
+    names) is written last (and atomically), so an interrupted build is
+    never mistaken for a valid cache.  Caches of earlier contents of the
+    directory are removed.
+
+    Returns
+    -------
+    data_path (string)
+        Path to the .npy file.
+    """
+    import cv2 as cv
+    files = _list_image_files(image_dir, extensions)
+    assert len(files) > 0
+    key = dataset_cache_key(image_dir, size, files)
+    data_path, index_path = dataset_cache_paths(image_dir, size, cache_dir,
+                                                key)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    _remove_stale_caches(image_dir, size, cache_dir, key)
+
+    shape = (len(files), size, size, 3)
+    data = np.lib.format.open_memmap(data_path, mode='w+', dtype='uint8',
+                                     shape=shape)
+    for k, (fn, _, _) in enumerate(files):
+        image = cv.imread(os.path.join(image_dir, fn))
+        cv.resize(image, (size, size), dst=data[k],
+                  interpolation=cv.INTER_LINEAR)
+    data.flush()
+    del data
+
+    index = {'image_dir': os.path.realpath(image_dir), 'size': size,
+             'shape': shape, 'files': files, 'key': key}
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump(index, f)
+    os.rename(index_path + '.tmp', index_path)
+    return data_path
+
+
+def load_dataset_cache(image_dir, size, cache_dir='.dataset_cache',
+                       extensions=('jpg', 'jpeg', 'png'), rebuild=True):
+    """Returns a read-only memory map of the cached, resized dataset.
+
+    The cache is (re)built if it does not exist or if any image in
+    `image_dir` was added, removed, or changed (by mtime or size) since it
+    was built.  Caches are keyed by the resolved directory and its files
+    (see `dataset_cache_key`), and the key, directory and files stored in
+    the index are checked on load, so directories with the same name never
+    share a cache.  Slicing the returned array is zero-copy and pages are
+    only read (from the page cache, after the first run) when touched.
+
+    Returns
+    -------
+    images (numpy memmap)
+        uint8 array of shape (n, size, size, 3), in sorted filename order.
+    """
+    files = _list_image_files(image_dir, extensions)
+    key = dataset_cache_key(image_dir, size, files)
+    data_path, index_path = dataset_cache_paths(image_dir, size, cache_dir,
+                                                key)
+    valid = False
+    if os.path.exists(index_path) and os.path.exists(data_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        valid = (index.get('key') == key and
+                 index['image_dir'] == os.path.realpath(image_dir) and
+                 index['size'] == size and index['files'] == files)
+    if not valid:
+        if not rebuild:
+            raise IOError('No valid dataset cache at "%s".' % data_path)
+        data_path = build_dataset_cache(image_dir, size, cache_dir,
+                                        extensions)
+    return np.load(data_path, mmap_mode='r')
+
+
+# Each entry builds one augmentation pipeline given the albumentations module
+# and an interpolation flag, so that only the requested one is constructed.
+augmentation_factories = {
+    # 'all': lambda A, interp: A.Compose([
+    #     A.RandomRotate90(p=1.),
+    #     A.Flip(p=1.),
+    #     A.Rotate(p=1., interpolation=interp),
+    #     A.RandomScale(p=1., interpolation=interp),
+    #     A.ShiftScaleRotate(p=1., interpolation=interp)]),
+    # 'any': lambda A, interp: A.OneOf([
+    #     A.RandomRotate90(p=1.),
+    #     A.Flip(p=1.),
+    #     A.Rotate(p=1., interpolation=interp),
+    #     A.RandomScale(p=1., interpolation=interp),
+    #     A.ShiftScaleRotate(p=1., interpolation=interp)]),
+    'no_interpolation_necessary': lambda A, interp: A.OneOf([
+        A.RandomRotate90(p=1.),
+        A.Flip(p=1.)]),
+    'interpolation_necessary': lambda A, interp: A.OneOf([
+        A.Rotate(p=1., interpolation=interp),
+        A.RandomScale(p=1., interpolation=interp),
+        A.ShiftScaleRotate(p=1., interpolation=interp)]),
+    'affine': lambda A, interp: A.Compose([
+        A.ShiftScaleRotate(p=1., interpolation=interp),
+        A.HorizontalFlip(p=0.5)]),
+    'rot': lambda A, interp: A.Rotate(p=1., interpolation=interp),
+    'rot90': lambda A, interp: A.RandomRotate90(p=1.),
+    'flip': lambda A, interp: A.Flip(p=1.),
+    'hflip': lambda A, interp: A.HorizontalFlip(p=1.),
+    'vflip': lambda A, interp: A.VerticalFlip(p=1.),
+    'scale': lambda A, interp: A.RandomScale(p=1., interpolation=interp),
+    'ssr': lambda A, interp: A.ShiftScaleRotate(p=1., interpolation=interp),
+    'none': None
+}
+
+
+def get_augmentation_fcn(mode, interpolation_method=INTER_LINEAR):
+    """Builds (only) the albumentations pipeline for `mode`.
+
+    albumentations is imported on the first call for a mode other than
+    'none', for which None is returned.
+    """
+    factory = augmentation_factories[mode]
+    if factory is None:
+        return None
+    import albumentations
+    return factory(albumentations, interpolation_method)
+
+
+def random_affine_matrix(image_shape, angle_limit=0, scale_limit=0,
+                         shift_limit=0, hflip=False):
+    """Returns a random 2x3 affine matrix (rotate/scale/shift about center).
+
+    The parameters are drawn the same way albumentations draws them for
+    `Rotate`, `RandomScale` and `ShiftScaleRotate`, so the batch path does
+    comparable work to the per-image path.
+
+    Parameters
+    ----------
+    image_shape (tuple)
+        Shape of the image(s) to be warped, (h, w) or (h, w, c).
+    angle_limit (float)
+        Angle is drawn uniformly from [-angle_limit, angle_limit] degrees.
+    scale_limit (float)
+        Scale is drawn uniformly from [1 - scale_limit, 1 + scale_limit].
+    shift_limit (float)
+        Shifts (as a fraction of width/height) are drawn uniformly from
+        [-shift_limit, shift_limit].
+    hflip (bool)
+        If true, a horizontal flip is composed after the warp.
+
+    Returns
+    -------
+    M (numpy array)
+        A 2x3 matrix suitable for `cv.warpAffine`.
+    """
+    import cv2 as cv
+    h, w = image_shape[:2]
+    angle = np.random.uniform(-angle_limit, angle_limit)
+    scale = np.random.uniform(1 - scale_limit, 1 + scale_limit)
+    dx, dy = np.random.uniform(-shift_limit, shift_limit, size=2)
+
+    M = cv.getRotationMatrix2D((w / 2, h / 2), angle, scale)
+    M[0, 2] += dx * w
+    M[1, 2] += dy * h
+    if hflip:
+        M[0] = -M[0]
+        M[0, 2] += w - 1
+    return M
+
+
+def tile_source_box(M_inv, x0, y0, x1, y1, margin=1):
+    """Bounding box (sx0, sy0, sx1, sy1) of the source pixels read when
+    warping output tile [x0, x1) x [y0, y1), where `M_inv` maps output to
+    source coordinates.  `margin` extra pixels are included on each side
+    (bilinear interpolation also reads the next pixel)."""
+    corners = np.array([[x0, x1 - 1, x0, x1 - 1],
+                        [y0, y0, y1 - 1, y1 - 1],
+                        [1, 1, 1, 1]], dtype='float64')
+    source = np.dot(M_inv, corners)
+    sx0, sy0 = np.floor(source.min(axis=1)).astype(int) - margin
+    sx1, sy1 = np.floor(source.max(axis=1)).astype(int) + 2 + margin
+    return sx0, sy0, sx1, sy1
+
+
+def warp_affine_tiled(image, M, out=None, tile_size=64,
+                      interpolation_method=INTER_LINEAR):
+    """Same as `cv.warpAffine(image, M, ...)` (reflect-101 border), computed
+    one `tile_size` x `tile_size` output tile at a time.
+
+    Each tile only reads its source bounding box (see `tile_source_box`),
+    so for rotations near 90 degrees, where a full-frame warp walks the
+    source column-wise, a tile's source footprint stays cache resident.
+    Tiles whose box crosses the image border are warped from the whole
+    image (so that the border is reflected the same way).  Results may
+    differ from the full-frame warp by one intensity level where OpenCV's
+    fixed-point coordinates round differently.
+    """
+    import cv2 as cv
+    h, w = image.shape[:2]
+    if out is None:
+        out = np.empty_like(image)
+    M_inv = cv.invertAffineTransform(M)
+    flags = interpolation_method | cv.WARP_INVERSE_MAP
+    for y0 in range(0, h, tile_size):
+        y1 = min(y0 + tile_size, h)
+        for x0 in range(0, w, tile_size):
+            x1 = min(x0 + tile_size, w)
+            sx0, sy0, sx1, sy1 = tile_source_box(M_inv, x0, y0, x1, y1)
+            if sx0 >= 0 and sy0 >= 0 and sx1 <= w and sy1 <= h:
+                source, offset = image[sy0:sy1, sx0:sx1], (sx0, sy0)
+            else:
+                source, offset = image, (0, 0)
+            M_tile = M_inv.copy()
+            M_tile[:, 2] += np.dot(M_inv[:, :2], (x0, y0)) - offset
+            cv.warpAffine(source, M_tile, (x1 - x0, y1 - y0),
+                          dst=out[y0:y1, x0:x1], flags=flags,
+                          borderMode=cv.BORDER_REFLECT_101)
+    return out
+
+
+def autotune_tile_size(angle=45, channels=3, level=1, fraction=0.5,
+                       candidates=(8, 16, 32, 64, 128, 256, 512)):
+    """Largest tile size whose output tile plus source footprint (for a
+    rotation by `angle` degrees) fit in `fraction` of this host's level
+    `level` data cache (read from sysfs, see `calibrate.host_cache_geometry`;
+    32 KiB L1 and 256 KiB L2 if unavailable)."""
+    try:
+        from calibrate import host_cache_geometry
+        cache_size = host_cache_geometry()[level][0]
+    except (OSError, KeyError, ImportError):
+        cache_size = {1: 32768, 2: 262144}[level]
+    a = np.radians(angle)
+    spread = abs(np.cos(a)) + abs(np.sin(a))
+    best = candidates[0]
+    for t in candidates:
+        footprint = ((t * spread + 4)**2 + t**2) * channels
+        if footprint <= fraction * cache_size:
+            best = t
+    return best
+
+
+def _batch_warp(images, out, matrices, indices,
+                interpolation_method=INTER_LINEAR, tile_size=None):
+    """Warps `images[i]` by `matrices[j]` into `out[i]` for `i = indices[j]`
+    (tile by tile if `tile_size` is given, see `warp_affine_tiled`)."""
+    import cv2 as cv
+    h, w = images.shape[1:3]
+    for i, M in zip(indices, matrices):
+        if tile_size is not None:
+            warp_affine_tiled(images[i], M, out=out[i], tile_size=tile_size,
+                              interpolation_method=interpolation_method)
+            continue
+        cv.warpAffine(images[i], M, (w, h), dst=out[i],
+                      flags=interpolation_method,
+                      borderMode=cv.BORDER_REFLECT_101)
+    return out
+
+
+def _batch_flip(images, out, d, indices):
+    """Flips `images[indices]` into `out[indices]` as `cv.flip(..., d)` would.
+
+    Vertical flips are done as a single whole-batch NumPy copy (rows are
+    contiguous, so this is a memcpy per row), the others through `cv.flip`
+    into the preallocated output since NumPy's negative-stride copies over
+    3-byte pixels are much slower.
+    """
+    import cv2 as cv
+    if d == 0 and len(indices) == len(images):
+        np.copyto(out, images[:, ::-1])
+        return out
+    for i in indices:
+        cv.flip(images[i], d, dst=out[i])
+    return out
+
+
+def _batch_rot90(images, out, k, indices):
+    """Rotates `images[indices]` counterclockwise by `k` quarter turns."""
+    import cv2 as cv
+    if k % 2 and images.shape[1] != images.shape[2]:
+        raise ValueError('Batch rot90 requires square images.')
+    rotate_codes = {1: cv.ROTATE_90_COUNTERCLOCKWISE, 2: cv.ROTATE_180,
+                    3: cv.ROTATE_90_CLOCKWISE}
+    for i in indices:
+        if k == 0:
+            np.copyto(out[i], images[i])
+        else:
+            cv.rotate(images[i], rotate_codes[k], dst=out[i])
+    return out
+
+
+def _draw_batch_operations(mode, n_images, image_shape):
+    """Returns a list of (operation, parameter) pairs, one per image.
+
+    Operations are one of 'flip', 'rot90', or 'warp'.  For 'flip' and 'rot90'
+    the parameter is the flip code or number of quarter turns, for 'warp' it
+    is an affine matrix.
+    """
+    def draw(op):
+        if op == 'hflip':
+            return 'flip', 1
+        if op == 'vflip':
+            return 'flip', 0
+        if op == 'flip':
+            return 'flip', np.random.randint(-1, 2)
+        if op == 'rot90':
+            return 'rot90', np.random.randint(0, 4)
+        if op == 'rot':
+            return 'warp', random_affine_matrix(image_shape, angle_limit=90)
+        if op == 'scale':
+            return 'warp', random_affine_matrix(image_shape, scale_limit=0.1)
+        if op == 'ssr':
+            return 'warp', random_affine_matrix(image_shape, angle_limit=45,
+                                                scale_limit=0.1,
+                                                shift_limit=0.0625)
+        if op == 'affine':
+            return 'warp', random_affine_matrix(image_shape, angle_limit=45,
+                                                scale_limit=0.1,
+                                                shift_limit=0.0625,
+                                                hflip=np.random.rand() < 0.5)
+        raise ValueError('Batch mode does not support mode "%s".' % op)
+
+    one_of = {'no_interpolation_necessary': ('rot90', 'flip'),
+              'interpolation_necessary': ('rot', 'scale', 'ssr')}
+    if mode in one_of:
+        choices = np.random.randint(0, len(one_of[mode]), size=n_images)
+        return [draw(one_of[mode][c]) for c in choices]
+    return [draw(mode) for _ in range(n_images)]
+
+
+def augment_batch(images, mode, out=None, views=False,
+                  interpolation_method=INTER_LINEAR, tile_size=None):
+    """Augments a whole (n, h, w[, c]) batch of images at once.
+
+    Images sharing the same flip/rot90 parameter are grouped and written into
+    the preallocated output batch (vertical flips as one whole-batch NumPy
+    copy, or as views if `views` is true and the whole batch shares one
+    operation), rotations and other affine transforms are applied per image
+    with `cv.warpAffine` directly into the output batch.
+
+    Note: in batch mode, 'scale' zooms about the image center within a
+    fixed-size frame (so that outputs fit in a single batch array), whereas
+    albumentations' `RandomScale` changes the size of the output image.
+
+    Parameters
+    ----------
+    images (numpy array)
+        A uint8 array of shape (n, h, w) or (n, h, w, c).
+    mode (string)
+        Which set of augmentations to use (see `get_augmentation_fcn`).
+    out (numpy array)
+        Preallocated output batch (same shape and dtype as `images`).
+    views (bool)
+        If true, and `out` is not given, flips/rot90 shared by the whole
+        batch are returned as views of `images` instead of copies.
+    interpolation_method (int)
+        OpenCV interpolation flag used for warps.
+    tile_size (int)
+        If given, warps are computed tile by tile (see `warp_affine_tiled`).
+
+    Returns
+    -------
+    out (numpy array)
+        The augmented batch.
+    """
+    operations = _draw_batch_operations(mode, len(images), images.shape[1:])
+
+    if views and out is None and operations[0][0] != 'warp' and \
+            all(o == operations[0] for o in operations):
+        op, p = operations[0]
+        if op == 'rot90':
+            return np.rot90(images, p, axes=(1, 2))
+        return (images[:, ::-1] if p == 0 else
+                images[:, :, ::-1] if p == 1 else images[:, ::-1, ::-1])
+
+    if out is None:
+        out = np.empty_like(images)
+
+    warp_idx = [i for i, (op, _) in enumerate(operations) if op == 'warp']
+    _batch_warp(images, out, [operations[i][1] for i in warp_idx], warp_idx,
+                interpolation_method=interpolation_method, tile_size=tile_size)
+
+    groups = {}
+    for i, (op, p) in enumerate(operations):
+        if op != 'warp':
+            groups.setdefault((op, p), []).append(i)
+    for (op, p), idx in groups.items():
+        fcn = _batch_flip if op == 'flip' else _batch_rot90
+        fcn(images, out, p, idx)
+    return out
+
+
+SINKS = ('list', 'ring', 'checksum')
+
+# what computes each sink's outputs: the ring's are a different workload
+SINK_PATHS = {'list': 'albumentations', 'ring': 'OpenCV (batch path)',
+              'checksum': 'albumentations'}
+
+
+class RingSink(object):
+    """A ring of `size` preallocated output buffers, reused round-robin, so
+    that memory use does not grow with the number of images augmented.
+
+    A ring is allocated (and its pages faulted in) the first time an
+    output of a given shape and dtype is asked for.
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self.rings = {}
+        self.count = 0
+
+    def next_buffer(self, shape, dtype='uint8'):
+        """Returns the next buffer of this shape and dtype."""
+        key = (tuple(shape), np.dtype(dtype).str)
+        if key not in self.rings:
+            ring = np.empty((self.size,) + key[0], dtype=dtype)
+            ring.fill(0)  # fault in pages once, not per image
+            self.rings[key] = ring
+        buffer = self.rings[key][self.count % self.size]
+        self.count += 1
+        return buffer
+
+    def put(self, image):
+        """Copies `image` (computed elsewhere) into the next buffer."""
+        np.copyto(self.next_buffer(image.shape, image.dtype), image)
+
+
+class ChecksumSink(object):
+    """Folds each output into a running Adler-32 checksum and drops it."""
+
+    def __init__(self):
+        self.checksum = 1
+        self.count = 0
+
+    def put(self, image):
+        import zlib
+        self.checksum = zlib.adler32(np.ascontiguousarray(image),
+                                     self.checksum)
+        self.count += 1
+
+
+def augment_to_sink(images, mode, sink='list', ring_size=4,
+                    interpolation_method=INTER_LINEAR, augment=None):
+    """Augments `images` one at a time, streaming the results into `sink`.
+
+    * 'list' keeps every output (as the per-image benchmark always has),
+    * 'ring' writes each output into a `RingSink` of `ring_size` buffers,
+      computing it with OpenCV directly into the buffer (`dst`), as the
+      batch path does (see `augment_batch`, also for how 'scale' differs
+      from albumentations), so it is not the workload of the other sinks
+      (see `SINK_PATHS`); modes drawing quarter turns need square images,
+    * 'checksum' computes each output with albumentations, folds it into a
+      `ChecksumSink` and drops it.
+
+    `augment` is the albumentations pipeline for `mode` (built here if not
+    given; pass it to keep its construction out of a measurement).
+
+    Returns
+    -------
+    sink (list, RingSink or ChecksumSink)
+        The list of outputs, or the sink they were streamed into.
+    """
+    if sink not in SINKS:
+        raise ValueError('Unknown sink "%s" (expected one of %s).'
+                         '' % (sink, ', '.join(SINKS)))
+    if sink == 'ring':
+        def check(shape):
+            if mode in ('rot90', 'no_interpolation_necessary') and \
+                    shape[0] != shape[1]:
+                raise ValueError('The ring sink rotates by quarter turns into '
+                                 'same-shape buffers; mode "%s" needs square '
+                                 'images (got %sx%s).' % ((mode,) + shape[:2]))
+        if hasattr(images, 'shape'):
+            check(images.shape[1:])
+        elif isinstance(images, (list, tuple)):
+            for image in images:
+                check(image.shape)
+
+        ring = RingSink(ring_size)
+        for image in images:
+            check(image.shape)  # images may be a generator
+            op, p = _draw_batch_operations(mode, 1, image.shape)[0]
+            out = ring.next_buffer(image.shape, image.dtype)
+            if op == 'warp':
+                _batch_warp(image[None], out[None], [p], [0],
+                            interpolation_method=interpolation_method)
+            elif op == 'flip':
+                _batch_flip(image[None], out[None], p, [0])
+            else:
+                _batch_rot90(image[None], out[None], p, [0])
+        return ring
+
+    if augment is None:
+        augment = get_augmentation_fcn(mode, interpolation_method)
+    if sink == 'list':
+        return [augment(**{'image': image})['image'] for image in images]
+    checksum = ChecksumSink()
+    for image in images:
+        checksum.put(augment(**{'image': image})['image'])
+    return checksum
+
+
+def memory_usage():
+    """Returns (peak RSS (KiB), page faults (minor + major)) of this process
+    so far."""
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_maxrss, usage.ru_minflt + usage.ru_majflt
+
+
+def _sink_run(images, mode, sink, ring_size, augment, connection):
+    rss, faults = memory_usage()
+    start = perf_counter()
+    augment_to_sink(images, mode, sink, ring_size, augment=augment)
+    t = perf_counter() - start
+    peak_rss, peak_faults = memory_usage()
+    connection.send((t, peak_rss, peak_rss - rss, peak_faults - faults))
+    connection.close()
+
+
+def sink_report(images, mode, sinks=SINKS, ring_size=4):
+    """Augments `images` into each of `sinks` (see `augment_to_sink`), each
+    in a fresh (forked) process so that peak RSS is not carried over from
+    one sink to the next.
+
+    Returns
+    -------
+    report (list of tuples)
+        (sink, what computes its outputs (see `SINK_PATHS`), seconds,
+        images per second, peak RSS (KiB), peak RSS growth during the run
+        (KiB), page faults during the run) for each sink.
+    """
+    import cv2  # imports are inherited by (not charged to) each run
+    from multiprocessing import get_context
+    augment = (get_augmentation_fcn(mode)
+               if set(sinks) - {'ring'} else None)
+    context = get_context('fork')
+    report = []
+    for sink in sinks:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_sink_run,
+                                  args=(images, mode, sink, ring_size,
+                                        augment, sender))
+        process.start()
+        t, peak_rss, growth, faults = receiver.recv()
+        process.join()
+        report.append((sink, SINK_PATHS[sink], t, len(images) / t, peak_rss,
+                       growth, faults))
+    return report
+
+
+_worker_batches = {}
+
+
+def _init_augmentation_worker(in_name, out_name, shape, dtype, mode):
+    """Attaches a pool worker to the shared input and output batches.
+
+    OpenCV's own thread pool is disabled in workers so the scaling report
+    measures process-level parallelism only.
+    """
+    import cv2 as cv
+    from multiprocessing import shared_memory
+    cv.setNumThreads(1)
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    _worker_batches['shm'] = (in_shm, out_shm)  # keep the mappings alive
+    _worker_batches['in'] = np.ndarray(shape, dtype=dtype, buffer=in_shm.buf)
+    _worker_batches['out'] = np.ndarray(shape, dtype=dtype, buffer=out_shm.buf)
+    _worker_batches['mode'] = mode
+
+
+def _augment_index_range(index_range):
+    """Augments images [start, stop) of the shared batch in place."""
+    start, stop, seed = index_range
+    np.random.seed(seed)
+    augment_batch(_worker_batches['in'][start:stop], _worker_batches['mode'],
+                  out=_worker_batches['out'][start:stop])
+    return stop - start
+
+
+def split_index_ranges(n_images, n_chunks, seed=0):
+    """Splits range(n_images) into `n_chunks` (start, stop, seed) triples."""
+    bounds = np.linspace(0, n_images, min(n_chunks, n_images) + 1).astype(int)
+    return [(int(a), int(b), seed + k)
+            for k, (a, b) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+
+class SharedMemoryAugmenter(object):
+    """A pool of augmentation workers sharing input/output batch buffers.
+
+    The input batch is copied once into a `multiprocessing.shared_memory`
+    block and the output batch is allocated in another, so workers only
+    ever receive (start, stop, seed) index ranges and write their results
+    in place -- no image is pickled between processes.
+
+    Use as a context manager so the shared blocks are always released::
+
+        with SharedMemoryAugmenter(images, 'rot', n_workers=4) as augmenter:
+            augmented_images = augmenter.run()
+    """
+
+    def __init__(self, images, mode, n_workers=None, chunks_per_worker=4):
+        from multiprocessing import Pool, shared_memory
+        images = np.ascontiguousarray(images)
+        self.shape, self.dtype = images.shape, images.dtype
+        self.mode = mode
+        self.n_workers = n_workers or os.cpu_count()
+        self.chunks_per_worker = chunks_per_worker
+
+        self._in_shm = shared_memory.SharedMemory(create=True,
+                                                  size=images.nbytes)
+        self._out_shm = shared_memory.SharedMemory(create=True,
+                                                   size=images.nbytes)
+        self.images = np.ndarray(self.shape, self.dtype, buffer=self._in_shm.buf)
+        self.out = np.ndarray(self.shape, self.dtype, buffer=self._out_shm.buf)
+        self.images[:] = images
+        self.out.fill(0)  # fault in output pages outside the timed region
+
+        self._pool = Pool(self.n_workers, initializer=_init_augmentation_worker,
+                          initargs=(self._in_shm.name, self._out_shm.name,
+                                    self.shape, self.dtype.str, mode))
+
+    def run(self, seed=0):
+        """Augments the whole shared batch and returns the output batch."""
+        ranges = split_index_ranges(self.shape[0],
+                                    self.n_workers * self.chunks_per_worker,
+                                    seed=seed)
+        self._pool.map(_augment_index_range, ranges, chunksize=1)
+        return self.out
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        del self.images, self.out
+        for shm in (self._in_shm, self._out_shm):
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def scaling_report(images, mode, max_workers, repeats=3):
+    """Times the shared-memory worker pool for 1 to `max_workers` workers.
+
+    Returns
+    -------
+    report (list of tuples)
+        (workers, seconds, images per second, speedup, efficiency) for each
+        worker count, where speedup is relative to a single worker and
+        seconds is the best of `repeats` runs.
+    """
+    report = []
+    for n_workers in range(1, max_workers + 1):
+        with SharedMemoryAugmenter(images, mode, n_workers) as augmenter:
+            augmenter.run()  # warm up workers
+            best = float('inf')
+            for _ in range(repeats):
+                start = perf_counter()
+                augmenter.run()
+                best = min(best, perf_counter() - start)
+        speedup = report[0][1] / best if report else 1.
+        report.append((n_workers, best, len(images) / best, speedup,
+                       speedup / n_workers))
+    return report
+
+
+def tiling_report(images, angles, tile_sizes=('L1', 'L2'), repeats=3,
+                  events=('LLC-load-misses',)):
+    """Times full-frame and tiled rotations of `images` by each angle.
+
+    Tile sizes given as 'L1' or 'L2' are auto-tuned for the angle (see
+    `autotune_tile_size`).  Event counts come from `hwcounters.PerfCounters`
+    (None where unavailable).  OpenCV runs on one thread.
+
+    Returns
+    -------
+    report (list of tuples)
+        (angle, tile size (None for full-frame), seconds, Mpx/s, speedup
+        over full-frame, max abs difference from full-frame) followed by the
+        count of each of `events`, for each angle and tile size.  Seconds
+        and counts are of the fastest of `repeats` runs.
+    """
+    import cv2 as cv
+    from hwcounters import PerfCounters
+    counters = PerfCounters(events)
+    h, w = images.shape[1:3]
+    n_pixels = len(images) * h * w
+    reference, out = np.empty_like(images), np.empty_like(images)
+    # one thread: tiles are tuned to one core's caches, and counters would
+    # miss the work of OpenCV's pool threads (see hwcounters.py)
+    threads = cv.getNumThreads()
+    cv.setNumThreads(1)
+    report = []
+    try:
+        for angle in angles:
+            M = cv.getRotationMatrix2D((w / 2, h / 2), angle, 1)
+            full_time = None
+            for tile_size in (None,) + tuple(tile_sizes):
+                if tile_size in ('L1', 'L2'):
+                    tile_size = autotune_tile_size(
+                        angle, images.shape[3] if images.ndim == 4 else 1,
+                        level=int(tile_size[1]))
+                target = reference if tile_size is None else out
+                best, counts = float('inf'), {}
+                for _ in range(repeats):
+                    with counters:
+                        start = perf_counter()
+                        _batch_warp(images, target, [M] * len(images),
+                                    range(len(images)), tile_size=tile_size)
+                        seconds = perf_counter() - start
+                    if seconds < best:
+                        best, counts = seconds, counters.read()
+                if tile_size is None:
+                    full_time = best
+                difference = int(np.abs(target.astype('int16') -
+                                        reference).max())
+                report.append((angle, tile_size, best, n_pixels / best / 1e6,
+                               full_time / best, difference) +
+                              tuple(counts.get(e) for e in events))
+    finally:
+        cv.setNumThreads(threads)
+    counters.close()
+    return report
 
 
 def show_before_and_after(before_image, after_image):
+    import cv2 as cv
     h_diff = after_image.shape[0] - before_image.shape[0]
     if h_diff > 0:  # augmented is taller
         padding = 255 * np.ones((abs(h_diff),) + before_image.shape[1:],
@@ -185,10 +972,61 @@ if __name__ == '__main__':
         help='Resize images (before augmentation) to this x this.')
     parser.add_argument('--debug', default=False, action='store_true',
         help='Run in debug mode.  Note, this will skew profiling results.')
+    parser.add_argument('--dataset_cache', default=None,
+        help='Directory for a decode-once cache of `image_dir` resized to '
+             '`--resize`.  The cache is built (or rebuilt if any image '
+             'changed) on first use and memory-mapped on later runs; `-n` '
+             'images are then taken as a random contiguous (zero-copy) '
+             'slice.')
+    parser.add_argument('--batch', default=False, action='store_true',
+        help='Augment the whole (preloaded) batch at once with NumPy/OpenCV '
+             'instead of per image through albumentations.')
+    parser.add_argument('--compare_batch', default=False, action='store_true',
+        help='Time both the per-image and the batch path and report '
+             'throughput for each.  Requires `--preload`.')
+    parser.add_argument('-w', '--workers', default=None, type=int,
+        help='Augment the (preloaded) batch with this many worker processes '
+             'sharing the input/output batches through shared memory.')
+    parser.add_argument('--scaling_report', default=False, action='store_true',
+        help='Report throughput of the worker pool for 1 to `--workers` '
+             'workers (defaults to all cores).')
+    parser.add_argument('--tile_size', default=None,
+        help='Warp tile by tile in batch mode, with tiles of this size, or '
+             'auto-tuned to the host\'s "L1" or "L2" (for 45 degrees).')
+    parser.add_argument('--tiling_report', default=False, action='store_true',
+        help='Report throughput and LLC misses of full-frame vs. tiled '
+             'rotation (L1- and L2-tuned tiles, and `--tile_size`) for each '
+             'of `--angles`.  Requires `--preload`.')
+    parser.add_argument('--angles', nargs='+', type=float,
+                        default=[0, 15, 30, 45, 60, 75, 90],
+        help='Rotation angles for `--tiling_report`.')
+    parser.add_argument('--sink', default='list', choices=SINKS,
+        help='Where per-image outputs go: a list of every output ("list", '
+             'the default), a ring of `--ring_size` preallocated buffers '
+             'written in place by OpenCV ("ring", with the batch path\'s '
+             'operations rather than albumentations), or a running checksum '
+             '("checksum").  Peak RSS and page faults are reported.')
+    parser.add_argument('--ring_size', default=4, type=int,
+        help='Number of preallocated output buffers for `--sink ring`.')
+    parser.add_argument('--sink_report', default=False, action='store_true',
+        help='Report throughput, peak RSS and page faults of each sink, each '
+             'run in a fresh process.  Requires `--preload`.')
     args = parser.parse_args()
+    if not args.no_profile:
+        import cProfile
 
     # create generator (or preload) images
-    if args.generate_images_of_size is None:  # load images from directory
+    if args.dataset_cache is not None and args.generate_images_of_size is None:
+        if args.resize is None:
+            raise ValueError('`--dataset_cache` requires `--resize`.')
+        images = load_dataset_cache(args.image_dir, args.resize,
+                                    cache_dir=args.dataset_cache)
+        n = len(images) if args.num_images is None else args.num_images
+        assert 0 < n <= len(images)
+        start = np.random.randint(0, len(images) - n + 1)
+        images = images[start:start + n]
+        args.resize = None  # already resized
+    elif args.generate_images_of_size is None:  # load images from directory
         if args.preload:
             if args.no_profile:
                 images = preload_images_from_directory(image_dir=args.image_dir,
@@ -224,8 +1062,9 @@ if __name__ == '__main__':
 
     # resize images (if requested)
     if args.resize is not None:
+        from albumentations import Resize
         resize = Resize(height=args.resize, width=args.resize, p=1.,
-                        interpolation=cv.INTER_LINEAR)
+                        interpolation=INTER_LINEAR)
         if args.preload:
             images = [resize(**{'image': image})['image'] for image in images]
         else:
@@ -239,12 +1078,95 @@ if __name__ == '__main__':
     if args.mode == 'none':
         exit()
 
-    augment = get_augmentation_fcn(args.mode, interpolation_method=cv.INTER_LINEAR)
-    if args.show:
+    parallel = args.workers is not None or args.scaling_report
+    if args.batch or args.compare_batch or parallel or args.tiling_report or \
+            args.sink_report:
+        if not args.preload:
+            raise ValueError('`--batch`, `--compare_batch`, `--workers`, '
+                             '`--scaling_report`, `--tiling_report` and '
+                             '`--sink_report` require `--preload`.')
+        images = np.ascontiguousarray(images)
+
+    tile_size = args.tile_size
+    if tile_size in ('L1', 'L2'):
+        tile_size = autotune_tile_size(
+            channels=images.shape[3] if images.ndim == 4 else 1,
+            level=int(tile_size[1]))
+        print('auto-tuned tile size: %s' % tile_size)
+    elif tile_size is not None:
+        tile_size = int(tile_size)
+
+    if args.tiling_report:
+        tile_sizes = ['L1', 'L2'] + ([tile_size] if tile_size else [])
+        print('angle, tile size, seconds, Mpx/s, speedup, max abs diff, '
+              'LLC-load-misses')
+        for row in tiling_report(images, args.angles, tile_sizes):
+            print(', '.join(str(x) for x in row))
+        exit()
+
+    if args.scaling_report:
+        print('workers, seconds, images/s, speedup, efficiency')
+        for row in scaling_report(images, args.mode,
+                                  args.workers or os.cpu_count()):
+            print('%s, %s, %s, %s, %s' % row)
+        exit()
+    if args.workers is not None:
+        with SharedMemoryAugmenter(images, args.mode, args.workers) as augmenter:
+            start = perf_counter()
+            augmenter.run()
+            t = perf_counter() - start
+        print('%s workers: %s s, %s images/s' % (args.workers, t, len(images) / t))
+        exit()
+
+    if args.sink_report:
+        print('sink, computed by, seconds, images/s, peak RSS (KiB), peak RSS '
+              'growth (KiB), page faults')
+        for row in sink_report(images, args.mode, ring_size=args.ring_size):
+            print('%s, %s, %s, %s, %s, %s, %s' % row)
+        exit()
+
+    # build the albumentations pipeline only where it is used (see
+    # `get_augmentation_fcn`), outside of what is measured
+    augment = None
+    if args.compare_batch or args.show or (not args.batch and
+                                           args.sink != 'ring'):
+        augment = get_augmentation_fcn(args.mode,
+                                       interpolation_method=INTER_LINEAR)
+    if args.compare_batch:
+        n_pixels = images.shape[0] * images.shape[1] * images.shape[2]
+        start = perf_counter()
+        augmented_images = [augment(**{'image': image})['image'] for image in images]
+        per_image_time = perf_counter() - start
+        out = np.zeros_like(images)  # touch pages outside the timed region
+        start = perf_counter()
+        augment_batch(images, args.mode, out=out, tile_size=tile_size)
+        batch_time = perf_counter() - start
+        for name, t in (('per-image', per_image_time), ('batch', batch_time)):
+            print('%s: %s s, %s images/s, %s Mpx/s'
+                  '' % (name, t, len(images) / t, n_pixels / t / 1e6))
+        print('speedup (per-image / batch): %s' % (per_image_time / batch_time))
+    elif args.show:
         for image in images:
             augmented_image = augment(**{'image': image})['image']
             show_before_and_after(image, augmented_image)
-    elif args.no_profile:
-        augmented_images = [augment(**{'image': image})['image'] for image in images]
+    elif args.batch and args.no_profile:
+        augmented_images = augment_batch(images, args.mode,
+                                         tile_size=tile_size)
+    elif args.batch:
+        cProfile.run("augmented_images = augment_batch(images, args.mode, "
+                     "tile_size=tile_size)")
     else:
-        cProfile.run("augmented_images = [augment(**{'image': image})['image'] for image in images]")
+        if args.sink == 'ring':
+            import cv2  # the ring's OpenCV calls import it lazily
+        rss, faults = memory_usage()
+        if args.no_profile:
+            augmented_images = augment_to_sink(images, args.mode, args.sink,
+                                               args.ring_size, augment=augment)
+        else:
+            cProfile.run("augmented_images = augment_to_sink(images, "
+                         "args.mode, args.sink, args.ring_size, "
+                         "augment=augment)")
+        peak_rss, peak_faults = memory_usage()
+        print('%s sink (computed by %s): peak RSS %s KiB (+%s KiB), %s page '
+              'faults' % (args.sink, SINK_PATHS[args.sink], peak_rss,
+                          peak_rss - rss, peak_faults - faults))
@@ -9,21 +9,301 @@ Usage
 
 * See "test_cache.sh" for a bash script example example.
 
+
+* Store the simulated event counts, so that re-pricing them (e.g. with a
+different DRAM multiplier, see reprice.py) does not re-simulate::
+
+    $ python cache.py rot 250 32 8 8 --seed 0 --counts_dir results/counts
+    $ python reprice.py -m 2 -o results/reprice_x2.csv
+
+
+* DRAM priced by row-buffer hits, misses and conflicts (see dram.py)
+instead of by the constant DRAM costs::
+
+    $ python cache.py rot 250 4 8 8 --dram open
+
+
+* Same with tree-PLRU replacement at both levels, or the best any policy
+could do (Belady's OPT, see replacement.py)::
+
+    $ python cache.py rot 250 4 8 8 --l1_policy PLRU --l2_policy PLRU
+    $ python cache.py rot 250 4 8 8 --l1_policy OPT --l2_policy OPT
+
+
+* As many images as it takes (at most 64) to know the time and energy
+per pixel within 2% (95% confidence), with angles stratified in 4::
+
+    $ python cache.py rot 100 64 8 8 --seed 0 --precision 0.02 \
+          --stratify 4 --convergence rot_convergence.csv
+
+
+* Shift-scale-rotate then horizontal flip (benchmark.py's 'affine' mode),
+in one pass, and the traffic and energy fusing saves over two passes::
+
+    $ python cache.py ssr+hflip 100 2 8 8 --seed 0
+    $ python cache.py ssr+hflip 100 2 8 8 --seed 0 --fusion_report
+
+
+* Flip counts in closed form instead of simulated (see analytic.py)::
+
+    $ python cache.py hflip 2000 8 8 8 --analytic
+
+
+* Steady-state costs (first image excluded), and miss rates per row set::
+
+    $ python cache.py rot 250 4 8 8 --warmup_images 1 \
+          --timeline rot_timeline.csv --snapshot_row_sets
+    $ python plot_timeline.py rot_timeline.csv rot_timeline.png
+
 """
 
 from __future__ import division, print_function
-from random import uniform
+from random import uniform, seed as random_seed
 from math import floor, ceil, sin, cos, radians
 from cachesim import CacheSimulator, Cache, MainMemory
 from pprint import pprint
 import os
+import re
+import json
+import socket
+import resource
 from shutil import copyfile
+from time import perf_counter
+from contextlib import contextmanager
+from functools import partial
 
 # defaults
 DRAM_ACCESS_TIME = 52.7802
 DRAM_READ_ENERGY = 25.25
 DRAM_WRITE_ENERGY = 78.6838
 
+# directory of the CACTI binary (e.g. stub_cacti, see bench_simulator.py)
+CACTI_DIR = os.environ.get('CACTI_DIR', 'cacti')
+
+
+class Profile(object):
+    """Wall time and counts per phase of `main` (see `--profile`).
+
+    Pass an instance to `main` (or `simulate_reads`) to have it filled in,
+    then read `report()`.  Phases are timed only a handful of times per
+    call, so the only overhead when profiling is that the access trace is
+    generated in full before being replayed (to time the two separately).
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0) + perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def report(self):
+        """Returns phase times (s), counts, throughput and peak memory."""
+        simulation_time = (self.times.get('trace generation', 0) +
+                           self.times.get('replay', 0))
+        report = {'phase times (s)': dict(self.times),
+                  'counts': dict(self.counts),
+                  'peak RSS (KiB)': resource.getrusage(
+                      resource.RUSAGE_SELF).ru_maxrss}
+        if simulation_time > 0:
+            report['accesses per second'] = (self.counts.get('accesses', 0) /
+                                             simulation_time)
+        if self.counts.get('accesses replayed'):
+            report['trace reduction ratio'] = (self.counts['accesses'] /
+                                               self.counts['accesses replayed'])
+        return report
+
+
+class _NoProfile(object):
+    """Stands in for a `Profile` when profiling is disabled."""
+
+    def phase(self, name):
+        return self
+
+    def count(self, name, n=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_profile = _NoProfile()
+
+
+class Timeline(object):
+    """Per-level counters snapshotted during `simulate_reads`.
+
+    A snapshot is taken after every image, after every row set if
+    `row_sets` is true, and every `every_accesses` accesses (at the end of
+    the pixel reaching them), as well as once `warmup_accesses` accesses
+    are reached.  Snapshots hold cumulative counters; use `intervals()` for
+    the events between consecutive snapshots.
+    """
+
+    LEVEL_COUNTERS = ('LOAD_count', 'STORE_count', 'HIT_count', 'MISS_count',
+                      'EVICT_count')
+
+    def __init__(self, every_accesses=None, row_sets=False, warmup_accesses=0):
+        self.every_accesses = every_accesses
+        self.row_sets = row_sets
+        self.warmup_accesses = warmup_accesses
+        self.columns = None
+        self.snapshots = []
+
+    def snapshot(self, cache, image, row_set, pixels, accesses, credit=None):
+        stats = [level.stats() for level in cache.levels()]
+        for name, n in (credit or {}).items():
+            stats[0][name] += n
+        if self.columns is None:
+            self.columns = (['image', 'row_set', 'pixels', 'accesses'] +
+                            ['%s_%s' % (s['name'], c) for s in stats
+                             for c in self.LEVEL_COUNTERS])
+        self.snapshots.append([image, row_set, pixels, accesses] +
+                              [s[c] for s in stats for c in self.LEVEL_COUNTERS])
+
+    def __getitem__(self, k):
+        return dict(zip(self.columns, self.snapshots[k]))
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def intervals(self):
+        """Returns the events of each interval (list of dicts), with the
+        image and row set it ended in and the miss rate of each level."""
+        intervals = []
+        previous = [0] * len(self.columns)
+        for snapshot in self.snapshots:
+            interval = dict(zip(self.columns[:4], snapshot[:4]))
+            interval.update(zip(self.columns[4:],
+                                [s - p for s, p in zip(snapshot[4:],
+                                                       previous[4:])]))
+            for column in self.columns:
+                if (column.endswith('_MISS_count') and
+                        not column.startswith('MEM_')):
+                    level = column[:-len('_MISS_count')]
+                    lookups = (interval[level + '_HIT_count'] +
+                               interval[level + '_MISS_count'])
+                    interval[level + '_miss_rate'] = (
+                        interval[column] / lookups if lookups else None)
+            intervals.append(interval)
+            previous = snapshot
+        return intervals
+
+    def to_csv(self, filename):
+        """Writes `intervals()` to `filename`."""
+        import csv
+        intervals = self.intervals()
+        with open(filename, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=list(intervals[0]))
+            writer.writeheader()
+            writer.writerows(intervals)
+
+
+def _t_quantile(confidence, dof):
+    """Two-sided Student t critical value (normal if scipy is missing)."""
+    try:
+        from scipy.stats import t
+        return t.ppf((1 + confidence) / 2, dof)
+    except ImportError:
+        from statistics import NormalDist
+        return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+class Convergence(object):
+    """Running mean and confidence interval of the time and energy per
+    pixel of images simulated one at a time (see `main`'s `precision`).
+
+    Angles (in degrees) are drawn from [-90, 90] by `next_angle`, seeded
+    with `seed` (the same angles as a batch with this seed), or, with
+    `strata`, from each of that many equal slices of [-90, 90] in turn.
+    A sample is an image, or, with `strata`, the mean of a round of
+    `strata` images (so the interval only narrows after whole rounds).
+    The estimate has converged once both intervals are within `precision`
+    (relative to the mean) and there are at least `min_samples` samples.
+    """
+
+    columns = ('image', 'angle', 'time per pixel (ns)',
+               'energy per pixel (nJ)', 'mean time', 'time half-width',
+               'mean energy', 'energy half-width')
+
+    def __init__(self, precision, confidence=0.95, strata=None, seed=None,
+                 min_samples=2):
+        import random
+        self.precision = precision
+        self.confidence = confidence
+        self.strata = strata
+        self.min_samples = min_samples
+        self.rng = random.Random(seed)
+        self.rows = []
+        self.samples = []
+        self._round = []
+
+    @property
+    def n_images(self):
+        return len(self.rows)
+
+    def next_angle(self):
+        if not self.strata:
+            return self.rng.uniform(-90, 90)
+        width = 180 / self.strata
+        low = -90 + width * (len(self.rows) % self.strata)
+        return self.rng.uniform(low, low + width)
+
+    def add(self, angle, time_per_pixel, energy_per_pixel):
+        """Records an image and returns `interval()`."""
+        self._round.append((time_per_pixel, energy_per_pixel))
+        if len(self._round) == (self.strata or 1):
+            self.samples.append(tuple(sum(x) / len(self._round)
+                                      for x in zip(*self._round)))
+            self._round = []
+        interval = self.interval()
+        self.rows.append((len(self.rows), angle, time_per_pixel,
+                          energy_per_pixel) + interval)
+        return interval
+
+    def interval(self):
+        """Returns (mean time, time half-width, mean energy, energy
+        half-width) per pixel (half-widths are None below two samples)."""
+        n = len(self.samples)
+        if not n:
+            return None, None, None, None
+        result = ()
+        for values in zip(*self.samples):
+            mean = sum(values) / n
+            half_width = None
+            if n > 1:
+                variance = sum((v - mean)**2 for v in values) / (n - 1)
+                half_width = (_t_quantile(self.confidence, n - 1) *
+                              (variance / n)**0.5)
+            result += (mean, half_width)
+        return result
+
+    def converged(self):
+        if len(self.samples) < max(self.min_samples, 2) or self._round:
+            return False
+        time, time_hw, energy, energy_hw = self.interval()
+        return (time_hw <= self.precision * abs(time) and
+                energy_hw <= self.precision * abs(energy))
+
+    def to_csv(self, filename):
+        """Writes a row per image (with the interval after it)."""
+        import csv
+        with open(filename, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.columns)
+            writer.writerows(self.rows)
+
 
 def pixel_address(x, y, w, offset=0, pixel_size=3):
     idx = x + y*w
@@ -38,12 +318,19 @@ def reflect_101(x, dimension_length):
     return x
 
 
-def simulate_reads(transform_generator, image_dimensions, n_images, cache,
-                   parallelism=1, address_lookup=pixel_address,
-                   border_fcn=reflect_101, store_to_cache=False):
+def iterate_accesses(transform_generator, image_dimensions, n_images,
+                     parallelism=1, address_lookup=pixel_address,
+                     border_fcn=reflect_101, store_to_cache=False,
+                     counter=None):
+    """Yields the (load addresses, store addresses) of each output pixel.
+
+    This is the trace `simulate_reads` replays, in the format accepted by
+    `CacheSimulator.loadstore` (store addresses are None if
+    `store_to_cache` is false).  If `counter` (a list) is given, the number
+    of accesses generated is added to `counter[0]` after each image.
+    """
     w, h = image_dimensions
 
-    record = []
     for k in range(n_images):
         write_offset = w*h*3*(k + n_images)
         read_offset = w*h*3*k
@@ -61,22 +348,252 @@ def simulate_reads(transform_generator, image_dimensions, n_images, cache,
                                           border_fcn(x2, w), border_fcn(y2, h))
 
                         # is the order of these loads always optimal?
-                        cache.load(address_lookup(x1, y1, w, read_offset), 3)
-                        cache.load(address_lookup(x2, y1, w, read_offset), 3)
-                        cache.load(address_lookup(x1, y2, w, read_offset), 3)
-                        cache.load(address_lookup(x2, y2, w, read_offset), 3)
-                        record += [(x1, y1), (x2, y1), (x1, y2), (x2, y2)]
+                        loads = (address_lookup(x1, y1, w, read_offset),
+                                 address_lookup(x2, y1, w, read_offset),
+                                 address_lookup(x1, y2, w, read_offset),
+                                 address_lookup(x2, y2, w, read_offset))
                     else:
                         x, y = border_fcn(x, w), border_fcn(y, h)
-                        cache.load(address_lookup(x, y, w, write_offset), 3)
-                        record = [(x, y)]
+                        loads = (address_lookup(x, y, w, write_offset),)
                     if store_to_cache:
-                        cache.store(address_lookup(x, y, w, write_offset), 3)
+                        yield loads, (address_lookup(x, y, w, write_offset),)
+                    else:
+                        yield loads, None
+        if counter is not None:
+            counter[0] += (int(ceil(h/parallelism)) * parallelism * w *
+                           ((4 if interp_nec else 1) + store_to_cache))
+
+
+def iterate_pipeline_accesses(transform_generators, image_dimensions,
+                              n_images, fused=True, parallelism=1,
+                              address_lookup=pixel_address,
+                              border_fcn=reflect_101):
+    """Yields the (load addresses, store addresses) of each output pixel of
+    a pipeline of kernels, stage i transforming the output of stage i - 1.
+
+    Buffer b (0 for the source images, i for the output of stage i) holds
+    its `n_images` images at b times the size of a batch.  Unfused, each
+    stage is a pass from its input buffer to its output buffer, so the
+    intermediate images go through memory.  Fused, the stages' coordinate
+    maps are composed into one gather pass from the source images to the
+    last buffer (interpolating once, and handling the border at the
+    source, as a fused kernel would).  Stores are always included.
+    """
+    w, h = image_dimensions
+    batch_size = w*h*3*n_images
+    n_stages = len(transform_generators)
+
+    def composition(transforms):
+        def transform(x, y):
+            # the last stage's map gives coordinates in its input, etc.
+            for t in reversed(transforms):
+                x, y = t(x, y)
+            return x, y
+        return transform
+
+    for k in range(n_images):
+        stages = [generator(image_dimensions)
+                  for generator in transform_generators]
+        if fused:
+            passes = [(any(interp_nec for interp_nec, _ in stages),
+                       composition([t for _, t in stages]), 0, n_stages)]
+        else:
+            passes = [(interp_nec, transform, i, i + 1)
+                      for i, (interp_nec, transform) in enumerate(stages)]
+        for interp_nec, transform, source, destination in passes:
+            read_offset = batch_size*source + w*h*3*k
+            write_offset = batch_size*destination + w*h*3*k
+            for row_set in range(int(ceil(h/parallelism))):
+                for x_prime in range(w):
+                    for row in range(parallelism):
+                        y_prime = row_set * parallelism + row
+
+                        x, y = transform(x_prime, y_prime)
+                        if interp_nec:
+                            x1, x2 = floor(x), ceil(x)
+                            y1, y2 = floor(y), ceil(y)
+                            x1, y1, x2, y2 = (border_fcn(x1, w),
+                                              border_fcn(y1, h),
+                                              border_fcn(x2, w),
+                                              border_fcn(y2, h))
+                            loads = (address_lookup(x1, y1, w, read_offset),
+                                     address_lookup(x2, y1, w, read_offset),
+                                     address_lookup(x1, y2, w, read_offset),
+                                     address_lookup(x2, y2, w, read_offset))
+                        else:
+                            x, y = border_fcn(x, w), border_fcn(y, h)
+                            loads = (address_lookup(x, y, w, read_offset),)
+                        yield loads, (address_lookup(x_prime, y_prime, w,
+                                                     write_offset),)
+
+
+def coalesce_accesses(accesses, credit, cl_size=64, length=3):
+    """Drops the accesses of a trace (see `iterate_accesses`) which cannot
+    change the state of the first cache level.
+
+    Consecutive accesses within the same cache line form a run.  Within a
+    run, only the first load and the first store are replayed: a repeated
+    load is a hit on the set's most recently used line (stores to it hit
+    and don't update LRU state), and a repeated store is a hit on a line
+    which is already dirty.  Neither changes what the cache contains, in
+    which order, or what it will write back.  Only their statistics are
+    lost, and they are added to `credit` (a dict of first-level `stats()`
+    entries) instead, once the trace is consumed.
+
+    Accesses spanning two lines always end a run (in a small cache, loading
+    the second line can evict the first).
+
+    This pays off only if replaying an access costs more than filtering
+    it: pycachesim replays in C (a few percent of the time of generating
+    the trace), so coalescing slows it down (250x250 images: 0.66x for
+    rot, 0.65x for hflip), while the pure-Python `cache_model` speeds up
+    (1.3x to 2x), see trace_reduction.py.
+    """
+    run_line = None
+    loaded = stored = False
+    loads_dropped = stores_dropped = 0
+    for loads, stores in accesses:
+        kept_loads = []
+        for addr in loads:
+            line = addr // cl_size
+            if line != (addr + length - 1) // cl_size:
+                run_line = None
+            elif line != run_line:
+                run_line, stored = line, False
+            elif loaded:
+                loads_dropped += 1
+                continue
+            loaded = True
+            kept_loads.append(addr)
+        kept_stores = None
+        if stores is not None:
+            kept_stores = []
+            for addr in stores:
+                line = addr // cl_size
+                if line != (addr + length - 1) // cl_size:
+                    run_line = None
+                elif line != run_line:
+                    run_line, loaded = line, False
+                elif stored:
+                    stores_dropped += 1
+                    continue
+                stored = True
+                kept_stores.append(addr)
+        if kept_loads or kept_stores:
+            yield kept_loads, kept_stores
+
+    for name, n in (('LOAD_count', loads_dropped),
+                    ('LOAD_byte', loads_dropped * length),
+                    ('HIT_count', loads_dropped),
+                    ('HIT_byte', loads_dropped * min(cl_size, length)),
+                    ('STORE_count', stores_dropped),
+                    ('STORE_byte', stores_dropped * length)):
+        credit[name] = credit.get(name, 0) + n
+
+
+def _replay_with_snapshots(accesses, cache, timeline, pixels_per_row_set,
+                           pixels_per_image, credit=None):
+    """Replays `accesses` in chunks, taking a snapshot (see `Timeline`)
+    after each."""
+    every = timeline.every_accesses
+    next_snapshot = every
+    warmup = timeline.warmup_accesses
+    chunk = []
+    n_accesses = 0
+    for pixel, (loads, stores) in enumerate(accesses, 1):
+        chunk.append((loads, stores))
+        n_accesses += len(loads) + (len(stores) if stores is not None else 0)
+        image_done = pixel % pixels_per_image == 0
+        if not (image_done or
+                (timeline.row_sets and pixel % pixels_per_row_set == 0) or
+                (every and n_accesses >= next_snapshot) or
+                (warmup and n_accesses >= warmup)):
+            continue
+        if credit is not None:
+            chunk = coalesce_accesses(chunk, credit,
+                                      cl_size=cache.first_level.cl_size)
+        cache.loadstore(chunk, length=3)
+        chunk = []
+        timeline.snapshot(cache, image=(pixel - 1) // pixels_per_image,
+                          row_set=((pixel - 1) % pixels_per_image) //
+                          pixels_per_row_set,
+                          pixels=pixel, accesses=n_accesses, credit=credit)
+        while every and next_snapshot <= n_accesses:
+            next_snapshot += every
+        if warmup and n_accesses >= warmup:
+            warmup = 0
+
+
+def simulate_reads(transform_generator, image_dimensions, n_images, cache,
+                   parallelism=1, address_lookup=pixel_address,
+                   border_fcn=reflect_101, store_to_cache=False,
+                   profile=None, credit=None, timeline=None):
+    """Replays the trace of `iterate_accesses` through `cache`.
+
+    Returns the cache and the number of accesses simulated.  If `profile` (a
+    `Profile`) is given, the trace is first generated in full and then
+    replayed, so that the two phases can be timed separately.
+
+    If `credit` (a dict) is given, accesses which are guaranteed first-level
+    hits are not replayed (see `coalesce_accesses`); their statistics are
+    added to `credit`, and must be added to the first level's `stats()`.
+
+    If `timeline` (a `Timeline`) is given, the trace is replayed in chunks
+    and counters are snapshotted after each (first-level snapshots include
+    credits so far).
+    """
+    counter = [0]
+    accesses = iterate_accesses(transform_generator, image_dimensions,
+                                n_images, parallelism=parallelism,
+                                address_lookup=address_lookup,
+                                border_fcn=border_fcn,
+                                store_to_cache=store_to_cache, counter=counter)
+    if timeline is not None:
+        w, h = image_dimensions
+        with (profile or _no_profile).phase('replay'):
+            _replay_with_snapshots(accesses, cache, timeline,
+                                   pixels_per_row_set=w * parallelism,
+                                   pixels_per_image=(int(ceil(h/parallelism)) *
+                                                     parallelism * w),
+                                   credit=credit)
+        (profile or _no_profile).count('accesses', counter[0])
+        return cache, counter[0]
+    if credit is not None:
+        accesses = coalesce_accesses(accesses, credit,
+                                     cl_size=cache.first_level.cl_size)
+    if profile is None:
+        cache.loadstore(accesses, length=3)
+    else:
+        with profile.phase('trace generation'):
+            accesses = list(accesses)
+        with profile.phase('replay'):
+            cache.loadstore(accesses, length=3)
+        profile.count('accesses', counter[0])
+        if credit is not None:
+            profile.count('accesses replayed',
+                          sum(len(loads) + len(stores or ())
+                              for loads, stores in accesses))
+    return cache, counter[0]
 
-    return cache, record
 
+def create_cache(l1_ways, l1_block_size, l1_size, l2_ways, l2_block_size, l2_size,
+                 l1_policy='LRU', l2_policy='LRU', seed=None):
+    """Returns a pycachesim two-level hierarchy.
 
-def create_cache(l1_ways, l1_block_size, l1_size, l2_ways, l2_block_size, l2_size):
+    Levels use LRU replacement unless `l1_policy` or `l2_policy` say
+    otherwise.  pycachesim implements 'LRU' and 'FIFO'; with any other of
+    `replacement.POLICIES` (seeded with `seed`), the pure-Python model of
+    `cache_model.py` is returned instead.  'OPT' needs the whole trace in
+    advance, see `cache_model.simulate_policies`.
+    """
+    if l1_policy not in ('LRU', 'FIFO') or l2_policy not in ('LRU', 'FIFO'):
+        if 'OPT' in (l1_policy, l2_policy):
+            raise ValueError('OPT needs the whole trace, use '
+                             'cache_model.simulate_policies.')
+        from cache_model import create_hierarchy
+        return create_hierarchy(l1_ways, l1_block_size, l1_size, l2_ways,
+                                l2_block_size, l2_size, l1_policy=l1_policy,
+                                l2_policy=l2_policy, seed=seed)
 
     if l1_ways == 0:
         l1_sets = 1
@@ -90,19 +607,23 @@ def create_cache(l1_ways, l1_block_size, l1_size, l2_ways, l2_block_size, l2_siz
     else:
         l2_sets = l2_size // (l2_block_size * l2_ways)
 
-    l2 = Cache("L2", l2_sets, l2_ways, l2_block_size, replacement_policy="LRU")
-    l1 = Cache("L1", l1_sets, l1_ways, l1_block_size, replacement_policy="LRU",
-               store_to=l2, load_from=l2)
+    l2 = Cache("L2", l2_sets, l2_ways, l2_block_size,
+               replacement_policy=l2_policy)
+    l1 = Cache("L1", l1_sets, l1_ways, l1_block_size,
+               replacement_policy=l1_policy, store_to=l2, load_from=l2)
     mem = MainMemory()
     mem.load_to(l2)
     mem.store_from(l2)
     return CacheSimulator(l1, mem)
 
 
-def rotation_generator_101(image_dimensions):
-    """Uses border mode = cv2.BORDER_REFLECT_101, gfedcb|abcdefgh|gfedcba"""
+def rotation_generator_101(image_dimensions, angle=None):
+    """Uses border mode = cv2.BORDER_REFLECT_101, gfedcb|abcdefgh|gfedcba
+
+    The angle (in degrees) is drawn uniformly from [-90, 90] unless given.
+    """
     w, h = image_dimensions
-    theta = radians(uniform(-90, 90))
+    theta = radians(uniform(-90, 90) if angle is None else angle)
     r = [[cos(theta), sin(theta)],
          [-sin(theta), cos(theta)]]
     interp_nec = True
@@ -115,6 +636,25 @@ def rotation_generator_101(image_dimensions):
     return interp_nec, transform
 
 
+def ssr_generator_101(image_dimensions):
+    """Shift, scale and rotation about the center, drawn as benchmark.py's
+    'ssr' mode draws them (angle in [-45, 45] degrees, scale in [0.9, 1.1],
+    shifts of up to 6.25% of the width and height).  Same border mode as
+    `rotation_generator_101`."""
+    w, h = image_dimensions
+    theta = radians(uniform(-45, 45))
+    scale = uniform(0.9, 1.1)
+    dx, dy = uniform(-0.0625, 0.0625) * w, uniform(-0.0625, 0.0625) * h
+    a, b = cos(theta) / scale, sin(theta) / scale
+    interp_nec = True
+
+    def transform(x, y):
+        x, y = x - w/2 - dx, y - h/2 - dy
+        return [a*x + b*y + w/2, -b*x + a*y + h/2]
+
+    return interp_nec, transform
+
+
 def hflip_generator(image_dimensions):
     w, h = image_dimensions
     interp_nec = False
@@ -136,7 +676,7 @@ def vflip_generator(image_dimensions):
 
 
 def create_cacti_cfg(ways, block_size, size, cfg_template='cache_template.cfg',
-                     filename='tmp_cache.cfg'):
+                     filename='tmp_cache.cfg', technology=None):
     copyfile(cfg_template, filename)
     with open(cfg_template) as template:
         cfg = template.read()
@@ -144,6 +684,9 @@ def create_cacti_cfg(ways, block_size, size, cfg_template='cache_template.cfg',
     cfg = cfg.replace('##SIZE', '-size (bytes) %s' % size)
     cfg = cfg.replace('##BLOCK_SIZE', '-block size (bytes) %s' % block_size)
     cfg = cfg.replace('##WAYS', '-associativity %s' % ways)
+    if technology is not None:
+        cfg = re.sub(r'^-technology \(u\) .*$', '-technology (u) %s' % technology,
+                     cfg, flags=re.MULTILINE)
 
     with open(filename, 'w+') as out:
         out.write(cfg)
@@ -182,69 +725,377 @@ def parse_cacti_output(cacti_output, endline='\n'):
     return access_time, read_energy_per_access, write_energy_per_access
 
 
-def get_cactus_results(ways, block_size, size):
-    tmp_cfg = 'tmp_cache.cfg'
-    create_cacti_cfg(ways, block_size, size, filename=tmp_cfg)
-    cacti_output = os.popen('cd cacti; ./cacti -infile ../%s; cd ..' % tmp_cfg).read()
-    return parse_cacti_output(cacti_output)
+_cacti_outputs = {}
+
+
+def run_cacti(ways, block_size, size, profile=None, technology=None):
+    """Returns CACTI's output for this configuration.
+
+    `technology` is the technology node in microns (defaults to the one in
+    cache_template.cfg).  Outputs are memoized, so CACTI runs only once per
+    configuration per process.  CACTI runs from `CACTI_DIR` (set with the
+    CACTI_DIR environment variable).
+    """
+    key = (ways, block_size, size, technology)
+    if key in _cacti_outputs:
+        if profile is not None:
+            profile.count('cacti cache hits')
+        return _cacti_outputs[key]
+    if profile is not None:
+        profile.count('cacti calls')
+    # unique per process, so that concurrent runs (see workqueue.py) sharing a
+    # working directory don't overwrite each other's configurations
+    tmp_cfg = 'tmp_cache_%s_%s.cfg' % (socket.gethostname(), os.getpid())
+    create_cacti_cfg(ways, block_size, size, filename=tmp_cfg,
+                     technology=technology)
+    cacti_output = os.popen('cd "%s"; ./cacti -infile "%s"'
+                            '' % (CACTI_DIR, os.path.abspath(tmp_cfg))).read()
+    os.remove(tmp_cfg)
+    _cacti_outputs[key] = cacti_output
+    return cacti_output
+
+
+def get_cactus_results(ways, block_size, size, profile=None, technology=None):
+    return parse_cacti_output(run_cacti(ways, block_size, size, profile,
+                                        technology))
+
+
+def parse_cacti_area(cacti_output, endline='\n'):
+    """Returns the cache area (mm^2) reported by CACTI."""
+    s0 = "Cache height x width (mm):"
+    for line in cacti_output.split(endline):
+        if s0 in line:
+            height, width = line.split(':')[1].split('x')
+            return float(height) * float(width)
+    raise ValueError("CACTI output contains no '%s' line." % s0)
+
+
+def get_cacti_area(ways, block_size, size, profile=None, technology=None):
+    return parse_cacti_area(run_cacti(ways, block_size, size, profile,
+                                      technology))
 
 
 generator_dict = {'rot': rotation_generator_101,
+                  'ssr': ssr_generator_101,
                   'vflip': vflip_generator,
                   'hflip': hflip_generator}
+RANDOM_KERNELS = ('rot', 'ssr')  # kernels drawing random parameters
 
 
-def main(kernel, image_size, n_images, l1_ways, l2_ways, parallelism=1,
-         l1_block_size=64, l2_block_size=64, l1_size=32768, l2_size=2097152,
-         dram_access_time=DRAM_ACCESS_TIME, dram_read_energy_per_access=DRAM_READ_ENERGY,
-         dram_write_energy_per_access=DRAM_WRITE_ENERGY, dram_multiplier=1,
-         store_to_cache=False, verbose=True):
+def is_random(kernel):
+    """Whether `kernel` (or a stage of a pipeline) draws random
+    parameters, so that its counts depend on the seed."""
+    return any(name in RANDOM_KERNELS for name in kernel.split('+'))
+
+
+def pipeline_generators(kernel):
+    """Returns the generators of a pipeline ('ssr+hflip' is ssr then
+    hflip), or None if `kernel` is a single kernel."""
+    if '+' not in kernel:
+        return None
+    return [generator_dict[name] for name in kernel.split('+')]
+
+
+def simulate_counts(kernel, image_size, n_images, l1_ways, l2_ways,
+                    parallelism=1, l1_block_size=64, l2_block_size=64,
+                    l1_size=32768, l2_size=2097152, store_to_cache=False,
+                    seed=None, profile=None, coalesce=False,
+                    warmup_images=0, warmup_accesses=0, timeline=None,
+                    dram=None, dram_config=None, l1_policy='LRU',
+                    l2_policy='LRU', transform_generator=None, fused=True,
+                    flush=False):
+    """Simulates a workload and returns its raw event counts per level.
+
+    If `seed` is given, the random module is seeded with it first (so that
+    'rot' draws the same angles every time).  If `coalesce` is true,
+    repeated accesses to a line are not replayed but credited (see
+    `coalesce_accesses`), which gives the same counts (only faster with
+    the pure-Python model of cache_model.py, see trace_reduction.py).
+
+    Events of the first `warmup_images` images, or of the first
+    `warmup_accesses` accesses (up to the end of the pixel reaching them),
+    are excluded, so that counts reflect the steady state.  Pass a
+    `Timeline` as `timeline` to also get counters over time.
+
+    If `dram` (a page policy, 'open' or 'closed') is given, the workload is
+    simulated with `cache_model` instead of pycachesim, and the lines read
+    from and written back to DRAM are classified by row-buffer outcome
+    (see `dram.DRAMModel`, configured by `dram_config`).
+
+    `l1_policy` and `l2_policy` are replacement policies (see
+    `create_cache`).  With 'OPT', the trace is generated in full first (see
+    `cache_model.simulate_policies`), and neither `coalesce` nor warm-up
+    nor `timeline` are supported.
+
+    `transform_generator` replaces the kernel's (`generator_dict[kernel]`),
+    e.g. to rotate by a given angle (see `main`'s `precision`).
+
+    `kernel` can be a pipeline of kernels ('ssr+hflip'), simulated in one
+    pass if `fused`, otherwise in a pass per kernel (see
+    `iterate_pipeline_accesses`; stores are then always simulated, and
+    neither `coalesce`, warm-up, `timeline` nor 'OPT' are supported).
+
+    If `flush`, the lines still dirty at the end are written back (and
+    counted) before the counts are read, so that they include every write
+    of the workload ('OPT' does not support this).
+
+    Returns
+    -------
+    counts (dict)
+        Maps 'L1' and 'L2' to their 'loads', 'stores', 'hits', 'misses' and
+        'writebacks', and 'DRAM' to its 'loads' and 'stores' (and, with
+        `dram`, the events of `dram.DRAMModel.counts`).  With warm-up,
+        'pixels' is the number of pixels the counts are for.
+    """
+    if profile is None:
+        profile = _no_profile
+    if seed is not None:
+        random_seed(seed)
+    pipeline = pipeline_generators(kernel)
+    if pipeline is not None:
+        if (coalesce or timeline is not None or warmup_images or
+                warmup_accesses or 'OPT' in (l1_policy, l2_policy)):
+            raise ValueError('Pipelines support neither coalescing, warm-up, '
+                             'timelines nor OPT.')
+    elif transform_generator is None:
+        transform_generator = generator_dict[kernel]
+    credit = {} if coalesce else None
+    if timeline is None and (warmup_images or warmup_accesses):
+        timeline = Timeline()
+    if timeline is not None:
+        timeline.warmup_accesses = warmup_accesses
+
+    dram_model = None
+    if dram is not None:
+        if warmup_images or warmup_accesses:
+            raise ValueError('The DRAM model does not support warm-up.')
+        from dram import DRAMModel
+        from cache_model import create_hierarchy
+        dram_model = DRAMModel(dram_config, page_policy=dram,
+                               line_size=l2_block_size)
 
+    geometry = dict(l1_ways=l1_ways,
+                    l1_block_size=l1_block_size,
+                    l1_size=l1_size,
+                    l2_ways=l2_ways,
+                    l2_block_size=l2_block_size,
+                    l2_size=l2_size)
+    if 'OPT' in (l1_policy, l2_policy):
+        if coalesce or timeline is not None or flush:
+            raise ValueError('OPT does not support coalescing, warm-up, '
+                             'timelines or flushing.')
+        from cache_model import simulate_policies
+        with profile.phase('trace generation'):
+            trace = list(iterate_accesses(transform_generator,
+                                          (image_size,) * 2, n_images,
+                                          parallelism=parallelism,
+                                          store_to_cache=store_to_cache))
+        with profile.phase('replay'):
+            stats = simulate_policies(trace, l1_policy=l1_policy,
+                                      l2_policy=l2_policy, seed=seed,
+                                      memory_observer=dram_model, **geometry)
+        l1, l2, dram = stats[:3]
+    else:
+        with profile.phase('create cache'):
+            if dram_model is None:
+                cs = create_cache(l1_policy=l1_policy, l2_policy=l2_policy,
+                                  seed=seed, **geometry)
+            else:
+                cs = create_hierarchy(memory_observer=dram_model,
+                                      l1_policy=l1_policy,
+                                      l2_policy=l2_policy, seed=seed,
+                                      **geometry)
+
+        if pipeline is not None:
+            with profile.phase('replay'):
+                cs.loadstore(iterate_pipeline_accesses(
+                    pipeline, (image_size,) * 2, n_images, fused=fused,
+                    parallelism=parallelism), length=3)
+        else:
+            cs, accesses = simulate_reads(
+                transform_generator=transform_generator,
+                image_dimensions=(image_size,) * 2,
+                n_images=n_images,
+                cache=cs,
+                parallelism=parallelism,
+                address_lookup=pixel_address,
+                border_fcn=reflect_101,
+                store_to_cache=store_to_cache,
+                profile=None if profile is _no_profile else profile,
+                credit=credit,
+                timeline=timeline)
+
+        if flush:
+            cs.force_write_back()
+        l1, l2, dram = [level.stats() for level in list(cs.levels())[:3]]
+    for name, n in (credit or {}).items():
+        l1[name] += n
+    counts = {name: {'loads': s['LOAD_count'], 'stores': s['STORE_count'],
+                     'hits': s['HIT_count'], 'misses': s['MISS_count'],
+                     'writebacks': s['EVICT_count']}
+              for name, s in (('L1', l1), ('L2', l2))}
+    counts['DRAM'] = {'loads': dram['LOAD_count'],
+                      'stores': dram['STORE_count']}
+    if dram_model is not None:
+        counts['DRAM'].update(dram_model.counts())
+
+    if warmup_images or warmup_accesses:
+        # counters at the end of the warm-up (image ends are always snapshots)
+        pixels_per_image = (int(ceil(image_size/parallelism)) * parallelism *
+                            image_size)
+        total_pixels = n_images * pixels_per_image
+        warm = next((timeline[k] for k in range(len(timeline))
+                     if timeline[k]['pixels'] >= warmup_images * pixels_per_image
+                     and timeline[k]['accesses'] >= warmup_accesses), None)
+        if warm is None or warm['pixels'] >= total_pixels:
+            raise ValueError('The warm-up covers the whole workload.')
+        for level in ('L1', 'L2'):
+            for key, counter in (('loads', 'LOAD_count'),
+                                 ('stores', 'STORE_count'),
+                                 ('hits', 'HIT_count'),
+                                 ('misses', 'MISS_count'),
+                                 ('writebacks', 'EVICT_count')):
+                counts[level][key] -= warm['%s_%s' % (level, counter)]
+        counts['DRAM']['loads'] -= warm['MEM_LOAD_count']
+        counts['DRAM']['stores'] -= warm['MEM_STORE_count']
+        counts['pixels'] = (n_images * image_size**2 *
+                            (total_pixels - warm['pixels']) / total_pixels)
+    return counts
+
+
+COUNTS_DIR = os.path.join('results', 'counts')
+
+
+def counts_filename(kernel, image_size, n_images, l1_ways, l2_ways,
+                    parallelism=1, l1_block_size=64, l2_block_size=64,
+                    l1_size=32768, l2_size=2097152, store_to_cache=False,
+                    seed=None, warmup_images=0, warmup_accesses=0,
+                    dram=None, dram_config=None, l1_policy='LRU',
+                    l2_policy='LRU', fused=True, counts_dir=COUNTS_DIR):
+    """Where `load_or_simulate_counts` stores the counts of a workload."""
+    if dram is not None:
+        from dram import DDR3Config
+        dram = '_dram-%s-%s' % (dram, (dram_config or DDR3Config()).signature())
+    name = ('%s%s_%sx%s_p%s_l1-%s-%s-%s%s_l2-%s-%s-%s%s%s%s%s%s_seed%s.json'
+            '' % (kernel, '' if fused else '-unfused', n_images,
+                  image_size, parallelism,
+                  l1_size, l1_ways, l1_block_size,
+                  '' if l1_policy == 'LRU' else '-' + l1_policy,
+                  l2_size, l2_ways, l2_block_size,
+                  '' if l2_policy == 'LRU' else '-' + l2_policy,
+                  '_store2cache' if store_to_cache else '',
+                  '_warmup%si' % warmup_images if warmup_images else '',
+                  '_warmup%sa' % warmup_accesses if warmup_accesses else '',
+                  dram or '', seed))
+    return os.path.join(counts_dir, name)
+
+
+def load_or_simulate_counts(counts_dir=COUNTS_DIR, profile=None,
+                            coalesce=False, timeline=None, **workload):
+    """Returns the counts of `simulate_counts(**workload)`, simulating only
+    if they are not already stored in `counts_dir`.
+
+    Each workload (kernel, image size, number of images, parallelism,
+    geometry, store_to_cache and seed) is stored as its own JSON file,
+    holding both the workload and its counts (and the DRAM model, if any).
+    Counts of random kernels (see `is_random`) are only stored with a seed,
+    as an unseeded draw would be reused as if it were the result.
+    """
+    if workload.get('seed') is None and is_random(workload['kernel']):
+        raise ValueError('%s draws random parameters; its counts are only '
+                         'stored (and reused) with a seed.'
+                         '' % workload['kernel'])
+    filename = counts_filename(counts_dir=counts_dir, **workload)
+    if os.path.exists(filename):
+        if profile is not None:
+            profile.count('stored counts used')
+        with open(filename) as f:
+            return json.load(f)['counts']
+
+    counts = simulate_counts(profile=profile, coalesce=coalesce,
+                             timeline=timeline, **workload)
+    if not os.path.exists(counts_dir):
+        os.makedirs(counts_dir)
+    tmp_filename = '%s.%s.tmp' % (filename, os.getpid())
+    with open(tmp_filename, 'w') as f:
+        json.dump({'workload': workload, 'counts': counts}, f, indent=2,
+                  default=vars)
+    os.rename(tmp_filename, filename)
+    return counts
+
+
+def price(counts, image_size, n_images, l1_ways, l2_ways, l1_block_size=64,
+          l2_block_size=64, l1_size=32768, l2_size=2097152,
+          dram_access_time=DRAM_ACCESS_TIME,
+          dram_read_energy_per_access=DRAM_READ_ENERGY,
+          dram_write_energy_per_access=DRAM_WRITE_ENERGY, dram_multiplier=1,
+          technology=None, calibration=None, profile=None, verbose=False,
+          dram_config=None):
+    """Prices the event counts of `simulate_counts`.
+
+    L1 and L2 costs come from CACTI (at `technology`, in microns, if given;
+    otherwise at the template's node).  DRAM costs come from the DRAM model
+    (see `dram.dram_cost`, with `dram_config`) if the counts have
+    row-buffer events, otherwise from the `dram_*` arguments.
+
+    Returns
+    -------
+    time_per_pixel, energy_per_pixel (float)
+        In ns and nJ.
+    """
     dram_access_time = dram_access_time * dram_multiplier
     dram_read_energy_per_access = dram_read_energy_per_access * dram_multiplier
     dram_write_energy_per_access = dram_write_energy_per_access * dram_multiplier
 
-    cs = create_cache(l1_ways=l1_ways,
-                      l1_block_size=l1_block_size,
-                      l1_size=l1_size,
-                      l2_ways=l2_ways,
-                      l2_block_size=l2_block_size,
-                      l2_size=l2_size)
-
-    cs, accesses = simulate_reads(transform_generator=generator_dict[kernel],
-                                  image_dimensions=(image_size,) * 2,
-                                  n_images=n_images,
-                                  cache=cs,
-                                  parallelism=parallelism,
-                                  address_lookup=pixel_address,
-                                  border_fcn=reflect_101,
-                                  store_to_cache=store_to_cache)
-
-    l1_access_time, l1_read_energy_per_access, l1_write_energy_per_access = \
-        get_cactus_results(l1_ways, l1_block_size, l1_size)
-    l2_access_time, l2_read_energy_per_access, l2_write_energy_per_access = \
-        get_cactus_results(l2_ways, l2_block_size, l2_size)
-
-    l1, l2, dram = list(cs.levels())[:3]
-    l1, l2, dram = l1.stats(), l2.stats(), dram.stats()
-    l1_loads, l1_stores = l1['LOAD_count'], l1['STORE_count']
-    l2_loads, l2_stores = l2['LOAD_count'], l2['STORE_count']
-    dram_loads, dram_stores = dram['LOAD_count'], dram['STORE_count']
-
-    l1_energy = (l1_loads * l1_read_energy_per_access +
-                 l1_stores * l1_write_energy_per_access)
-    l1_time = (l1_loads + l1_stores) * l1_access_time
-    l2_energy = (l2_loads * l2_read_energy_per_access +
-                 l2_stores * l2_write_energy_per_access)
-    l2_time = (l2_loads + l2_stores) * l2_access_time
-    dram_energy = (dram_loads + dram_stores) * dram_access_time
-    dram_time = (dram_loads * dram_read_energy_per_access +
-                 dram_stores * dram_write_energy_per_access)
-
-    total_energy = l1_energy + l2_energy + dram_energy
-    total_time = l1_time + l2_time + dram_time
-
-    n_pixels = n_images * image_size**2
+    if profile is None:
+        profile = _no_profile
+
+    with profile.phase('cacti'):
+        l1_access_time, l1_read_energy_per_access, l1_write_energy_per_access = \
+            get_cactus_results(l1_ways, l1_block_size, l1_size, profile,
+                               technology=technology)
+        l2_access_time, l2_read_energy_per_access, l2_write_energy_per_access = \
+            get_cactus_results(l2_ways, l2_block_size, l2_size, profile,
+                               technology=technology)
+
+    with profile.phase('accounting'):
+        l1_loads, l1_stores = counts['L1']['loads'], counts['L1']['stores']
+        l2_loads, l2_stores = counts['L2']['loads'], counts['L2']['stores']
+        dram_loads, dram_stores = counts['DRAM']['loads'], counts['DRAM']['stores']
+
+        # apply scale factors fit against measured misses (see calibrate.py)
+        if calibration is not None:
+            if not isinstance(calibration, dict):
+                with open(calibration) as f:
+                    calibration = json.load(f)
+            factors = calibration['factors']
+            l2_loads, l2_stores = (factors.get('L2', 1) * l2_loads,
+                                   factors.get('L2', 1) * l2_stores)
+            dram_loads, dram_stores = (factors.get('DRAM', 1) * dram_loads,
+                                       factors.get('DRAM', 1) * dram_stores)
+
+        l1_energy = (l1_loads * l1_read_energy_per_access +
+                     l1_stores * l1_write_energy_per_access)
+        l1_time = (l1_loads + l1_stores) * l1_access_time
+        l2_energy = (l2_loads * l2_read_energy_per_access +
+                     l2_stores * l2_write_energy_per_access)
+        l2_time = (l2_loads + l2_stores) * l2_access_time
+        dram_time = (dram_loads + dram_stores) * dram_access_time
+        dram_energy = (dram_loads * dram_read_energy_per_access +
+                       dram_stores * dram_write_energy_per_access)
+        dram_cost = None
+        if 'read_hits' in counts['DRAM']:
+            from dram import dram_cost as price_dram
+            dram_cost = price_dram(counts['DRAM'], dram_config)
+            factor = (calibration['factors'].get('DRAM', 1)
+                      if calibration is not None else 1)
+            dram_time = factor * dram_multiplier * dram_cost['time']
+            dram_energy = factor * dram_multiplier * dram_cost['energy']
+
+        total_energy = l1_energy + l2_energy + dram_energy
+        total_time = l1_time + l2_time + dram_time
+
+    n_pixels = counts.get('pixels', n_images * image_size**2)
     energy_per_pixel = total_energy / n_pixels
     time_per_pixel = total_time / n_pixels
 
@@ -267,16 +1118,189 @@ def main(kernel, image_size, n_images, l1_ways, l2_ways, parallelism=1,
         print('L1/L2/DRAM write energy per access: %s / %s / %s'
               '' % (l1_write_energy_per_access, l2_write_energy_per_access,
                     dram_write_energy_per_access))
-        # cs.print_stats()
+        if dram_cost is not None:
+            from dram import row_hit_rate
+            print('DRAM row hit rate: %s' % row_hit_rate(counts['DRAM']))
+            print('DRAM latency / bus / bank time: %s / %s / %s'
+                  '' % (dram_cost['latency'], dram_cost['bus_time'],
+                        dram_cost['bank_time']))
     return time_per_pixel, energy_per_pixel
 
+
+def main(kernel, image_size, n_images, l1_ways, l2_ways, parallelism=1,
+         l1_block_size=64, l2_block_size=64, l1_size=32768, l2_size=2097152,
+         dram_access_time=DRAM_ACCESS_TIME, dram_read_energy_per_access=DRAM_READ_ENERGY,
+         dram_write_energy_per_access=DRAM_WRITE_ENERGY, dram_multiplier=1,
+         store_to_cache=False, calibration=None, profile=None, verbose=True,
+         seed=None, counts_dir=None, technology=None, coalesce=False,
+         warmup_images=0, warmup_accesses=0, timeline=None, dram=None,
+         dram_config=None, l1_policy='LRU', l2_policy='LRU', precision=None,
+         confidence=0.95, stratify=None, convergence=None, fused=True,
+         analytic=False):
+    """Simulates a workload (see `simulate_counts`) and prices it (see
+    `price`).  If `counts_dir` is given, stored counts are reused (see
+    `load_or_simulate_counts`), so only pricing runs for a workload that
+    was simulated before (in which case `timeline` is not filled in).
+
+    If `precision` is given, images are simulated (and priced) one at a
+    time until the `confidence` intervals of the time and energy per pixel
+    are within `precision` of their means, or `n_images` images have been
+    simulated; with `stratify` (rot only), angles are stratified into
+    that many slices.  Pass a `Convergence` as `convergence` to get the number of
+    images simulated and the running estimates (neither `counts_dir`,
+    warm-up nor `timeline` are supported then).
+
+    `kernel` can be a pipeline ('ssr+hflip'), `fused` or not (see
+    `simulate_counts` and `fusion_report`).
+
+    If `analytic`, the counts of a flip are computed in closed form
+    instead of simulated (see analytic.py; neither `coalesce`,
+    `counts_dir`, `timeline` nor `precision` are supported then).
+    """
+
+    workload = dict(kernel=kernel, image_size=image_size, n_images=n_images,
+                    l1_ways=l1_ways, l2_ways=l2_ways, parallelism=parallelism,
+                    l1_block_size=l1_block_size, l2_block_size=l2_block_size,
+                    l1_size=l1_size, l2_size=l2_size,
+                    store_to_cache=store_to_cache, seed=seed)
+    if warmup_images or warmup_accesses:
+        workload.update(warmup_images=warmup_images,
+                        warmup_accesses=warmup_accesses)
+    if dram is not None:
+        workload.update(dram=dram, dram_config=dram_config)
+    if (l1_policy, l2_policy) != ('LRU', 'LRU'):
+        workload.update(l1_policy=l1_policy, l2_policy=l2_policy)
+    if pipeline_generators(kernel) is not None:
+        workload.update(fused=fused)
+    pricing = dict(image_size=image_size, l1_ways=l1_ways, l2_ways=l2_ways,
+                   l1_block_size=l1_block_size, l2_block_size=l2_block_size,
+                   l1_size=l1_size, l2_size=l2_size,
+                   dram_access_time=dram_access_time,
+                   dram_read_energy_per_access=dram_read_energy_per_access,
+                   dram_write_energy_per_access=dram_write_energy_per_access,
+                   dram_multiplier=dram_multiplier, technology=technology,
+                   calibration=calibration, profile=profile,
+                   dram_config=dram_config)
+
+    if analytic and (coalesce or counts_dir is not None or
+                     timeline is not None or precision is not None):
+        raise ValueError('Analytic counts are not simulated; coalesce, '
+                         'counts_dir, timelines and precision are not '
+                         'supported.')
+    if precision is not None:
+        if (counts_dir is not None or timeline is not None or
+                warmup_images or warmup_accesses):
+            raise ValueError('Images are simulated one at a time with a '
+                             'target precision; counts_dir, warm-up and '
+                             'timelines are not supported.')
+        if convergence is None:
+            convergence = Convergence(precision, confidence, strata=stratify,
+                                      seed=seed)
+        if convergence.strata and kernel != 'rot':
+            raise ValueError('Only the angles of rot are stratified, not '
+                             'the parameters of %r.' % kernel)
+        # seed once: reseeding per image would draw the same image each time
+        if seed is not None:
+            random_seed(seed)
+        workload.update(n_images=1, seed=None)
+        while (convergence.n_images < n_images and
+               not convergence.converged()):
+            angle, generator = None, None
+            if kernel == 'rot':
+                angle = convergence.next_angle()
+                generator = partial(rotation_generator_101, angle=angle)
+            counts = simulate_counts(profile=profile, coalesce=coalesce,
+                                     transform_generator=generator,
+                                     **workload)
+            convergence.add(angle, *price(counts, n_images=1, verbose=False,
+                                          **pricing))
+        time_per_pixel, time_hw, energy_per_pixel, energy_hw = \
+            convergence.interval()
+        if time_per_pixel is None:  # not even one round of strata
+            time_per_pixel, energy_per_pixel = [
+                sum(x) / convergence.n_images
+                for x in zip(*[row[2:4] for row in convergence.rows])]
+        if verbose:
+            print()
+            print('Time per Pixel (ns): %s +/- %s' % (time_per_pixel, time_hw))
+            print('Energy per Pixel (nJ): %s +/- %s'
+                  '' % (energy_per_pixel, energy_hw))
+            print('%s after %s images (%s%% confidence, %s relative '
+                  'precision).' % ('Converged' if convergence.converged()
+                                   else 'Not converged',
+                                   convergence.n_images, 100 * confidence,
+                                   precision))
+        return time_per_pixel, energy_per_pixel
+
+    if analytic:
+        from analytic import flip_counts
+        counts = flip_counts(**workload)
+    elif counts_dir is None:
+        counts = simulate_counts(profile=profile, coalesce=coalesce,
+                                 timeline=timeline, **workload)
+    else:
+        counts = load_or_simulate_counts(counts_dir, profile=profile,
+                                         coalesce=coalesce, timeline=timeline,
+                                         **workload)
+
+    return price(counts, n_images=n_images, verbose=verbose, **pricing)
+
+
+def fusion_report(kernel, image_size, n_images, l1_ways, l2_ways,
+                  parallelism=1, l1_block_size=64, l2_block_size=64,
+                  l1_size=32768, l2_size=2097152, seed=0, technology=None,
+                  verbose=True):
+    """Evaluates a pipeline ('ssr+hflip') unfused and fused (see
+    `iterate_pipeline_accesses`), drawing the same parameters for both.
+    Dirty lines are flushed at the end (see `simulate_counts`), so that
+    the write traffic of the unfused intermediate images is all counted.
+
+    Returns
+    -------
+    report (dict)
+        For 'unfused' and 'fused', the 'time per pixel (ns)', 'energy per
+        pixel (nJ)', 'L2 traffic (bytes)' (lines between L1 and L2) and
+        'DRAM traffic (bytes)'; 'saved' holds the differences (unfused -
+        fused) and 'saved (%)' them relative to unfused.
+    """
+    geometry = dict(l1_ways=l1_ways, l2_ways=l2_ways,
+                    l1_block_size=l1_block_size, l2_block_size=l2_block_size,
+                    l1_size=l1_size, l2_size=l2_size)
+    report = {}
+    for variant, fused in (('unfused', False), ('fused', True)):
+        counts = simulate_counts(kernel, image_size, n_images,
+                                 parallelism=parallelism, seed=seed,
+                                 fused=fused, flush=True, **geometry)
+        time_pp, energy_pp = price(counts, image_size, n_images,
+                                   technology=technology, **geometry)
+        report[variant] = {
+            'time per pixel (ns)': time_pp,
+            'energy per pixel (nJ)': energy_pp,
+            'L2 traffic (bytes)': l1_block_size * (counts['L2']['loads'] +
+                                                   counts['L2']['stores']),
+            'DRAM traffic (bytes)': l2_block_size * (counts['DRAM']['loads'] +
+                                                     counts['DRAM']['stores'])}
+    report['saved'] = {key: report['unfused'][key] - report['fused'][key]
+                       for key in report['fused']}
+    report['saved (%)'] = {key: 100 * report['saved'][key] /
+                           report['unfused'][key] for key in report['fused']}
+    if verbose:
+        print('\nFusion of %s\n' % kernel + '-' * (10 + len(kernel)))
+        print('%-10s' % '' + ''.join('%24s' % key for key in report['fused']))
+        for variant in ('unfused', 'fused', 'saved', 'saved (%)'):
+            print('%-10s' % variant + ''.join('%24.6g' % value for value in
+                                              report[variant].values()))
+    return report
+
     
 if __name__ == '__main__':
 
     # parse command line arguments
     import argparse
+    from replacement import POLICIES
     parser = argparse.ArgumentParser()
-    parser.add_argument('kernel', help='which kernel (rot, hflip, or vflip).')
+    parser.add_argument('kernel', help='which kernel (rot, ssr, hflip, or '
+                                       'vflip), or pipeline (e.g. ssr+hflip).')
     parser.add_argument('image_size', type=int, help='Width of (square) images.')
     parser.add_argument('n_images', type=int, help='Number of images to process.')
     parser.add_argument('l1_ways', type=int)
@@ -291,17 +1315,111 @@ if __name__ == '__main__':
                         help="Number of rows to process in parallel.")
     parser.add_argument('-m', '--dram_multiplier', default=1, type=float,
                         help="(Hacky) Multiply DRAM measurements by this factor.")
+    parser.add_argument('--profile', default=False, action='store_true',
+                        help="Report time spent per phase, accesses simulated "
+                             "per second, CACTI calls and peak memory.")
+    parser.add_argument('--calibration', default=None,
+                        help="Scale L2/DRAM accesses by the factors in this "
+                             "JSON file (see calibrate.py).")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed the random rotation angles.")
+    parser.add_argument('--counts_dir', default=None,
+                        help="Reuse (or store) simulated event counts in this "
+                             "directory, e.g. %s (see reprice.py)." % COUNTS_DIR)
+    parser.add_argument('--technology', type=float, default=None,
+                        help="CACTI technology node in microns (defaults to "
+                             "cache_template.cfg's).")
+    parser.add_argument('--coalesce', default=False, action='store_true',
+                        help="Don't replay repeated accesses to a cache line "
+                             "(same results, see coalesce_accesses; slower "
+                             "with pycachesim, faster only with the "
+                             "pure-Python policies).")
+    parser.add_argument('--warmup_images', type=int, default=0,
+                        help="Exclude the first K images from the results.")
+    parser.add_argument('--warmup_accesses', type=int, default=0,
+                        help="Exclude the first N accesses from the results.")
+    parser.add_argument('--timeline', default=None,
+                        help="Write counters per interval to this CSV file "
+                             "(see plot_timeline.py).")
+    parser.add_argument('--snapshot_every', type=int, default=None,
+                        help="Timeline interval in accesses (intervals also "
+                             "end with every image).")
+    parser.add_argument('--snapshot_row_sets', default=False,
+                        action='store_true',
+                        help="End a timeline interval after every row set.")
+    parser.add_argument('--l1_policy', default='LRU', choices=POLICIES,
+                        help="L1 replacement policy (see replacement.py).")
+    parser.add_argument('--l2_policy', default='LRU', choices=POLICIES,
+                        help="L2 replacement policy (see replacement.py).")
+    parser.add_argument('--dram', default=None, choices=('open', 'closed'),
+                        help="Price DRAM with the DDR3 model (see dram.py) "
+                             "using this page policy.")
+    parser.add_argument('--dram_cfg', default=None,
+                        help="Read the DRAM clock and geometry from this "
+                             "CACTI main memory configuration (e.g. "
+                             "ddr3-cvlab.cfg).")
+    parser.add_argument('--precision', type=float, default=None,
+                        help="Simulate images one at a time until the time "
+                             "and energy per pixel are known within this "
+                             "relative precision (n_images is then a cap).")
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help="Confidence level of --precision.")
+    parser.add_argument('--stratify', type=int, default=None,
+                        help="With --precision, draw rotation angles from "
+                             "this many equal slices of [-90, 90] in turn "
+                             "(rot only).")
+    parser.add_argument('--convergence', default=None,
+                        help="With --precision, write the running estimates "
+                             "per image to this CSV file.")
+    parser.add_argument('--analytic', default=False, action='store_true',
+                        help="Compute the counts of a flip in closed form "
+                             "instead of simulating (see analytic.py).")
+    parser.add_argument('--unfused', default=False, action='store_true',
+                        help="Run a pipeline's kernels in separate passes.")
+    parser.add_argument('--fusion_report', default=False, action='store_true',
+                        help="Compare a pipeline unfused and fused.")
     args = vars(parser.parse_args())
 
+    if args['fusion_report']:
+        fusion_report(args['kernel'], args['image_size'], args['n_images'],
+                      args['l1_ways'], args['l2_ways'],
+                      parallelism=args['parallelism'],
+                      l1_block_size=args['l1_block_size'],
+                      l2_block_size=args['l2_block_size'],
+                      l1_size=args['l1_size'], l2_size=args['l2_size'],
+                      seed=args['seed'] or 0, technology=args['technology'])
+        raise SystemExit
+
     # report CLI arguments
     print("\nUser Parameters\n" + '-' * 15)
     pprint(args)
     print()
-    multiplier = args.pop('dram_multiplier')
+    profile = Profile() if args.pop('profile') else None
+    timeline_filename = args.pop('timeline')
+    timeline = Timeline(every_accesses=args.pop('snapshot_every'),
+                        row_sets=args.pop('snapshot_row_sets'))
+    dram_cfg = args.pop('dram_cfg')
+    if dram_cfg is not None:
+        from dram import DDR3Config
+        args['dram_config'] = DDR3Config.from_cacti_cfg(dram_cfg)
+    args['fused'] = not args.pop('unfused')
+    args.pop('fusion_report')
+    convergence_filename = args.pop('convergence')
+    convergence = None
+    if args['precision'] is not None:
+        convergence = Convergence(args['precision'], args['confidence'],
+                                  strata=args['stratify'], seed=args['seed'])
 
     # run simulation
     main(verbose=True,
-         dram_access_time=multiplier*DRAM_ACCESS_TIME,
-         dram_read_energy_per_access=multiplier*DRAM_READ_ENERGY,
-         dram_write_energy_per_access=multiplier*DRAM_WRITE_ENERGY,
+         convergence=convergence,
+         profile=profile,
+         timeline=timeline if timeline_filename is not None else None,
          **args)
+    if timeline_filename is not None and len(timeline):
+        timeline.to_csv(timeline_filename)
+    if convergence_filename is not None and convergence is not None:
+        convergence.to_csv(convergence_filename)
+    if profile is not None:
+        print("\nProfile\n" + '-' * 7)
+        pprint(profile.report())
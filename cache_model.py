@@ -0,0 +1,297 @@
+"""A pure-Python model of the cache hierarchy `cache.create_cache` builds.
+
+pycachesim only exposes aggregate counters, which is all `cache.main`
+needs.  Analyses that need to see individual events (which line missed,
+which set it maps to, which line was written back to DRAM) use this model
+instead.  It reproduces pycachesim's semantics and statistics exactly
+(write-back, write-allocate, LRU or FIFO), so its counts can be checked
+against the real simulator (see `agrees_with_pycachesim`).  Other
+replacement policies, including Belady's OPT, are in `replacement.py`
+(see `simulate_policies`).
+
+Each level can be given an `observer`, which is called as
+`observer(line, set_index, hit, is_store)` for every cache line accessed at
+that level.  The main memory observer is called as `observer(line,
+is_store)` for every line read from or written back to memory.
+"""
+
+from __future__ import division, print_function
+from collections import OrderedDict
+from replacement import create_policy, next_uses
+
+
+class CacheLevel(object):
+    """One write-back, write-allocate, set-associative cache level.
+
+    Parameters
+    ----------
+    name (string)
+        Name reported in `stats()`.
+    sets, ways, cl_size (int)
+        Geometry, as for `cachesim.Cache`.
+    load_from, store_to (CacheLevel or MainMemory)
+        The next level.
+    observer (callable)
+        Called for every line accessed at this level (see module docstring).
+    policy (object)
+        Replacement policy (see `replacement.py`), LRU by default.
+    """
+
+    def __init__(self, name, sets, ways, cl_size, load_from=None,
+                 store_to=None, observer=None, policy=None):
+        self.name = name
+        self.sets, self.ways, self.cl_size = sets, ways, cl_size
+        self.load_from = load_from
+        self.store_to = store_to
+        self.observer = observer
+        self.policy = policy if policy is not None else create_policy(
+            'LRU', sets, ways)
+        # per set: line -> dirty, in insertion order (recency order for LRU)
+        self.placement = [OrderedDict() for _ in range(sets)]
+        self.lookups = 0  # lines looked up so far (positions for OPT)
+        self.reset_stats()
+
+    def reset_stats(self):
+        for counter in ('LOAD', 'STORE', 'HIT', 'MISS', 'EVICT'):
+            setattr(self, counter + '_count', 0)
+            setattr(self, counter + '_byte', 0)
+
+    def _inject(self, set_index, entries, line, dirty, position):
+        """Places `line` in its set, evicting (and writing back) a victim."""
+        if len(entries) >= self.ways:
+            victim = self.policy.victim(set_index, entries)
+            victim_dirty = entries.pop(victim)
+            self.policy.evict(set_index, victim)
+            if victim_dirty:
+                self.EVICT_count += 1
+                self.EVICT_byte += self.cl_size
+                if self.store_to is not None:
+                    self.store_to.store(victim * self.cl_size, self.cl_size)
+        entries[line] = dirty
+        self.policy.insert(set_index, entries, line, position)
+
+    def load(self, addr, length=1):
+        self.LOAD_count += 1
+        self.LOAD_byte += length
+        requested = min(self.cl_size, length)
+        for line in range(addr // self.cl_size,
+                          (addr + length - 1) // self.cl_size + 1):
+            set_index = line % self.sets
+            entries = self.placement[set_index]
+            position = self.lookups
+            self.lookups += 1
+            hit = line in entries
+            if self.observer is not None:
+                self.observer(line, set_index, hit, False)
+            if hit:
+                self.HIT_count += 1
+                self.HIT_byte += requested
+                self.policy.touch(set_index, entries, line, False, position)
+                continue
+            self.MISS_count += 1
+            self.MISS_byte += requested
+            if self.load_from is not None:
+                self.load_from.load(line * self.cl_size, self.cl_size)
+            self._inject(set_index, entries, line, False, position)
+
+    def store(self, addr, length=1):
+        self.STORE_count += 1
+        self.STORE_byte += length
+        for line in range(addr // self.cl_size,
+                          (addr + length - 1) // self.cl_size + 1):
+            set_index = line % self.sets
+            entries = self.placement[set_index]
+            if line not in entries:
+                # write-allocate (counted as a load of the whole line)
+                observer, self.observer = self.observer, None
+                if observer is not None:
+                    observer(line, set_index, False, True)
+                self.load(line * self.cl_size, self.cl_size)
+                self.observer = observer
+            else:
+                if self.observer is not None:
+                    self.observer(line, set_index, True, True)
+                self.policy.touch(set_index, entries, line, True, self.lookups)
+                self.lookups += 1
+            entries[line] = True  # note: store hits do not update LRU order
+
+    def loadstore(self, addrs, length=1):
+        """Same as `cachesim.CacheSimulator.loadstore`."""
+        for loads, stores in addrs:
+            if loads is not None:
+                for addr in loads:
+                    self.load(addr, length)
+            if stores is not None:
+                for addr in stores:
+                    self.store(addr, length)
+
+    def force_write_back(self):
+        """Writes all dirty lines back (counted as evictions) and marks
+        them clean, as `cachesim.Cache.force_write_back` does."""
+        for entries in self.placement:
+            for line, dirty in entries.items():
+                if dirty:
+                    entries[line] = False
+                    self.EVICT_count += 1
+                    self.EVICT_byte += self.cl_size
+                    if self.store_to is not None:
+                        self.store_to.store(line * self.cl_size, self.cl_size)
+
+    def stats(self):
+        return {'name': self.name,
+                'LOAD_count': self.LOAD_count, 'LOAD_byte': self.LOAD_byte,
+                'STORE_count': self.STORE_count, 'STORE_byte': self.STORE_byte,
+                'HIT_count': self.HIT_count, 'HIT_byte': self.HIT_byte,
+                'MISS_count': self.MISS_count, 'MISS_byte': self.MISS_byte,
+                'EVICT_count': self.EVICT_count, 'EVICT_byte': self.EVICT_byte}
+
+
+class MainMemory(object):
+    """Last level of the hierarchy; hits on every request."""
+
+    def __init__(self, name='MEM', observer=None):
+        self.name = name
+        self.observer = observer
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.LOAD_count = self.LOAD_byte = 0
+        self.STORE_count = self.STORE_byte = 0
+
+    def load(self, addr, length=1):
+        self.LOAD_count += 1
+        self.LOAD_byte += length
+        if self.observer is not None:
+            self.observer(addr // length, False)
+
+    def store(self, addr, length=1):
+        self.STORE_count += 1
+        self.STORE_byte += length
+        if self.observer is not None:
+            self.observer(addr // length, True)
+
+    def stats(self):
+        return {'name': self.name,
+                'LOAD_count': self.LOAD_count, 'LOAD_byte': self.LOAD_byte,
+                'HIT_count': self.LOAD_count, 'HIT_byte': self.LOAD_byte,
+                'STORE_count': self.STORE_count, 'STORE_byte': self.STORE_byte,
+                'EVICT_count': 0, 'EVICT_byte': 0,
+                'MISS_count': 0, 'MISS_byte': 0}
+
+
+class CacheHierarchy(object):
+    """Drop-in for the `cachesim.CacheSimulator` that `create_cache` returns."""
+
+    def __init__(self, first_level, main_memory):
+        self.first_level = first_level
+        self.main_memory = main_memory
+
+    def load(self, addr, length=1):
+        self.first_level.load(addr, length)
+
+    def store(self, addr, length=1):
+        self.first_level.store(addr, length)
+
+    def loadstore(self, addrs, length=1):
+        self.first_level.loadstore(addrs, length)
+
+    def levels(self, with_mem=True):
+        level = self.first_level
+        while isinstance(level, CacheLevel):
+            yield level
+            level = level.load_from
+        if with_mem:
+            yield self.main_memory
+
+    def force_write_back(self):
+        """Writes all pending dirty lines back, first level first."""
+        for level in self.levels(with_mem=False):
+            level.force_write_back()
+
+    def reset_stats(self):
+        for level in self.levels():
+            level.reset_stats()
+
+
+def geometry(ways, block_size, size):
+    """Returns (sets, ways) as `cache.create_cache` computes them."""
+    if ways == 0:
+        return 1, size // block_size
+    return size // (block_size * ways), ways
+
+
+def create_hierarchy(l1_ways, l1_block_size, l1_size, l2_ways, l2_block_size,
+                     l2_size, l1_observer=None, l2_observer=None,
+                     memory_observer=None, l1_policy='LRU', l2_policy='LRU',
+                     seed=None, l1_next_use=None, l2_next_use=None):
+    """Same arguments (and semantics) as `cache.create_cache`.
+
+    `l1_policy` and `l2_policy` are names of `replacement.POLICIES`
+    ('RANDOM', 'SRRIP' and 'BRRIP' are seeded with `seed`); 'OPT' needs
+    the next use of each lookup of that level (see `simulate_policies`).
+    """
+    mem = MainMemory(observer=memory_observer)
+    l2_sets, l2_ways = geometry(l2_ways, l2_block_size, l2_size)
+    l2 = CacheLevel("L2", l2_sets, l2_ways, l2_block_size, load_from=mem,
+                    store_to=mem, observer=l2_observer,
+                    policy=create_policy(l2_policy, l2_sets, l2_ways, seed,
+                                         l2_next_use))
+    l1_sets, l1_ways = geometry(l1_ways, l1_block_size, l1_size)
+    l1 = CacheLevel("L1", l1_sets, l1_ways, l1_block_size, load_from=l2,
+                    store_to=l2, observer=l1_observer,
+                    policy=create_policy(l1_policy, l1_sets, l1_ways, seed,
+                                         l1_next_use))
+    return CacheHierarchy(l1, mem)
+
+
+def simulate_policies(trace, l1_policy='LRU', l2_policy='LRU', seed=None,
+                      memory_observer=None, **geometry_kwargs):
+    """Replays `trace` (a list, see `cache.iterate_accesses`) through a
+    hierarchy with these policies and returns the `stats()` of its levels.
+
+    A level with the 'OPT' policy needs the lines it will look up, which do
+    not depend on its own policy (only on the levels above it), so they are
+    recorded by an extra pass first: one for the L1 (its lookups are those
+    of the trace), and one for the L2 if the L1 also uses OPT.
+    """
+    next_use = {}
+
+    def record(**kwargs):
+        lines = {'L1': [], 'L2': []}
+        model = create_hierarchy(
+            l1_observer=lambda line, *_: lines['L1'].append(line),
+            l2_observer=lambda line, *_: lines['L2'].append(line),
+            seed=seed, **dict(geometry_kwargs, **kwargs))
+        model.loadstore(trace, length=3)
+        return lines
+
+    if 'OPT' in (l1_policy, l2_policy):
+        lines = record(l1_policy='LRU' if l1_policy == 'OPT' else l1_policy,
+                       l2_policy='LRU')
+        if l1_policy == 'OPT':
+            next_use['l1_next_use'] = next_uses(lines['L1'])
+            if l2_policy == 'OPT':
+                lines = record(l1_policy='OPT', l2_policy='LRU', **next_use)
+        if l2_policy == 'OPT':
+            next_use['l2_next_use'] = next_uses(lines['L2'])
+
+    model = create_hierarchy(l1_policy=l1_policy, l2_policy=l2_policy,
+                             seed=seed, memory_observer=memory_observer,
+                             **dict(geometry_kwargs, **next_use))
+    model.loadstore(trace, length=3)
+    return [level.stats() for level in model.levels()]
+
+
+def agrees_with_pycachesim(trace, policy='LRU', **geometry_kwargs):
+    """Replays `trace` (see `cache.iterate_accesses`) through this model and
+    through pycachesim (with `policy`, 'LRU' or 'FIFO' at both levels) and
+    returns True if all statistics agree."""
+    from cache import create_cache
+    trace = list(trace)
+    model = create_hierarchy(l1_policy=policy, l2_policy=policy,
+                             **geometry_kwargs)
+    model.loadstore(trace, length=3)
+    cs = create_cache(l1_policy=policy, l2_policy=policy, **geometry_kwargs)
+    cs.loadstore(trace, length=3)
+    return ([level.stats() for level in model.levels()] ==
+            [level.stats() for level in cs.levels()])
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+"""Calibrates the cache simulator (`cache.py`) against measured cache misses.
+
+For each kernel and image size, the same seeded workload (same images, same
+sequence of rotation angles) is
+
+* run on the CPU with OpenCV while counting `L1-dcache-load-misses`,
+  `LLC-loads` and `LLC-load-misses` (see `hwcounters.py`), and
+* simulated (loads from the source images, stores to the output images,
+  see `cache.iterate_pipeline_accesses`) on a hierarchy with this host's
+  real L1d and last-level cache geometry (read from sysfs).
+
+Predicted and measured counts are reported side by side, and a scale factor
+per level is fit (least squares through the origin):
+
+* 'L2' scales the simulator's L2 accesses (= L1 misses), fit against
+  `L1-dcache-load-misses`, and
+* 'DRAM' scales the simulator's DRAM accesses (= L2 misses), fit against
+  `LLC-load-misses`,
+
+both predicted for loads only (the events count no store misses).
+
+The factors are written to a JSON file that `cache.main` (or
+`python cache.py ... --calibration calibration.json`) can apply.
+
+Usage
+-----
+    $ python calibrate.py -k rot hflip vflip -s 50 100 250 -n 2 -o calibration.json
+
+"""
+
+from __future__ import division, print_function
+import os
+import json
+import random
+import numpy as np
+from cache import (create_cache, iterate_pipeline_accesses, hflip_generator,
+                   vflip_generator)
+from hwcounters import PerfCounters
+
+MEASURED_EVENTS = ('L1-dcache-load-misses', 'LLC-loads', 'LLC-load-misses')
+
+
+def _parse_size(size):
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3}
+    size = size.strip()
+    if size[-1] in units:
+        return int(size[:-1]) * units[size[-1]]
+    return int(size)
+
+
+def host_cache_geometry(cpu=0):
+    """Returns this host's data caches as read from sysfs.
+
+    Returns
+    -------
+    geometry (dict)
+        Maps cache level (1, 2, ...) to (size in bytes, ways, line size).
+    """
+    cache_dir = '/sys/devices/system/cpu/cpu%s/cache' % cpu
+    geometry = {}
+    for index in sorted(os.listdir(cache_dir)):
+        if not index.startswith('index'):
+            continue
+
+        def read(name):
+            with open(os.path.join(cache_dir, index, name)) as f:
+                return f.read().strip()
+
+        if read('type') == 'Instruction':
+            continue
+        geometry[int(read('level'))] = (_parse_size(read('size')),
+                                        int(read('ways_of_associativity')),
+                                        int(read('coherency_line_size')))
+    return geometry
+
+
+def seeded_angles(n_images, seed=0):
+    """The rotation angles (in degrees) used for both CPU and simulator."""
+    rng = random.Random(seed)
+    return [rng.uniform(-90, 90) for _ in range(n_images)]
+
+
+def rotation_matrix(image_size, angle):
+    """The matrix `cv.getRotationMatrix2D` returns (rotation about center)."""
+    c = image_size / 2
+    a, b = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    return np.array([[a, b, (1 - a) * c - b * c],
+                     [-b, a, b * c + (1 - a) * c]])
+
+
+def centered_rotation_generator(angles):
+    """Returns a `transform_generator` (see `cache.simulate_reads`) which
+    maps output pixels to source pixels exactly as `cv.warpAffine` does for
+    the rotation matrices of `angles`, one angle per image, in order."""
+    angles = iter(angles)
+
+    def generator(image_dimensions):
+        w, h = image_dimensions
+        M = np.vstack((rotation_matrix(w, next(angles)), [0, 0, 1]))
+        (a, b, c), (d, e, f) = np.linalg.inv(M)[:2].tolist()
+
+        def transform(x, y):
+            return [a*x + b*y + c, d*x + e*y + f]
+
+        return True, transform
+    return generator
+
+
+def predict(kernel, image_size, n_images, geometry, seed=0):
+    """Simulates the workload on the host's L1d and last-level cache.
+
+    Only the L2 and DRAM accesses caused by loads are predicted, as the
+    measured events count load misses only: the write-allocate fills of
+    stores to the output images (and their L2 misses) are left out.
+
+    Returns
+    -------
+    predicted (dict)
+        Simulated L1 accesses, L2 accesses caused by loads (= L1 load
+        misses) and DRAM accesses caused by loads (= L2 load misses).
+    """
+    l1_size, l1_ways, l1_block_size = geometry[min(geometry)]
+    l2_size, l2_ways, l2_block_size = geometry[max(geometry)]
+    cs = create_cache(l1_ways=l1_ways, l1_block_size=l1_block_size,
+                      l1_size=l1_size, l2_ways=l2_ways,
+                      l2_block_size=l2_block_size, l2_size=l2_size)
+    l1, l2, dram = list(cs.levels())[:3]
+    if kernel == 'rot':
+        generator = centered_rotation_generator(seeded_angles(n_images, seed))
+    else:
+        generator = {'hflip': hflip_generator, 'vflip': vflip_generator}[kernel]
+    # a one-stage pipeline: loads from the source images, stores to each
+    # output pixel of the output images, as `measure` runs it (unlike
+    # `simulate_reads`, whose stores go to the source pixel); the loads of
+    # L2 and DRAM during stores are counted to be subtracted
+    store_caused = {'L2': 0, 'DRAM': 0}
+    for loads, stores in iterate_pipeline_accesses(
+            [generator], (image_size,) * 2, n_images):
+        cs.loadstore([(loads, ())], length=3)
+        before = l2.stats()['LOAD_count'], dram.stats()['LOAD_count']
+        cs.loadstore([((), stores)], length=3)
+        store_caused['L2'] += l2.stats()['LOAD_count'] - before[0]
+        store_caused['DRAM'] += dram.stats()['LOAD_count'] - before[1]
+    l1, l2, dram = l1.stats(), l2.stats(), dram.stats()
+    return {'L1': l1['LOAD_count'] + l1['STORE_count'],
+            'L2': l2['LOAD_count'] - store_caused['L2'],
+            'DRAM': dram['LOAD_count'] - store_caused['DRAM']}
+
+
+def flush_caches(n_bytes):
+    """Evicts (most of) the caches by writing a buffer of `n_bytes`."""
+    buffer = np.empty(n_bytes, dtype='uint8')
+    buffer.fill(1)
+    return int(buffer[::4096].sum())
+
+
+def measure(kernel, image_size, n_images, counters, seed=0,
+            flush_bytes=64 * 1024**2, repeats=3):
+    """Runs the workload on the CPU (with OpenCV on one thread) and returns
+    median event counts."""
+    import cv2 as cv
+    rng = np.random.RandomState(seed)
+    images = rng.randint(0, 256, (n_images, image_size, image_size, 3),
+                         dtype='uint8')
+    out = np.zeros_like(images)
+    angles = seeded_angles(n_images, seed)
+    matrices = [rotation_matrix(image_size, angle) for angle in angles]
+
+    # one thread: the simulator models one core, and counters would miss
+    # the work of OpenCV's pool threads (see hwcounters.py)
+    threads = cv.getNumThreads()
+    cv.setNumThreads(1)
+    runs = []
+    try:
+        for _ in range(repeats):
+            flush_caches(flush_bytes)
+            with counters:
+                for k in range(n_images):
+                    if kernel == 'rot':
+                        cv.warpAffine(images[k], matrices[k],
+                                      (image_size, image_size), dst=out[k],
+                                      flags=cv.INTER_LINEAR,
+                                      borderMode=cv.BORDER_REFLECT_101)
+                    else:
+                        cv.flip(images[k], 1 if kernel == 'hflip' else 0,
+                                dst=out[k])
+            runs.append(counters.read())
+    finally:
+        cv.setNumThreads(threads)
+    return {event: (sorted(r[event] for r in runs)[len(runs) // 2]
+                    if runs[0][event] is not None else None)
+            for event in runs[0]}
+
+
+def fit_scale(predicted, measured):
+    """Least squares `s` minimizing sum((measured - s * predicted)**2)."""
+    pairs = [(p, m) for p, m in zip(predicted, measured)
+             if m is not None and p > 0]
+    if not pairs:
+        return None
+    return sum(p * m for p, m in pairs) / sum(p * p for p, _ in pairs)
+
+
+def calibrate(kernels, image_sizes, n_images, seed=0,
+              out_filename='calibration.json', flush_bytes=None, repeats=3,
+              verbose=True):
+    """Runs all workloads, fits scale factors and writes them to JSON."""
+    geometry = host_cache_geometry()
+    if flush_bytes is None:
+        flush_bytes = min(2 * geometry[max(geometry)][0], 512 * 1024**2)
+    counters = PerfCounters(MEASURED_EVENTS)
+    for event, reason in counters.unavailable.items():
+        print('Warning: %s unavailable (%s).' % (event, reason))
+
+    points = []
+    for kernel in kernels:
+        for size in image_sizes:
+            predicted = predict(kernel, size, n_images, geometry, seed)
+            measured = measure(kernel, size, n_images, counters, seed,
+                               flush_bytes=flush_bytes, repeats=repeats)
+            points.append({'kernel': kernel, 'image_size': size,
+                           'n_images': n_images, 'predicted': predicted,
+                           'measured': measured})
+            if verbose:
+                print('%s %sx%s: predicted L2/DRAM load accesses %s / %s, '
+                      'measured L1-dcache-load-misses/LLC-load-misses %s / %s '
+                      '(LLC-loads %s)'
+                      '' % (kernel, n_images, size, predicted['L2'],
+                            predicted['DRAM'],
+                            measured['L1-dcache-load-misses'],
+                            measured['LLC-load-misses'], measured['LLC-loads']))
+    counters.close()
+
+    factors = {
+        'L2': fit_scale([p['predicted']['L2'] for p in points],
+                        [p['measured']['L1-dcache-load-misses'] for p in points]),
+        'DRAM': fit_scale([p['predicted']['DRAM'] for p in points],
+                          [p['measured']['LLC-load-misses'] for p in points])}
+    calibration = {'factors': {k: v for k, v in factors.items()
+                               if v is not None},
+                   'host_geometry': {str(k): v for k, v in geometry.items()},
+                   'seed': seed,
+                   'points': points}
+    with open(out_filename, 'w') as f:
+        json.dump(calibration, f, indent=2)
+    if verbose:
+        print('scale factors:', factors)
+    return calibration
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', '--kernels', nargs='+',
+                        default=['rot', 'hflip', 'vflip'])
+    parser.add_argument('-s', '--image_sizes', nargs='+', type=int,
+                        default=[50, 100, 250])
+    parser.add_argument('-n', '--n_images', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-r', '--repeats', type=int, default=3,
+                        help='Measure each workload this many times '
+                             '(the median is used).')
+    parser.add_argument('--flush_mb', type=int, default=None,
+                        help='Size of the buffer written to flush caches '
+                             'before each measurement (defaults to twice the '
+                             'LLC, at most 512 MiB).')
+    parser.add_argument('-o', '--out', default='calibration.json')
+    args = parser.parse_args()
+
+    calibrate(kernels=args.kernels,
+              image_sizes=args.image_sizes,
+              n_images=args.n_images,
+              seed=args.seed,
+              out_filename=args.out,
+              flush_bytes=None if args.flush_mb is None
+              else args.flush_mb * 1024**2,
+              repeats=args.repeats)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""Checks that `benchmark.py` starts up quickly.
+
+`analyze.sh` starts `benchmark.py` thousands of times, so any import added
+at module level is paid on every run.  This script runs a trivial
+`benchmark.py` invocation under `python -X importtime`, and fails (exit
+status 1) if
+
+* the total import time exceeds a budget, or
+* any of the heavy modules (cv2, albumentations, cProfile, multiprocessing)
+  is imported although the run does not need it.
+
+Usage
+-----
+* Check the default budget::
+
+    $ python check_startup_time.py
+
+
+* Check a different command line and budget (in milliseconds)::
+
+    $ python check_startup_time.py --budget 150 -- none none -g 8 -n 1 -p
+
+"""
+
+from __future__ import division, print_function
+import sys
+import subprocess
+from time import perf_counter
+
+DEFAULT_ARGS = ['none', 'none', '-g', '8', '-n', '1', '-p', '--no_profile']
+FORBIDDEN_MODULES = ('cv2', 'albumentations', 'cProfile', 'multiprocessing')
+
+
+def import_times(benchmark_args=DEFAULT_ARGS, python=sys.executable):
+    """Runs `benchmark.py` under `-X importtime`.
+
+    Returns
+    -------
+    imports (dict)
+        Maps each imported module to (cumulative import time in us, depth
+        in the import tree), where depth 0 means imported by benchmark.py
+        or the interpreter itself.
+    """
+    result = subprocess.run([python, '-X', 'importtime', 'benchmark.py'] +
+                            list(benchmark_args),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports[name.strip()] = (int(cumulative), depth)
+    return imports
+
+
+def wall_times(benchmark_args=DEFAULT_ARGS, repeats=5, python=sys.executable):
+    """Returns the wall times (in seconds) of `repeats` runs."""
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        subprocess.run([python, 'benchmark.py'] + list(benchmark_args),
+                       stdout=subprocess.DEVNULL, check=True)
+        times.append(perf_counter() - start)
+    return times
+
+
+def check(benchmark_args=DEFAULT_ARGS, budget_ms=200,
+          forbidden=FORBIDDEN_MODULES, repeats=5):
+    """Prints a startup report and returns True if within budget."""
+    imports = import_times(benchmark_args)
+    top_level = {name: t for name, (t, depth) in imports.items()
+                 if depth == 0}
+    total_ms = sum(top_level.values()) / 1000
+    times = sorted(wall_times(benchmark_args, repeats))
+
+    print('benchmark.py %s' % ' '.join(benchmark_args))
+    print('median wall time: %.1f ms' % (1000 * times[len(times) // 2]))
+    print('total import time: %.1f ms (budget %s ms)' % (total_ms, budget_ms))
+    print('slowest top-level imports:')
+    for name, t in sorted(top_level.items(), key=lambda x: -x[1])[:5]:
+        print('  %8.1f ms  %s' % (t / 1000, name))
+
+    ok = total_ms <= budget_ms
+    if not ok:
+        print('FAIL: import time over budget.')
+    for module in forbidden:
+        if module in imports:
+            print('FAIL: %s was imported.' % module)
+            ok = False
+    return ok
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark_args', nargs='*', default=DEFAULT_ARGS,
+        help='Arguments passed to benchmark.py (after `--`).')
+    parser.add_argument('-b', '--budget', type=float, default=200,
+        help='Maximum total import time in milliseconds.')
+    parser.add_argument('-r', '--repeats', type=int, default=5,
+        help='Number of runs used for the median wall time.')
+    parser.add_argument('--allow', nargs='*', default=[],
+        help='Heavy modules which this command line may import.')
+    args = parser.parse_args()
+
+    ok = check(benchmark_args=args.benchmark_args,
+               budget_ms=args.budget,
+               forbidden=[m for m in FORBIDDEN_MODULES if m not in args.allow],
+               repeats=args.repeats)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+"""Builds the CPU vs. accelerator comparison (as in cpu-vs-asic.csv and
+winners.txt) in one command.
+
+For each kernel, image size and batch size, the same seeded workload (same
+random images, same rotation angles, see `calibrate.seeded_angles`) is
+
+* run on the CPU with OpenCV, as `calibrate.measure` does, timing the
+  fastest of a few repeats (energy from RAPL if readable, otherwise
+  `CPU_POWER` times the time), and
+* simulated and priced (`cache.main`) for every accelerator configuration
+  of the search space (rows processed in parallel x L1 size x
+  associativity, as in `run_cache_experiment.py`), in worker processes.
+
+The fastest and the most energy-efficient configurations are compared
+against the CPU.  CPU measurements and search tables (per search space and
+`store_to_cache`) are stored in `results_dir` and simulated counts in
+`counts_dir`, so points that were already computed are not recomputed.
+
+Usage
+-----
+    $ python cpu_vs_asic.py -k rot hflip vflip -s 250 500 -n 2 -j 4 \\
+          -o cpu-vs-asic.csv --winners winners.txt
+
+"""
+
+from __future__ import division, print_function
+import os
+import csv
+import json
+import numpy as np
+from time import perf_counter
+
+CPU_POWER = 145.  # W, about what the CPU rows of cpu-vs-asic.csv imply
+RAPL_ENERGY = '/sys/class/powercap/intel-rapl:0/energy_uj'
+ROWS = list(range(1, 17))
+L1_SIZES = [2**n for n in range(12, 16)]
+WAYS = [1, 2, 4, 8, 0]
+SEARCH_COLUMNS = ['time per pixel (ns)', 'energy per pixel (nJ)', 'rows',
+                  'ways', 'l1_size']
+
+
+def _read_rapl():
+    try:
+        with open(RAPL_ENERGY) as f:
+            return int(f.read())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def measure_cpu(kernel, image_size, n_images, seed=0, repeats=3):
+    """Runs the workload on the CPU.
+
+    Returns
+    -------
+    result (dict)
+        'seconds' (fastest repeat), 'time per pixel (ns)', 'energy per
+        pixel (nJ)' and 'energy source' ('rapl' or 'constant power').
+    """
+    import cv2 as cv
+    from calibrate import seeded_angles, rotation_matrix
+    rng = np.random.RandomState(seed)
+    images = rng.randint(0, 256, (n_images, image_size, image_size, 3),
+                         dtype='uint8')
+    out = np.zeros_like(images)
+    matrices = [rotation_matrix(image_size, angle)
+                for angle in seeded_angles(n_images, seed)]
+
+    best, best_energy = float('inf'), None
+    for _ in range(repeats):
+        energy_before = _read_rapl()
+        start = perf_counter()
+        for k in range(n_images):
+            if kernel == 'rot':
+                cv.warpAffine(images[k], matrices[k], (image_size, image_size),
+                              dst=out[k], flags=cv.INTER_LINEAR,
+                              borderMode=cv.BORDER_REFLECT_101)
+            else:
+                cv.flip(images[k], 1 if kernel == 'hflip' else 0, dst=out[k])
+        seconds = perf_counter() - start
+        energy_after = _read_rapl()
+        if seconds < best:
+            best = seconds
+            best_energy = (None if None in (energy_before, energy_after) or
+                           energy_after < energy_before  # counter wrapped
+                           else (energy_after - energy_before) * 1e3)  # nJ
+
+    n_pixels = n_images * image_size**2
+    source = 'rapl' if best_energy is not None else 'constant power'
+    if best_energy is None:
+        best_energy = CPU_POWER * best * 1e9  # nJ
+    return {'seconds': best, 'time per pixel (ns)': best * 1e9 / n_pixels,
+            'energy per pixel (nJ)': best_energy / n_pixels,
+            'energy source': source}
+
+
+def _simulate_point(point):
+    """Prices one accelerator configuration (run in a worker process)."""
+    from cache import main
+    kernel, image_size, n_images, rows, ways, l1_size, options = point
+    try:
+        return main(kernel=kernel, image_size=image_size, n_images=n_images,
+                    l1_ways=ways, l2_ways=ways, l1_size=l1_size,
+                    parallelism=rows, verbose=False, **options)
+    except Exception as e:
+        print('Exception encountered w/ config=rows=%s, ways=%s; l1_size=%s'
+              '\nException:\n%s' % (rows, ways, l1_size, e))
+        return None
+
+
+def _filename(results_dir, kind, kernel, image_size, n_images, seed, ext,
+              suffix=''):
+    return os.path.join(results_dir, kind, '%s_%sx%s_seed%s%s.%s'
+                        '' % (kernel, n_images, image_size, seed, suffix, ext))
+
+
+def _search_suffix(grid, store_to_cache):
+    """Tells search tables of different search spaces apart."""
+    import hashlib
+    digest = hashlib.sha1(json.dumps(sorted(grid)).encode()).hexdigest()
+    return '_grid%s%s' % (digest[:10], '_store2cache' if store_to_cache else '')
+
+
+def _write_atomically(filename, write):
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_filename = '%s.%s.tmp' % (filename, os.getpid())
+    with open(tmp_filename, 'w') as f:
+        write(f)
+    os.rename(tmp_filename, filename)
+
+
+def compare(kernels, image_sizes, batch_sizes, seed=0, processes=1,
+            rows=ROWS, l1_sizes=L1_SIZES, ways=WAYS,
+            results_dir='results/cpu_vs_asic', counts_dir='results/counts',
+            repeats=3, store_to_cache=False, verbose=True):
+    """Measures the CPU and searches the accelerator configurations for
+    every workload (reusing stored results).
+
+    Returns
+    -------
+    table (list of dicts)
+        One row per workload, with its 'kernel', 'image_size', 'n_images',
+        the CPU result ('cpu', see `measure_cpu`) and the fastest and most
+        energy-efficient configurations ('time winner', 'energy winner',
+        dicts with `SEARCH_COLUMNS`).
+    """
+    workloads = [(k, s, n) for n in batch_sizes for s in image_sizes
+                 for k in kernels]
+
+    # CPU first, alone, so that simulations don't disturb the timing
+    cpu = {}
+    for kernel, size, n in workloads:
+        filename = _filename(results_dir, 'cpu', kernel, size, n, seed, 'json')
+        if os.path.exists(filename):
+            with open(filename) as f:
+                cpu[kernel, size, n] = json.load(f)
+            continue
+        if verbose:
+            print('measuring CPU: %s %sx%s' % (kernel, n, size))
+        result = measure_cpu(kernel, size, n, seed=seed, repeats=repeats)
+        _write_atomically(filename, lambda f: json.dump(result, f, indent=2))
+        cpu[kernel, size, n] = result
+
+    # accelerator searches not stored yet, all points in one pool
+    options = dict(seed=seed, counts_dir=counts_dir,
+                   store_to_cache=store_to_cache)
+    grid = [(r, w, l1) for r in rows for l1 in l1_sizes for w in ways]
+    suffix = _search_suffix(grid, store_to_cache)
+    missing = [wl for wl in workloads if not os.path.exists(
+        _filename(results_dir, 'asic', wl[0], wl[1], wl[2], seed, 'csv',
+                  suffix))]
+    points = [wl + g + (options,) for wl in missing for g in grid]
+    if points:
+        if verbose:
+            print('simulating %s configurations of %s workloads'
+                  '' % (len(points), len(missing)))
+        if processes > 1:
+            from multiprocessing import Pool
+            with Pool(processes) as pool:
+                priced = pool.map(_simulate_point, points, chunksize=1)
+        else:
+            priced = [_simulate_point(p) for p in points]
+        failed = []
+        for k, (kernel, size, n) in enumerate(missing):
+            results = priced[k * len(grid):(k + 1) * len(grid)]
+            rows_out = [(t, e, r, w, l1) for (r, w, l1), result
+                        in zip(grid, results) if result is not None
+                        for t, e in [result]]
+            if not rows_out:  # don't store a search that found nothing
+                failed.append('%s %sx%s' % (kernel, n, size))
+                continue
+
+            def write(f, rows_out=rows_out):
+                writer = csv.writer(f)
+                writer.writerow(SEARCH_COLUMNS)
+                writer.writerows(rows_out)
+            _write_atomically(_filename(results_dir, 'asic', kernel, size, n,
+                                        seed, 'csv', suffix), write)
+        if failed:
+            raise ValueError('No accelerator configuration of %s could be '
+                             'priced (see the exceptions above).'
+                             '' % ', '.join(failed))
+
+    table = []
+    for kernel, size, n in workloads:
+        with open(_filename(results_dir, 'asic', kernel, size, n, seed,
+                            'csv', suffix)) as f:
+            search = [dict(zip(SEARCH_COLUMNS, map(float, row)))
+                      for row in list(csv.reader(f))[1:]]
+        table.append({
+            'kernel': kernel, 'image_size': size, 'n_images': n,
+            'cpu': cpu[kernel, size, n], 'search': search,
+            'time winner': min(search, key=lambda r: (r[SEARCH_COLUMNS[0]],
+                                                      r[SEARCH_COLUMNS[1]])),
+            'energy winner': min(search, key=lambda r: (r[SEARCH_COLUMNS[1]],
+                                                        r[SEARCH_COLUMNS[0]]))})
+    return table
+
+
+def _config(result):
+    return 'rows=%d; ways=%d; l1_size=%d' % (result['rows'], result['ways'],
+                                             result['l1_size'])
+
+
+def write_table(table, filename):
+    """Writes `table` in the layout of cpu-vs-asic.csv (one block per
+    workload size), plus speedups (CPU / accelerator) and configurations."""
+    with open(filename, 'w') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        block = None
+        for row in table:
+            if (row['n_images'], row['image_size']) != block:
+                block = row['n_images'], row['image_size']
+                writer.writerow(['%sx%sx%s' % (block + (block[1],)),
+                                 'CPU baseline', 'time per pixel (ns)',
+                                 'CPU baseline', 'energy per pixel (nJ)',
+                                 'time speedup', 'energy ratio',
+                                 'time winner', 'energy winner'])
+            cpu_time = row['cpu']['time per pixel (ns)']
+            cpu_energy = row['cpu']['energy per pixel (nJ)']
+            time = row['time winner']['time per pixel (ns)']
+            energy = row['energy winner']['energy per pixel (nJ)']
+            writer.writerow([row['kernel'], cpu_time, time, cpu_energy, energy,
+                             cpu_time / time, cpu_energy / energy,
+                             _config(row['time winner']),
+                             _config(row['energy winner'])])
+
+
+def write_winners(table, filename, top_k=3):
+    """Writes the `top_k` configurations by time and by energy of each
+    workload, in the layout of winners.txt."""
+    with open(filename, 'w') as f:
+        for kernel in sorted(set(row['kernel'] for row in table)):
+            f.write('%s winners\n%s\n' % (kernel, '-' * 11))
+            for row in [r for r in table if r['kernel'] == kernel]:
+                for objective, key in (('time', 0), ('energy', 1)):
+                    f.write('%sx%s %s:\n' % (row['n_images'],
+                                             row['image_size'], objective))
+                    ranked = sorted(row['search'], key=lambda r: (
+                        r[SEARCH_COLUMNS[key]], r[SEARCH_COLUMNS[1 - key]]))
+                    for r in ranked[:top_k]:
+                        f.write('%s\t%s\t %s\n' % (r[SEARCH_COLUMNS[0]],
+                                                   r[SEARCH_COLUMNS[1]],
+                                                   _config(r)))
+                    f.write('\n')
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', '--kernels', nargs='+',
+                        default=['rot', 'hflip', 'vflip'])
+    parser.add_argument('-s', '--image_sizes', nargs='+', type=int,
+                        default=[250, 500])
+    parser.add_argument('-n', '--batch_sizes', nargs='+', type=int,
+                        default=[2])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--processes', type=int, default=1,
+                        help='Simulate in this many processes.')
+    parser.add_argument('--rows', nargs='+', type=int, default=ROWS)
+    parser.add_argument('--l1_sizes', nargs='+', type=int, default=L1_SIZES)
+    parser.add_argument('--ways', nargs='+', type=int, default=WAYS)
+    parser.add_argument('-r', '--repeats', type=int, default=3,
+                        help='Time the CPU this many times (fastest is used).')
+    parser.add_argument('--store_to_cache', default=False, action='store_true')
+    parser.add_argument('--results_dir', default='results/cpu_vs_asic',
+                        help='Where CPU results and search tables are stored.')
+    parser.add_argument('--counts_dir', default='results/counts')
+    parser.add_argument('-o', '--out', default='cpu-vs-asic.csv')
+    parser.add_argument('--winners', default=None,
+                        help='Also write the top configurations here.')
+    args = parser.parse_args()
+
+    table = compare(kernels=args.kernels, image_sizes=args.image_sizes,
+                    batch_sizes=args.batch_sizes, seed=args.seed,
+                    processes=args.processes, rows=args.rows,
+                    l1_sizes=args.l1_sizes, ways=args.ways,
+                    results_dir=args.results_dir, counts_dir=args.counts_dir,
+                    repeats=args.repeats, store_to_cache=args.store_to_cache)
+    write_table(table, args.out)
+    print('Wrote %s.' % args.out)
+    if args.winners is not None:
+        write_winners(table, args.winners)
+        print('Wrote %s.' % args.winners)
@@ -0,0 +1,319 @@
+"""A DDR3 main memory model: maps the lines the L2 reads and writes back
+onto channels, ranks, banks and rows, and prices them by row-buffer
+outcome.
+
+Defaults describe the cv-lab machine (see cv-lab-ddr3-info.txt): four
+single-rank DDR3-1600 (11-11-11) Micron UDIMMs, two per channel, with
+8 banks and an 8 KiB row per rank.  Timings and IDD currents are those of
+the MT4JTF25664AZ-1G6 (2GB) module in ddr3-datasheet.pdf (Table 12).
+Clock, burst length and geometry can instead be read from a CACTI main
+memory configuration such as ddr3-cvlab.cfg (see `DDR3Config.from_cacti_cfg`).
+
+Each access (one burst of `burst_length` x `bus_width` bytes) is a
+
+* row hit: the bank has the row open (CL, or CWL for writes),
+* row miss: the bank is precharged (tRCD + CL), or
+* row conflict: another row is open (tRP + tRCD + CL, plus tWR if the
+  open row was last written).
+
+With the 'open' page policy rows stay open until a conflict; with the
+'closed' policy every access precharges its bank afterwards, so every
+access is a row miss.  Energies follow the usual IDD-based accounting
+(Micron TN-41-01): activate/precharge, read and write bursts, plus
+background (standby) and refresh power over the run time.
+
+Usage
+-----
+* Price a workload with the open page policy (see `cache.main`)::
+
+    $ python cache.py rot 250 4 8 8 --dram open
+
+
+* Compare page policies and address mappings for a workload::
+
+    $ python dram.py rot 250 4 8 8 --mappings row:rank:bank:channel:column \
+          row:rank:bank:column:channel
+
+"""
+
+from __future__ import division, print_function
+import re
+
+EVENTS = ('read_hits', 'read_misses', 'read_conflicts',
+          'write_hits', 'write_misses', 'write_conflicts',
+          'conflicts_after_write')
+PAGE_POLICIES = ('open', 'closed')
+
+
+class DDR3Config(object):
+    """DRAM organization, timing (in clock cycles) and IDD currents (mA).
+
+    Parameters
+    ----------
+    channels, ranks, banks, rows (int)
+        Number of channels, ranks per channel, banks per rank and rows per
+        bank.
+    row_size (int)
+        Bytes per row (page) of a rank.
+    bus_width, burst_length (int)
+        Data bus width in bytes and burst length (so a burst moves
+        `bus_width * burst_length` bytes).
+    clock (float)
+        Bus clock in MHz (data moves on both edges).
+    mapping (string)
+        Fields of the address from most to least significant, e.g.
+        'row:rank:bank:channel:column' (consecutive rows of a bank are
+        `row_size * banks * ranks * channels` bytes apart).
+    max_outstanding (int)
+        Number of accesses in flight; time is the larger of the summed
+        latencies divided by this and the bus and bank occupancy.
+    """
+
+    def __init__(self, channels=2, ranks=2, banks=8, rows=32768,
+                 row_size=8192, bus_width=8, burst_length=8, clock=800,
+                 tCL=11, tCWL=8, tRCD=11, tRP=11, tRAS=28, tWR=12,
+                 tRFC=208, tREFI=6240, vdd=1.5, idd0=264, idd2n=112,
+                 idd3n=188, idd4r=940, idd4w=684, idd5b=620,
+                 mapping='row:rank:bank:channel:column', max_outstanding=1):
+        self.channels, self.ranks, self.banks = channels, ranks, banks
+        self.rows, self.row_size = rows, row_size
+        self.bus_width, self.burst_length = bus_width, burst_length
+        self.clock = clock
+        self.tCL, self.tCWL, self.tRCD, self.tRP = tCL, tCWL, tRCD, tRP
+        self.tRAS, self.tWR, self.tRFC, self.tREFI = tRAS, tWR, tRFC, tREFI
+        self.vdd = vdd
+        self.idd0, self.idd2n, self.idd3n = idd0, idd2n, idd3n
+        self.idd4r, self.idd4w, self.idd5b = idd4r, idd4w, idd5b
+        self.mapping = mapping
+        self.max_outstanding = max_outstanding
+
+    @classmethod
+    def from_cacti_cfg(cls, filename, **kwargs):
+        """Reads the bus clock, burst length, bank count and row size (page
+        size times devices per rank) of a CACTI main memory configuration;
+        everything else is as in `DDR3Config()` (or `kwargs`)."""
+        with open(filename) as f:
+            cfg = f.read()
+
+        def value(pattern):
+            match = re.search(r'^-%s\s+(\d+)' % pattern, cfg, re.MULTILINE)
+            return int(match.group(1)) if match else None
+
+        found = dict(clock=value(r'bus_freq'),
+                     burst_length=value(r'burst length'),
+                     banks=value(r'UCA bank count'))
+        page_bits, device_width = (value(r'page size \(bits\)'),
+                                   value(r'mem_data_width'))
+        if page_bits and device_width:
+            devices = 8 * cls().bus_width // device_width
+            found['row_size'] = page_bits // 8 * devices
+        found.update(kwargs)
+        return cls(**{k: v for k, v in found.items() if v is not None})
+
+    @property
+    def tCK(self):
+        """Clock period (ns)."""
+        return 1e3 / self.clock
+
+    @property
+    def burst_bytes(self):
+        return self.bus_width * self.burst_length
+
+    @property
+    def tBURST(self):
+        """Cycles a burst occupies the data bus (two beats per cycle)."""
+        return self.burst_length // 2
+
+    def field_sizes(self):
+        return {'row': self.rows, 'rank': self.ranks, 'bank': self.banks,
+                'channel': self.channels,
+                'column': self.row_size // self.burst_bytes}
+
+    def signature(self):
+        """Everything that determines how accesses are classified."""
+        return ('%sch-%sr-%sb-%srow-%sB-%s' % (
+            self.channels, self.ranks, self.banks, self.rows, self.row_size,
+            self.burst_bytes) + '-' + self.mapping.replace(':', '.'))
+
+
+class DRAMModel(object):
+    """Classifies main memory accesses by row-buffer outcome.
+
+    Instances are `cache_model.MainMemory` observers: they are called as
+    `dram(line, is_store)` with the index of each `line_size`-byte line
+    read from or written back to memory.
+    """
+
+    def __init__(self, config=None, page_policy='open', line_size=64):
+        if page_policy not in PAGE_POLICIES:
+            raise ValueError('Unknown page policy %r (expected one of %s).'
+                             '' % (page_policy, ', '.join(PAGE_POLICIES)))
+        self.config = config if config is not None else DDR3Config()
+        self.page_policy = page_policy
+        self.line_size = line_size
+        sizes = self.config.field_sizes()
+        self._fields = [(name, sizes[name]) for name in
+                        reversed(self.config.mapping.split(':'))]
+        n_banks = self.config.channels * self.config.ranks * self.config.banks
+        self.events = dict.fromkeys(EVENTS, 0)
+        self.channel_bursts = [0] * self.config.channels
+        self.bank_activates = [0] * n_banks
+        self.bank_bursts = [0] * n_banks
+        self.open_rows = {}  # bank -> (row, last access was a write)
+
+    def locate(self, addr):
+        """Returns {'channel', 'rank', 'bank', 'row', 'column'} of the
+        burst holding byte `addr`."""
+        burst = addr // self.config.burst_bytes
+        location = {}
+        for name, size in self._fields:
+            burst, location[name] = divmod(burst, size)
+        return location
+
+    def access(self, addr, is_store):
+        """Accounts one burst."""
+        where = self.locate(addr)
+        bank = ((where['channel'] * self.config.ranks + where['rank']) *
+                self.config.banks + where['bank'])
+        kind = 'write_' if is_store else 'read_'
+        open_row = self.open_rows.get(bank)
+        if open_row is None:
+            kind += 'misses'
+        elif open_row[0] == where['row']:
+            kind += 'hits'
+        else:
+            kind += 'conflicts'
+            if open_row[1]:
+                self.events['conflicts_after_write'] += 1
+        self.events[kind] += 1
+        if not kind.endswith('hits'):
+            self.bank_activates[bank] += 1
+        self.bank_bursts[bank] += 1
+        self.channel_bursts[where['channel']] += 1
+        if self.page_policy == 'open':
+            self.open_rows[bank] = (where['row'], is_store)
+
+    def __call__(self, line, is_store):
+        addr = line * self.line_size
+        for offset in range(0, self.line_size, self.config.burst_bytes):
+            self.access(addr + offset, is_store)
+
+    def counts(self):
+        """Returns the events so far (see `dram_cost`)."""
+        counts = dict(self.events)
+        counts.update(page_policy=self.page_policy,
+                      channel_bursts=list(self.channel_bursts),
+                      bank_activates=list(self.bank_activates),
+                      bank_bursts=list(self.bank_bursts))
+        return counts
+
+
+def dram_cost(counts, config=None):
+    """Prices the events of `DRAMModel.counts()`.
+
+    Returns
+    -------
+    cost (dict)
+        'time' and 'energy' (ns and nJ), and what they are made of:
+        'latency' (summed access latencies), 'bus_time' and 'bank_time'
+        (busiest channel's data bus and busiest bank's occupancy, i.e. the
+        bandwidth limits), 'activate_energy', 'read_energy', 'write_energy',
+        'background_energy' and 'refresh_energy'.
+    """
+    c = config if config is not None else DDR3Config()
+    tCK = c.tCK
+
+    # latency of each access (cycles)
+    read_hit = c.tCL + c.tBURST
+    write_hit = c.tCWL + c.tBURST
+    latency = (counts['read_hits'] * read_hit +
+               counts['read_misses'] * (c.tRCD + read_hit) +
+               counts['read_conflicts'] * (c.tRP + c.tRCD + read_hit) +
+               counts['write_hits'] * write_hit +
+               counts['write_misses'] * (c.tRCD + write_hit) +
+               counts['write_conflicts'] * (c.tRP + c.tRCD + write_hit) +
+               counts['conflicts_after_write'] * c.tWR) * tCK
+
+    # bandwidth limits: a bank activates at most once per tRC
+    tRC = c.tRAS + c.tRP
+    bus_time = max(counts['channel_bursts'] or [0]) * c.tBURST * tCK
+    bank_time = max([max(a * tRC, b * c.tBURST) for a, b in
+                     zip(counts['bank_activates'], counts['bank_bursts'])] or
+                    [0]) * tCK
+    time = max(latency / c.max_outstanding, bus_time, bank_time)
+    time /= 1 - c.tRFC / c.tREFI  # refresh blocks all banks
+
+    # energy per event (mA x ns x V = pJ, so scale to nJ), per rank
+    burst_ns = c.tBURST * tCK
+    activate = c.vdd * (c.idd0 * tRC * tCK -
+                        (c.idd3n * c.tRAS + c.idd2n * c.tRP) * tCK) / 1e3
+    read = c.vdd * (c.idd4r - c.idd3n) * burst_ns / 1e3
+    write = c.vdd * (c.idd4w - c.idd3n) * burst_ns / 1e3
+    standby = c.idd3n if counts['page_policy'] == 'open' else c.idd2n
+    n_ranks = c.channels * c.ranks
+    reads = (counts['read_hits'] + counts['read_misses'] +
+             counts['read_conflicts'])
+    writes = (counts['write_hits'] + counts['write_misses'] +
+              counts['write_conflicts'])
+    cost = {'latency': latency, 'bus_time': bus_time, 'bank_time': bank_time,
+            'time': time,
+            'activate_energy': sum(counts['bank_activates']) * activate,
+            'read_energy': reads * read,
+            'write_energy': writes * write,
+            'background_energy': n_ranks * c.vdd * standby * time / 1e3,
+            'refresh_energy': (n_ranks * c.vdd * (c.idd5b - c.idd3n) *
+                               c.tRFC / c.tREFI * time / 1e3)}
+    cost['energy'] = sum(v for k, v in cost.items() if k.endswith('_energy'))
+    return cost
+
+
+def row_hit_rate(counts):
+    """Fraction of accesses that hit an open row."""
+    hits = counts['read_hits'] + counts['write_hits']
+    total = hits + sum(counts[k] for k in ('read_misses', 'read_conflicts',
+                                           'write_misses', 'write_conflicts'))
+    return hits / total if total else None
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('kernel', help='which kernel (rot, hflip, or vflip).')
+    parser.add_argument('image_size', type=int, help='Width of (square) images.')
+    parser.add_argument('n_images', type=int, help='Number of images to process.')
+    parser.add_argument('l1_ways', type=int)
+    parser.add_argument('l2_ways', type=int)
+    parser.add_argument('-p', '--parallelism', type=int, default=1,
+                        help="Number of rows to process in parallel.")
+    parser.add_argument('--store_to_cache', default=False, action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--policies', nargs='+', default=list(PAGE_POLICIES),
+                        choices=PAGE_POLICIES)
+    parser.add_argument('--mappings', nargs='+',
+                        default=[DDR3Config().mapping])
+    parser.add_argument('--dram_cfg', default=None,
+                        help="Read clock and geometry from this CACTI main "
+                             "memory configuration (e.g. ddr3-cvlab.cfg).")
+    args = parser.parse_args()
+
+    from cache import simulate_counts
+    print('%-8s %-32s %9s %12s %12s %12s' % (
+        'policy', 'mapping', 'row hits', 'time (ns)', 'bus (ns)',
+        'energy (nJ)'))
+    for mapping in args.mappings:
+        if args.dram_cfg is None:
+            config = DDR3Config(mapping=mapping)
+        else:
+            config = DDR3Config.from_cacti_cfg(args.dram_cfg, mapping=mapping)
+        for policy in args.policies:
+            counts = simulate_counts(args.kernel, args.image_size,
+                                     args.n_images, args.l1_ways, args.l2_ways,
+                                     parallelism=args.parallelism,
+                                     store_to_cache=args.store_to_cache,
+                                     seed=args.seed, dram=policy,
+                                     dram_config=config)
+            cost = dram_cost(counts['DRAM'], config)
+            print('%-8s %-32s %9.3f %12.1f %12.1f %12.1f' % (
+                policy, mapping, row_hit_rate(counts['DRAM']), cost['time'],
+                cost['bus_time'], cost['energy']))
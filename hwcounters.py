@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""Hardware performance counters for measuring regions of a Python process.
+
+Two ways of restricting counters to the measured region are supported:
+
+* `PerfCounters` opens the counters itself with the `perf_event_open`
+  syscall, so each region gets its own counts (no `perf` binary needed)::
+
+    counters = PerfCounters(['cycles', 'instructions', 'LLC-load-misses'])
+    with counters:
+        do_work()
+    print(counters.read())
+
+* `PerfControl` toggles an outer `perf stat` through its control FIFOs, so
+  that `perf stat` only counts the regions in between::
+
+    $ mkfifo ctl.fifo ack.fifo
+    $ perf stat -D -1 --control fifo:ctl.fifo,ack.fifo -e cycles \\
+          python sweep.py ... --perf_control ctl.fifo ack.fifo
+
+Counts are scaled for multiplexing (value * time enabled / time running).
+Events the host does not support (e.g. in a VM or container) are reported
+as None.
+
+`PerfCounters` count the calling thread and the threads it creates after
+the counters are opened (perf's `inherit` bit), not threads that already
+exist.  Open the counters before OpenCV first spawns its thread pool (on
+its first parallel call, not on import), or run counted OpenCV calls with
+`cv.setNumThreads(1)` (as calibrate.py and `benchmark.tiling_report` do),
+otherwise work done on the pool's threads is not counted.
+"""
+
+from __future__ import division, print_function
+import os
+import sys
+import ctypes
+import struct
+import platform
+from errno import EACCES, EPERM
+
+
+_SYSCALL_NUMBERS = {'x86_64': 298, 'i386': 336, 'i686': 336,
+                    'aarch64': 241, 'armv7l': 364, 'ppc64le': 319}
+
+# perf_event_attr.type
+PERF_TYPE_HARDWARE = 0
+PERF_TYPE_SOFTWARE = 1
+PERF_TYPE_HW_CACHE = 3
+
+# ioctls
+PERF_EVENT_IOC_ENABLE = 0x2400
+PERF_EVENT_IOC_DISABLE = 0x2401
+PERF_EVENT_IOC_RESET = 0x2403
+
+PERF_FORMAT_TOTAL_TIME_ENABLED = 1
+PERF_FORMAT_TOTAL_TIME_RUNNING = 2
+PERF_FLAG_FD_CLOEXEC = 8
+
+
+def _hw_cache_config(cache, op, result):
+    caches = {'L1D': 0, 'L1I': 1, 'LL': 2, 'DTLB': 3}
+    ops = {'READ': 0, 'WRITE': 1, 'PREFETCH': 2}
+    results = {'ACCESS': 0, 'MISS': 1}
+    return caches[cache] | (ops[op] << 8) | (results[result] << 16)
+
+
+# event names follow `perf list`
+EVENTS = {
+    'cycles': (PERF_TYPE_HARDWARE, 0),
+    'instructions': (PERF_TYPE_HARDWARE, 1),
+    'cache-references': (PERF_TYPE_HARDWARE, 2),
+    'cache-misses': (PERF_TYPE_HARDWARE, 3),
+    'branches': (PERF_TYPE_HARDWARE, 4),
+    'branch-misses': (PERF_TYPE_HARDWARE, 5),
+    'task-clock': (PERF_TYPE_SOFTWARE, 1),
+    'page-faults': (PERF_TYPE_SOFTWARE, 2),
+    'context-switches': (PERF_TYPE_SOFTWARE, 3),
+    'cpu-migrations': (PERF_TYPE_SOFTWARE, 4),
+    'L1-dcache-loads': (PERF_TYPE_HW_CACHE,
+                        _hw_cache_config('L1D', 'READ', 'ACCESS')),
+    'L1-dcache-load-misses': (PERF_TYPE_HW_CACHE,
+                              _hw_cache_config('L1D', 'READ', 'MISS')),
+    'LLC-loads': (PERF_TYPE_HW_CACHE, _hw_cache_config('LL', 'READ', 'ACCESS')),
+    'LLC-load-misses': (PERF_TYPE_HW_CACHE,
+                        _hw_cache_config('LL', 'READ', 'MISS')),
+    'LLC-stores': (PERF_TYPE_HW_CACHE,
+                   _hw_cache_config('LL', 'WRITE', 'ACCESS')),
+    'LLC-store-misses': (PERF_TYPE_HW_CACHE,
+                         _hw_cache_config('LL', 'WRITE', 'MISS')),
+    'LLC-prefetch-misses': (PERF_TYPE_HW_CACHE,
+                            _hw_cache_config('LL', 'PREFETCH', 'MISS')),
+}
+
+DEFAULT_EVENTS = ('task-clock', 'page-faults', 'cycles', 'instructions',
+                  'LLC-loads', 'LLC-load-misses', 'LLC-stores',
+                  'LLC-store-misses', 'cache-references', 'cache-misses',
+                  'branches', 'branch-misses')
+
+
+class _PerfEventAttr(ctypes.Structure):
+    """The first PERF_ATTR_SIZE_VER0 (64) bytes of `struct perf_event_attr`."""
+    _fields_ = [('type', ctypes.c_uint32),
+                ('size', ctypes.c_uint32),
+                ('config', ctypes.c_uint64),
+                ('sample_period', ctypes.c_uint64),
+                ('sample_type', ctypes.c_uint64),
+                ('read_format', ctypes.c_uint64),
+                ('flags', ctypes.c_uint64),
+                ('wakeup_events', ctypes.c_uint32),
+                ('bp_type', ctypes.c_uint32),
+                ('config1', ctypes.c_uint64)]
+
+
+# bits of perf_event_attr.flags
+_DISABLED, _INHERIT, _EXCLUDE_KERNEL, _EXCLUDE_HV = (1 << 0, 1 << 1, 1 << 5,
+                                                     1 << 6)
+
+_libc = None
+
+
+def _perf_event_open(event_type, config, exclude_kernel):
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+    attr = _PerfEventAttr()
+    attr.type = event_type
+    attr.size = ctypes.sizeof(_PerfEventAttr)
+    attr.config = config
+    attr.read_format = (PERF_FORMAT_TOTAL_TIME_ENABLED |
+                        PERF_FORMAT_TOTAL_TIME_RUNNING)
+    attr.flags = _DISABLED | _INHERIT | (_EXCLUDE_KERNEL | _EXCLUDE_HV
+                                         if exclude_kernel else 0)
+    fd = _libc.syscall(_SYSCALL_NUMBERS[platform.machine()], ctypes.byref(attr),
+                       0, -1, -1, PERF_FLAG_FD_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    return fd
+
+
+class PerfCounters(object):
+    """Counts hardware/software events of this process over chosen regions
+    (of this thread and threads created after the counters are opened).
+
+    Parameters
+    ----------
+    events (list of strings)
+        Event names (see `EVENTS`).
+    exclude_kernel (bool or None)
+        Only count user space.  By default kernel events are counted if
+        `perf_event_paranoid` allows it (as `perf stat` does).
+    """
+
+    def __init__(self, events=DEFAULT_EVENTS, exclude_kernel=None):
+        self.events = list(events)
+        self.fds = {}
+        self.unavailable = {}
+        if platform.machine() not in _SYSCALL_NUMBERS:
+            self.unavailable = dict.fromkeys(self.events, 'unsupported arch')
+            return
+        for event in self.events:
+            event_type, config = EVENTS[event]
+            try:
+                if exclude_kernel is None:
+                    try:
+                        fd = _perf_event_open(event_type, config, False)
+                    except OSError as e:
+                        if e.errno not in (EACCES, EPERM):
+                            raise
+                        fd = _perf_event_open(event_type, config, True)
+                else:
+                    fd = _perf_event_open(event_type, config, exclude_kernel)
+                self.fds[event] = fd
+            except OSError as e:
+                self.unavailable[event] = e.strerror
+
+    @property
+    def available(self):
+        return bool(self.fds)
+
+    def _ioctl(self, request):
+        import fcntl
+        for fd in self.fds.values():
+            fcntl.ioctl(fd, request, 0)
+
+    def start(self):
+        """Resets and enables all counters."""
+        self._ioctl(PERF_EVENT_IOC_RESET)
+        self._ioctl(PERF_EVENT_IOC_ENABLE)
+
+    def stop(self):
+        """Disables all counters (their values can then be `read`)."""
+        self._ioctl(PERF_EVENT_IOC_DISABLE)
+
+    def read(self):
+        """Returns a dictionary of (scaled) counts, None if unavailable."""
+        counts = dict.fromkeys(self.events)
+        for event, fd in self.fds.items():
+            value, enabled, running = struct.unpack('QQQ', os.read(fd, 24))
+            counts[event] = (int(round(value * enabled / running))
+                             if running else 0)
+        return counts
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class PerfControl(object):
+    """Enables/disables an outer `perf stat --control fifo:CTL,ACK`."""
+
+    def __init__(self, ctl_fifo, ack_fifo):
+        self._ctl = os.open(ctl_fifo, os.O_WRONLY)
+        self._ack = os.open(ack_fifo, os.O_RDONLY)
+
+    def _send(self, command):
+        os.write(self._ctl, command.encode() + b'\n')
+        ack = os.read(self._ack, 5)
+        if not ack.startswith(b'ack'):
+            print('Warning: unexpected perf control reply %r' % ack,
+                  file=sys.stderr)
+
+    def start(self):
+        self._send('enable')
+
+    def stop(self):
+        self._send('disable')
+
+    def close(self):
+        os.close(self._ctl)
+        os.close(self._ack)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    # report which events are usable on this host
+    counters = PerfCounters(list(EVENTS))
+    with counters:
+        sum(range(10**6))
+    for event, count in sorted(counters.read().items()):
+        print('%25s  %s' % (event, count if count is not None
+                            else 'unavailable (%s)' % counters.unavailable[event]))
+    counters.close()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""Classifies L1 and L2 misses as compulsory, capacity or conflict misses.
+
+Every miss of the simulated hierarchy (see `cache_model.py`) is classified
+with the usual "3C" model:
+
+* compulsory: the line was never accessed before at this level,
+* capacity: a fully associative LRU cache of the same capacity (fed the
+  same accesses) would also have missed,
+* conflict: everything else, i.e. misses due to limited associativity.
+
+Per-set access and miss counts are written to CSV, and per-set misses over
+time (in bins of output row sets) are written as .npy heatmaps of shape
+(time bins, sets) -- so set thrashing shows up as bright columns.
+
+Usage
+-----
+* Why does direct-mapped beat 2-way at L1 = 4 KiB for rot on 2x500?::
+
+    $ python miss_analysis.py rot 500 2 1 1 --l1_size 4096 -o results/misses/rot_dm
+    $ python miss_analysis.py rot 500 2 2 2 --l1_size 4096 -o results/misses/rot_2way --plot
+
+"""
+
+from __future__ import division, print_function
+import os
+import csv
+from collections import OrderedDict
+import numpy as np
+from cache import iterate_accesses, generator_dict
+from cache_model import create_hierarchy, geometry
+
+MISS_CLASSES = ('compulsory', 'capacity', 'conflict')
+
+
+class MissClassifier(object):
+    """Observer (see `cache_model.CacheLevel`) classifying one level's misses.
+
+    Set `bin` to the current time bin to accumulate the per-set heatmap.
+    """
+
+    def __init__(self, sets, capacity_lines):
+        self.sets = sets
+        self.capacity_lines = capacity_lines
+        self.seen = set()
+        self.shadow = OrderedDict()  # fully associative LRU, same capacity
+        self.set_accesses = [0] * sets
+        self.set_misses = {c: [0] * sets for c in MISS_CLASSES}
+        self.heatmap = {}
+        self.bin = 0
+
+    def __call__(self, line, set_index, hit, is_store):
+        shadow = self.shadow
+        self.set_accesses[set_index] += 1
+        if not hit:
+            if line not in self.seen:
+                miss_class = 'compulsory'
+                self.seen.add(line)
+            elif line not in shadow:
+                miss_class = 'capacity'
+            else:
+                miss_class = 'conflict'
+            self.set_misses[miss_class][set_index] += 1
+            row = self.heatmap.get(self.bin)
+            if row is None:
+                row = self.heatmap[self.bin] = [0] * self.sets
+            row[set_index] += 1
+
+        if line in shadow:
+            shadow.move_to_end(line)
+        else:
+            shadow[line] = None
+            if len(shadow) > self.capacity_lines:
+                shadow.popitem(last=False)
+
+    def totals(self):
+        totals = {c: sum(self.set_misses[c]) for c in MISS_CLASSES}
+        totals['accesses'] = sum(self.set_accesses)
+        totals['misses'] = sum(totals[c] for c in MISS_CLASSES)
+        return totals
+
+    def heatmap_array(self):
+        """Returns misses per (time bin, set) as an array."""
+        n_bins = max(self.heatmap) + 1 if self.heatmap else 0
+        heatmap = np.zeros((n_bins, self.sets), dtype='int64')
+        for b, row in self.heatmap.items():
+            heatmap[b] = row
+        return heatmap
+
+
+def classify_misses(kernel, image_size, n_images, l1_ways, l2_ways,
+                    parallelism=1, l1_block_size=64, l2_block_size=64,
+                    l1_size=32768, l2_size=2097152, store_to_cache=False,
+                    rows_per_bin=1):
+    """Simulates the workload and classifies every L1 and L2 miss.
+
+    Returns
+    -------
+    classifiers (dict)
+        The `MissClassifier` of each level ('L1', 'L2').
+    hierarchy (cache_model.CacheHierarchy)
+        The simulated hierarchy (for its aggregate statistics).
+    """
+    l1_sets, l1_assoc = geometry(l1_ways, l1_block_size, l1_size)
+    l2_sets, l2_assoc = geometry(l2_ways, l2_block_size, l2_size)
+    classifiers = {'L1': MissClassifier(l1_sets, l1_sets * l1_assoc),
+                   'L2': MissClassifier(l2_sets, l2_sets * l2_assoc)}
+    hierarchy = create_hierarchy(l1_ways=l1_ways, l1_block_size=l1_block_size,
+                                 l1_size=l1_size, l2_ways=l2_ways,
+                                 l2_block_size=l2_block_size, l2_size=l2_size,
+                                 l1_observer=classifiers['L1'],
+                                 l2_observer=classifiers['L2'])
+
+    trace = iterate_accesses(generator_dict[kernel], (image_size,) * 2,
+                             n_images, parallelism=parallelism,
+                             store_to_cache=store_to_cache)
+    pixels_per_bin = image_size * parallelism * rows_per_bin
+    l1 = hierarchy.first_level
+    load, store = l1.load, l1.store
+    for i, (loads, stores) in enumerate(trace):
+        if i % pixels_per_bin == 0:
+            classifiers['L1'].bin = classifiers['L2'].bin = i // pixels_per_bin
+        for addr in loads:
+            load(addr, 3)
+        if stores is not None:
+            for addr in stores:
+                store(addr, 3)
+    return classifiers, hierarchy
+
+
+def write_results(classifiers, out_prefix, plot=False):
+    """Writes per-set counts (CSV) and heatmaps (.npy, optionally .png)."""
+    out_dir = os.path.dirname(out_prefix)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    with open(out_prefix + '_sets.csv', 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(('level', 'set', 'accesses', 'misses') + MISS_CLASSES)
+        for level, c in sorted(classifiers.items()):
+            for s in range(c.sets):
+                misses = [c.set_misses[m][s] for m in MISS_CLASSES]
+                writer.writerow([level, s, c.set_accesses[s], sum(misses)] +
+                                misses)
+
+    for level, c in sorted(classifiers.items()):
+        heatmap = c.heatmap_array()
+        np.save('%s_%s_heatmap.npy' % (out_prefix, level), heatmap)
+        if plot and heatmap.size:
+            from matplotlib import pyplot as plt
+            fig, ax = plt.subplots(figsize=(8, 6))
+            im = ax.imshow(heatmap, aspect='auto', interpolation='nearest',
+                           cmap='magma')
+            ax.set_xlabel('%s set' % level)
+            ax.set_ylabel('Time (output row sets)')
+            ax.set_title('%s misses per set' % level)
+            fig.colorbar(im, ax=ax)
+            fig.tight_layout()
+            fig.savefig('%s_%s_heatmap.png' % (out_prefix, level))
+            plt.close(fig)
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('kernel', help='which kernel (rot, hflip, or vflip).')
+    parser.add_argument('image_size', type=int, help='Width of (square) images.')
+    parser.add_argument('n_images', type=int, help='Number of images to process.')
+    parser.add_argument('l1_ways', type=int)
+    parser.add_argument('l2_ways', type=int)
+    parser.add_argument('--l1_block_size', type=int, default=64)
+    parser.add_argument('--l2_block_size', type=int, default=64)
+    parser.add_argument('--l1_size', type=int, default=32768)
+    parser.add_argument('--l2_size', type=int, default=2097152)
+    parser.add_argument('-p', '--parallelism', type=int, default=1,
+                        help="Number of rows to process in parallel.")
+    parser.add_argument('--store_to_cache', default=False, action='store_true')
+    parser.add_argument('--rows_per_bin', type=int, default=1,
+                        help="Output row sets per heatmap time bin.")
+    parser.add_argument('-o', '--out_prefix', default=None,
+                        help="Write per-set CSV and heatmaps with this prefix.")
+    parser.add_argument('--plot', default=False, action='store_true',
+                        help="Also save heatmaps as .png files.")
+    args = vars(parser.parse_args())
+    out_prefix, plot = args.pop('out_prefix'), args.pop('plot')
+
+    classifiers, hierarchy = classify_misses(**args)
+    for level in ('L1', 'L2'):
+        totals = classifiers[level].totals()
+        print('%s: %s accesses, %s misses' % (level, totals['accesses'],
+                                              totals['misses']))
+        for c in MISS_CLASSES:
+            print('    %-10s %10s (%.1f%%)'
+                  '' % (c, totals[c], 100 * totals[c] / max(totals['misses'], 1)))
+    if out_prefix is not None:
+        write_results(classifiers, out_prefix, plot=plot)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""Several image streams processed concurrently, each on its own unit
+with a private L1, all sharing one L2 (and DRAM).
+
+Each stream runs its own kernel over its own batch of images (in its own
+part of memory, laid out as `cache.iterate_accesses` lays out a batch).
+Streams take turns, `granularity` output pixels at a time, so that the
+shared L2 sees their accesses interleaved.  Events at the L2 and DRAM are
+charged to the stream whose turn caused them (e.g. a write-back of
+another stream's line evicted by this stream's miss).
+
+Interference misses are the L2 misses a stream suffers when sharing,
+minus those it suffers with the whole L2 to itself (same L1).
+
+Costs are priced per stream and in aggregate with `cache.price` (CACTI
+for L1 and L2, the DRAM constants for DRAM); as in `cache.main`, time is
+the sum of access times, not a throughput.
+
+Usage
+-----
+* Two rotations and a horizontal flip sharing an L2, a row at a time::
+
+    $ python multistream.py rot rot hflip 100 2 8 8 --granularity 100 \\
+          --seed 0
+
+
+* Same for several L2 sizes::
+
+    $ python multistream.py rot rot hflip 100 2 8 8 --granularity 100 \\
+          --seed 0 --l2_sizes 65536 262144 1048576
+
+"""
+
+from __future__ import division, print_function
+from random import seed as random_seed
+from cache import (generator_dict, is_random, iterate_accesses,
+                   pixel_address, price)
+from cache_model import CacheLevel, MainMemory, geometry
+from replacement import create_policy
+
+COUNTERS = ('LOAD_count', 'STORE_count', 'HIT_count', 'MISS_count',
+            'EVICT_count')
+
+
+def _replay_generator(drawn):
+    """A transform generator returning `drawn[k]` (a generator's
+    `(interp_nec, transform)`) for image k."""
+    drawn = iter(drawn)
+
+    def generator(image_dimensions):
+        return next(drawn)
+    return generator
+
+
+def _offset_lookup(base):
+    def address_lookup(x, y, w, offset=0, pixel_size=3):
+        return pixel_address(x, y, w, offset + base, pixel_size)
+    return address_lookup
+
+
+def stream_traces(kernels, image_size, n_images, parallelism=1,
+                  store_to_cache=False, drawn=None):
+    """Returns a function returning a fresh trace (see
+    `cache.iterate_accesses`) of each stream.
+
+    Stream s works on its own batch of `n_images` images, placed after
+    those of stream s - 1; streams of random kernels ('rot', 'ssr')
+    replay their pre-drawn transforms `drawn[s]`, so that every trace of a
+    stream processes the same images.
+    """
+    span = 2 * n_images * image_size**2 * 3  # reads and writes of a batch
+
+    def trace(s):
+        kernel = kernels[s]
+        generator = (_replay_generator(drawn[s]) if is_random(kernel)
+                     else generator_dict[kernel])
+        return iterate_accesses(generator, (image_size,) * 2, n_images,
+                                parallelism=parallelism,
+                                address_lookup=_offset_lookup(s * span),
+                                store_to_cache=store_to_cache)
+    return trace
+
+
+def _hierarchy(n_l1s, l1_ways, l1_block_size, l1_size, l2_ways,
+               l2_block_size, l2_size, l1_policy='LRU', l2_policy='LRU',
+               seed=None):
+    """Returns (private L1s, shared L2, main memory)."""
+    mem = MainMemory()
+    l2_sets, l2_ways = geometry(l2_ways, l2_block_size, l2_size)
+    l2 = CacheLevel('L2', l2_sets, l2_ways, l2_block_size, load_from=mem,
+                    store_to=mem,
+                    policy=create_policy(l2_policy, l2_sets, l2_ways, seed))
+    l1_sets, l1_ways = geometry(l1_ways, l1_block_size, l1_size)
+    l1s = [CacheLevel('L1', l1_sets, l1_ways, l1_block_size, load_from=l2,
+                      store_to=l2,
+                      policy=create_policy(l1_policy, l1_sets, l1_ways, seed))
+           for _ in range(n_l1s)]
+    return l1s, l2, mem
+
+
+def _counts(l1, l2, mem):
+    """Stats dicts (or dicts of `COUNTERS`) in `cache.simulate_counts`'
+    format."""
+    counts = {name: {'loads': s['LOAD_count'], 'stores': s['STORE_count'],
+                     'hits': s['HIT_count'], 'misses': s['MISS_count'],
+                     'writebacks': s['EVICT_count']}
+              for name, s in (('L1', l1), ('L2', l2))}
+    counts['DRAM'] = {'loads': mem['LOAD_count'], 'stores': mem['STORE_count']}
+    return counts
+
+
+def simulate_streams(traces, n_streams, granularity=1, **hierarchy):
+    """Interleaves the traces of `n_streams` streams (`traces(s)` returns
+    a fresh trace of stream s), `granularity` output pixels per turn,
+    through private L1s and a shared L2.
+
+    Returns
+    -------
+    counts (list of dicts)
+        The counts of each stream (see `cache.simulate_counts`), L2 and
+        DRAM events charged to the stream whose turn caused them.
+    """
+    l1s, l2, mem = _hierarchy(n_streams, **hierarchy)
+    shared = [{c: 0 for c in COUNTERS} for _ in range(n_streams)]
+    memory = [{c: 0 for c in COUNTERS} for _ in range(n_streams)]
+    traces = [iter(traces(s)) for s in range(n_streams)]
+    active = list(range(n_streams))
+    while active:
+        for s in list(active):
+            l1 = l1s[s]
+            l2_before, mem_before = l2.stats(), mem.stats()
+            for pixel in range(granularity):
+                access = next(traces[s], None)
+                if access is None:
+                    active.remove(s)
+                    break
+                loads, stores = access
+                for addr in loads:
+                    l1.load(addr, 3)
+                if stores is not None:
+                    for addr in stores:
+                        l1.store(addr, 3)
+            l2_after, mem_after = l2.stats(), mem.stats()
+            for c in COUNTERS:
+                shared[s][c] += l2_after[c] - l2_before[c]
+                memory[s][c] += mem_after[c] - mem_before[c]
+    return [_counts(l1s[s].stats(), shared[s], memory[s])
+            for s in range(n_streams)]
+
+
+def _add(counts):
+    total = {}
+    for level in ('L1', 'L2', 'DRAM'):
+        total[level] = {key: sum(c[level][key] for c in counts)
+                        for key in counts[0][level]}
+    return total
+
+
+def main(kernels, image_size, n_images, l1_ways, l2_ways, granularity=1,
+         parallelism=1, l1_block_size=64, l2_block_size=64, l1_size=32768,
+         l2_size=2097152, store_to_cache=False, l1_policy='LRU',
+         l2_policy='LRU', seed=None, technology=None, verbose=True):
+    """Simulates `kernels` (one stream each) sharing an L2 and prices them.
+
+    Returns
+    -------
+    report (dict)
+        'streams': per stream, its 'kernel', 'time per pixel (ns)',
+        'energy per pixel (nJ)', 'L2 misses', 'solo L2 misses' and
+        'interference misses'; 'aggregate': the same over all streams.
+    """
+    if seed is not None:
+        random_seed(seed)
+    drawn = [[generator_dict[kernel]((image_size,) * 2)
+               for _ in range(n_images)]
+             if is_random(kernel) else None for kernel in kernels]
+    traces = stream_traces(kernels, image_size, n_images,
+                           parallelism=parallelism,
+                           store_to_cache=store_to_cache, drawn=drawn)
+    hierarchy = dict(l1_ways=l1_ways, l1_block_size=l1_block_size,
+                     l1_size=l1_size, l2_ways=l2_ways,
+                     l2_block_size=l2_block_size, l2_size=l2_size,
+                     l1_policy=l1_policy, l2_policy=l2_policy, seed=seed)
+    pricing = dict(image_size=image_size, l1_ways=l1_ways, l2_ways=l2_ways,
+                   l1_block_size=l1_block_size, l2_block_size=l2_block_size,
+                   l1_size=l1_size, l2_size=l2_size, technology=technology)
+
+    counts = simulate_streams(traces, len(kernels), granularity, **hierarchy)
+    streams = []
+    for s, kernel in enumerate(kernels):
+        solo = simulate_streams(lambda _: traces(s), 1, granularity,
+                                **hierarchy)[0]
+        time_pp, energy_pp = price(counts[s], n_images=n_images, **pricing)
+        misses = counts[s]['L2']['misses']
+        streams.append({'kernel': kernel, 'time per pixel (ns)': time_pp,
+                        'energy per pixel (nJ)': energy_pp,
+                        'L2 misses': misses,
+                        'solo L2 misses': solo['L2']['misses'],
+                        'interference misses':
+                            misses - solo['L2']['misses']})
+    time_pp, energy_pp = price(_add(counts), n_images=n_images * len(kernels),
+                               **pricing)
+    aggregate = {'kernel': '+'.join(kernels), 'time per pixel (ns)': time_pp,
+                 'energy per pixel (nJ)': energy_pp}
+    for key in ('L2 misses', 'solo L2 misses', 'interference misses'):
+        aggregate[key] = sum(stream[key] for stream in streams)
+
+    if verbose:
+        columns = ('time per pixel (ns)', 'energy per pixel (nJ)',
+                   'L2 misses', 'solo L2 misses', 'interference misses')
+        print()
+        print('%-8s %-14s %16s %16s %10s %14s %19s'
+              '' % (('stream', 'kernel') + tuple(c.split(' (')[0]
+                                                 for c in columns)))
+        for name, row in (list(enumerate(streams)) + [('all', aggregate)]):
+            print('%-8s %-14s %16.6g %16.6g %10s %14s %19s'
+                  '' % ((name, row['kernel']) +
+                        tuple(row[c] for c in columns)))
+    return {'streams': streams, 'aggregate': aggregate}
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    from replacement import POLICIES
+    parser = argparse.ArgumentParser()
+    parser.add_argument('kernels', nargs='+',
+                        help='Kernel of each stream (rot, ssr, hflip, or vflip).')
+    parser.add_argument('image_size', type=int, help='Width of (square) images.')
+    parser.add_argument('n_images', type=int,
+                        help='Number of images each stream processes.')
+    parser.add_argument('l1_ways', type=int)
+    parser.add_argument('l2_ways', type=int)
+    parser.add_argument('-g', '--granularity', type=int, default=1,
+                        help='Output pixels a stream processes per turn.')
+    parser.add_argument('--l1_block_size', type=int, default=64)
+    parser.add_argument('--l2_block_size', type=int, default=64)
+    parser.add_argument('--l1_size', type=int, default=32768)
+    parser.add_argument('--l2_sizes', nargs='+', type=int, default=[2097152],
+                        help='Shared L2 sizes to simulate.')
+    parser.add_argument('-p', '--parallelism', type=int, default=1,
+                        help="Number of rows to process in parallel.")
+    parser.add_argument('--store_to_cache', default=False, action='store_true')
+    parser.add_argument('--l1_policy', default='LRU',
+                        choices=[p for p in POLICIES if p != 'OPT'])
+    parser.add_argument('--l2_policy', default='LRU',
+                        choices=[p for p in POLICIES if p != 'OPT'])
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed the random rotation (and ssr) parameters.")
+    parser.add_argument('--technology', type=float, default=None,
+                        help="CACTI technology node in microns.")
+    args = vars(parser.parse_args())
+
+    for l2_size in args.pop('l2_sizes'):
+        print('\nL2 size: %s' % l2_size)
+        main(l2_size=l2_size, **args)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""Pareto frontiers of cache simulator results (see `cache.main`).
+
+A configuration is on the frontier if no other configuration is at least as
+good in every objective (time per pixel, energy per pixel and, optionally,
+cache area from CACTI) and strictly better in one.  Both the two and three
+objective frontiers are computed by sorting on the first objective and
+sweeping once.  The two objective sweep is O(n log n).  The three objective
+sweep does O(n log n) comparisons, but its staircase is a Python list, so
+inserting a step moves O(n) elements and the sweep is O(n^2) in the worst
+case (a frontier of n points).
+
+Usage
+-----
+* Frontier of a results CSV (as written by `run_cache_experiment.py`)::
+
+    $ python pareto.py rot_2x500.csv -o rot_2x500_frontier.csv
+
+
+* With L1 + L2 area (mm^2, from CACTI) as a third objective::
+
+    $ python pareto.py rot_2x500.csv -o rot_2x500_frontier.csv --area
+
+"""
+
+from __future__ import division, print_function
+from bisect import bisect_right
+import numpy as np
+
+TIME_COLUMN = 'time per pixel (ns)'
+ENERGY_COLUMN = 'energy per pixel (nJ)'
+AREA_COLUMN = 'area (mm2)'
+
+
+def pareto_front_2d(x, y):
+    """Returns the indices of the points (x[i], y[i]) on the frontier
+    (minimizing both), ordered by increasing x.
+
+    Of identical points, only one is kept.
+    """
+    order = np.lexsort((y, x))
+    front = []
+    best_y = np.inf
+    for i in order:
+        if y[i] < best_y:
+            front.append(i)
+            best_y = y[i]
+    return np.array(front, dtype='int64')
+
+
+def pareto_front_3d(x, y, z):
+    """Returns the indices of the points (x[i], y[i], z[i]) on the frontier
+    (minimizing all three), ordered by increasing x.
+
+    Points are swept in order of increasing x while keeping the (y, z)
+    frontier of the points seen so far as a staircase (y increasing, z
+    decreasing); a point is dominated iff the staircase step at its y is at
+    or below its z.  Of identical points, only one is kept.  Each step is
+    removed at most once, but list insertions make this O(n^2) in the worst
+    case.
+    """
+    order = np.lexsort((z, y, x))
+    front = []
+    stair_y, stair_z = [], []
+    for i in order:
+        yi, zi = y[i], z[i]
+        k = bisect_right(stair_y, yi)
+        if k > 0 and stair_z[k - 1] <= zi:
+            continue
+        front.append(i)
+
+        # remove the steps this point dominates, then insert it
+        j = k
+        while j < len(stair_y) and stair_z[j] >= zi:
+            j += 1
+        stair_y[k:j] = [yi]
+        stair_z[k:j] = [zi]
+    return np.array(front, dtype='int64')
+
+
+def pareto_front(data_frame, objectives=(TIME_COLUMN, ENERGY_COLUMN)):
+    """Returns the rows of `data_frame` on the frontier of `objectives`
+    (two or three column names, all minimized)."""
+    columns = [data_frame[c].to_numpy(dtype='float64') for c in objectives]
+    if len(columns) == 2:
+        front = pareto_front_2d(*columns)
+    elif len(columns) == 3:
+        front = pareto_front_3d(*columns)
+    else:
+        raise ValueError('Expected two or three objectives, got %s.'
+                         '' % len(columns))
+    return data_frame.iloc[front]
+
+
+def cache_area(ways, size, block_size=64, l2_size=2097152, l2_ways=None,
+               l2_block_size=64, technology=None):
+    """L1 + L2 area (mm^2) from CACTI, as `run_cache_experiment.py`
+    configures them (the L2 has the same associativity as the L1 unless
+    `l2_ways` is given)."""
+    from cache import get_cacti_area
+    if l2_ways is None:
+        l2_ways = ways
+    return (get_cacti_area(ways, block_size, size, technology=technology) +
+            get_cacti_area(l2_ways, l2_block_size, l2_size,
+                           technology=technology))
+
+
+def add_area(data_frame, **kwargs):
+    """Adds an area column (see `cache_area`) for each (ways, l1_size)."""
+    areas = {}
+    for ways, size in set(zip(data_frame['ways'], data_frame['l1_size'])):
+        areas[ways, size] = cache_area(int(ways), int(size), **kwargs)
+    data_frame[AREA_COLUMN] = [areas[w, s] for w, s in
+                               zip(data_frame['ways'], data_frame['l1_size'])]
+    return data_frame
+
+
+def read_results(filename):
+    """Reads a results CSV (column names may have leading spaces)."""
+    import pandas as pd
+    return pd.read_csv(filename, sep=',', skipinitialspace=True)
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data_path', help='Path to CSV file containing data.')
+    parser.add_argument('-o', '--out', default=None,
+                        help='Where to write the frontier (CSV).')
+    parser.add_argument('--area', default=False, action='store_true',
+                        help='Use L1 + L2 area (from CACTI) as a third '
+                             'objective.')
+    parser.add_argument('--l2_size', type=int, default=2097152)
+    parser.add_argument('--technology', type=float, default=None,
+                        help="CACTI technology node in microns.")
+    args = parser.parse_args()
+
+    df = read_results(args.data_path)
+    objectives = [TIME_COLUMN, ENERGY_COLUMN]
+    if args.area:
+        add_area(df, l2_size=args.l2_size, technology=args.technology)
+        objectives.append(AREA_COLUMN)
+    front = pareto_front(df, objectives)
+    print('%s of %s configurations are Pareto-optimal.' % (len(front), len(df)))
+    print(front.to_string(index=False))
+    if args.out is not None:
+        front.to_csv(args.out, index=False)
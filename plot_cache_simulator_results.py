@@ -2,9 +2,19 @@ import seaborn as sns
 from matplotlib import pyplot as plt
 import pandas as pd
 from math import log2
+from pareto import pareto_front_2d
 
 
-def plot(data_frame, filename, hue, x_column, y_column):
+def downsample_dominated(data_frame, frontier_mask, max_points, seed=0):
+    """Keeps all frontier rows and at most `max_points` other rows."""
+    dominated = data_frame[~frontier_mask]
+    if max_points is None or len(dominated) <= max_points:
+        return data_frame
+    dominated = dominated.sample(n=max_points, random_state=seed)
+    return pd.concat([data_frame[frontier_mask], dominated])
+
+
+def plot(data_frame, filename, hue, x_column, y_column, frontier=None):
     # plt.rc('text', usetex=True)
     # plt.rc('font', family='serif')
 
@@ -18,6 +28,13 @@ def plot(data_frame, filename, hue, x_column, y_column):
                     # sizes=(1, 8),
                     # linewidth=0,
                     data=data_frame, ax=ax)
+    if frontier is not None:
+        ax.plot(frontier[x_column], frontier[y_column], color='black',
+                drawstyle='steps-post', linewidth=1, zorder=3)
+        ax.scatter(frontier[x_column], frontier[y_column], s=60,
+                   facecolors='none', edgecolors='black', linewidths=1.5,
+                   zorder=4, label='Pareto frontier')
+        ax.legend()
 
     g.tight_layout()
     g.savefig(filename)
@@ -29,14 +46,31 @@ if __name__ == '__main__':
     parser.add_argument('data_path', help='Path to CSV file containing data.')
     parser.add_argument('output_filename', help='Filename for output plot.')
     parser.add_argument('hue', help='')
+    parser.add_argument('--pareto', default=False, action='store_true',
+                        help='Highlight the time/energy Pareto frontier.')
+    parser.add_argument('--frontier_csv', default=None,
+                        help='Also write the Pareto frontier to this CSV.')
+    parser.add_argument('--max_points', type=int, default=None,
+                        help='Plot at most this many (randomly sampled) '
+                             'points off the frontier.')
     args = parser.parse_args()
 
     # load csv data into pandas DataFrame
-    df = pd.read_csv(args.data_path, ',')
+    df = pd.read_csv(args.data_path, sep=',', skipinitialspace=True)
     if len(df) == 0:
         print('data_path = "%s" is empty.' % args.data_path)
         exit(1)
 
+    # find the Pareto frontier (minimizing time and energy per pixel)
+    front = pareto_front_2d(df.iloc[:, 0].to_numpy(dtype='float64'),
+                            df.iloc[:, 1].to_numpy(dtype='float64'))
+    front_labels = df.index[front]
+    frontier_mask = df.index.isin(front_labels)
+    if args.frontier_csv is not None:
+        df.iloc[front].to_csv(args.frontier_csv, index=False)
+    if args.pareto or args.max_points is not None:
+        df = downsample_dominated(df, frontier_mask, args.max_points)
+
     # change names of columns and categories for plot aesthetics
     associativity_dict = (['fully-associative', 'direct-mapped'] +
                           ['%s-way' % k for k in range(2, df.ways.max() + 1)])
@@ -49,8 +83,12 @@ if __name__ == '__main__':
     df = df.rename(columns=name_change_dict)
 
     # create plot
+    frontier = None
+    if args.pareto:
+        frontier = df.loc[front_labels].sort_values(new_column_names[0])
     plot(data_frame=df,
          filename=args.output_filename,
          hue=name_change_dict.get(args.hue, args.hue),
          x_column=new_column_names[0],
-         y_column=new_column_names[1])
+         y_column=new_column_names[1],
+         frontier=frontier)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""Renders all sweep plots (mode x metric x swept parameter) in one process.
+
+Reads either
+
+* machine-readable `perf stat -x, -o stat_<mode>_<image size>_<batch
+  size>.csv` files, as written by `analyze.sh` (the swept parameter is the
+  name of the directory they are in, "image_size" or "batch_size"), or the
+  human-readable `stat_*.txt` files earlier versions of `analyze.sh`
+  wrote in their place, or
+* the CSV written by `sweep.py`,
+
+and writes one plot per (swept parameter, mode, metric), using a single
+figure that is cleared and reused between plots (optionally in several
+worker processes).
+
+Usage
+-----
+* Plots for `analyze.sh` results::
+
+    $ python plot_perf.py results/image_size results/batch_size
+
+
+* Plots for `sweep.py` results, using 4 processes::
+
+    $ python plot_perf.py results/sweep.csv -o plots -j 4
+
+"""
+
+from __future__ import division, print_function
+import os
+import csv
+from glob import glob
+
+DEFAULT_METRICS = ['LLC-load-misses', 'branch-misses']
+AXIS_LABELS = {'image_size': 'Image Size (px^2)', 'batch_size': 'Batch Size'}
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None  # e.g. "<not counted>", "<not supported>" or empty
+
+
+def read_perf_csv(filename):
+    """Returns {event: count} from `perf stat -x,` output (event modifiers
+    such as ":u" are dropped, uncounted events are None)."""
+    counts = {}
+    with open(filename) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split(',')
+            if len(fields) < 3:
+                continue
+            counts[fields[2].split(':')[0]] = _number(fields[0])
+    return counts
+
+
+def read_perf_text(filename):
+    """Returns {event: count} from human-readable `perf stat` output (as
+    `read_perf_csv` does; thousands separators of `-B` are removed)."""
+    counts = {}
+    with open(filename) as f:
+        for line in f:
+            fields = line.split('#')[0].split()
+            if len(fields) < 2 or 'elapsed' in fields or 'seconds' in fields:
+                continue
+            if fields[0] == '<not':  # "<not counted>" or "<not supported>"
+                if len(fields) > 2:
+                    counts[fields[2].split(':')[0]] = None
+                continue
+            value = _number(fields[0].replace(',', ''))
+            if value is None:
+                continue  # e.g. "Performance counter stats for ..."
+            event = fields[2] if fields[1] == 'msec' and len(fields) > 2 \
+                else fields[1]
+            counts[event.split(':')[0]] = value
+    return counts
+
+
+def load_perf_results(result_dirs):
+    """Returns one row (dict) per `stat_*.csv` (or older `stat_*.txt`)
+    file in `result_dirs`."""
+    rows = []
+    for result_dir in result_dirs:
+        sweep = os.path.basename(os.path.normpath(result_dir))
+        for filename in (glob(os.path.join(result_dir, 'stat_*.csv')) +
+                         glob(os.path.join(result_dir, 'stat_*.txt'))):
+            name = os.path.splitext(os.path.basename(filename))[0]
+            mode, image_size, batch_size = name[len('stat_'):].rsplit('_', 2)
+            row = {'sweep': sweep, 'mode': mode,
+                   'image_size': int(image_size),
+                   'batch_size': int(batch_size)}
+            row.update(read_perf_csv(filename) if filename.endswith('.csv')
+                       else read_perf_text(filename))
+            rows.append(row)
+    return rows
+
+
+def load_sweep_results(filename):
+    """Returns one row (dict) per line of a `sweep.py` CSV."""
+    rows = []
+    with open(filename) as f:
+        for row in csv.DictReader(f):
+            for key in row:
+                if key not in ('sweep', 'mode'):
+                    row[key] = _number(row[key])
+            row['image_size'] = int(row['image_size'])
+            row['batch_size'] = int(row['batch_size'])
+            rows.append(row)
+    return rows
+
+
+def series(rows, metrics):
+    """Groups rows into plottable series.
+
+    Returns
+    -------
+    series (dict)
+        Maps (sweep, mode, metric) to (x values, y values), sorted by x.
+        Repeated measurements of the same point are averaged.
+    """
+    points = {}
+    for row in rows:
+        x = row[row['sweep']]
+        for metric in metrics:
+            y = row.get(metric)
+            if y is None:
+                continue
+            points.setdefault((row['sweep'], row['mode'], metric),
+                              {}).setdefault(x, []).append(y)
+    return {key: (sorted(xy), [sum(xy[x]) / len(xy[x]) for x in sorted(xy)])
+            for key, xy in points.items()}
+
+
+_figure = None
+
+
+def _init_figure():
+    """Shared figure setup (done once per process)."""
+    global _figure
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    _figure = plt.figure(figsize=(6.4, 4.8))
+
+
+def _render(job):
+    filename, sweep, mode, metric, xs, ys = job
+    if _figure is None:
+        _init_figure()
+    _figure.clear()
+    ax = _figure.add_subplot(1, 1, 1)
+    ax.plot(xs, ys)
+    label = AXIS_LABELS.get(sweep, sweep)
+    ax.set_xlabel(label)
+    ax.set_ylabel(metric)
+    ax.set_title('%s vs. %s (%s)' % (label.split(' (')[0], metric, mode))
+    _figure.tight_layout()
+    _figure.savefig(filename)
+    return filename
+
+
+def plot_all(rows, out_dir, metrics=DEFAULT_METRICS, processes=1):
+    """Writes `<out_dir>/<sweep>/summary_<mode>_<metric>.png` for each
+    series (see `series`) and returns the filenames."""
+    jobs = []
+    for (sweep, mode, metric), (xs, ys) in sorted(series(rows, metrics).items()):
+        plot_dir = os.path.join(out_dir, sweep)
+        if not os.path.exists(plot_dir):
+            os.makedirs(plot_dir)
+        filename = os.path.join(plot_dir, 'summary_%s_%s.png' % (mode, metric))
+        jobs.append((filename, sweep, mode, metric, xs, ys))
+
+    if processes > 1:
+        from multiprocessing import Pool
+        with Pool(processes, initializer=_init_figure) as pool:
+            return pool.map(_render, jobs, chunksize=max(1, len(jobs) //
+                                                         (4 * processes)))
+    return [_render(job) for job in jobs]
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('results', nargs='+',
+        help='Directories of `perf stat -x,` CSV files (named after the swept '
+             'parameter), or `sweep.py` CSV files.')
+    parser.add_argument('-o', '--out_dir', default=None,
+        help='Where to save plots (defaults to the parent directory of the '
+             'first result).')
+    parser.add_argument('-m', '--metrics', nargs='+', default=DEFAULT_METRICS)
+    parser.add_argument('-j', '--processes', type=int, default=1,
+        help='Number of processes rendering plots.')
+    args = parser.parse_args()
+
+    rows = load_perf_results([r for r in args.results if os.path.isdir(r)])
+    for filename in args.results:
+        if not os.path.isdir(filename):
+            rows += load_sweep_results(filename)
+    out_dir = args.out_dir
+    if out_dir is None:
+        out_dir = os.path.dirname(os.path.normpath(args.results[0])) or '.'
+
+    filenames = plot_all(rows, out_dir, metrics=args.metrics,
+                         processes=args.processes)
+    print('Wrote %s plots to %s.' % (len(filenames), out_dir))
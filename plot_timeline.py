@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""Plots miss rates over time from a timeline CSV (see `cache.Timeline`).
+
+Usage
+-----
+    $ python cache.py rot 250 2 8 8 --timeline rot_timeline.csv --snapshot_row_sets
+    $ python plot_timeline.py rot_timeline.csv rot_timeline.png
+
+"""
+
+from __future__ import division, print_function
+import csv
+from matplotlib import pyplot as plt
+
+
+def plot_timeline(timeline_csv, filename, levels=('L1', 'L2')):
+    with open(timeline_csv) as f:
+        intervals = list(csv.DictReader(f))
+    accesses = [int(row['accesses']) for row in intervals]
+
+    fig, ax = plt.subplots(figsize=(8, 4.5))
+    for level in levels:
+        ax.plot(accesses, [float(row['%s_miss_rate' % level])
+                           if row['%s_miss_rate' % level] else float('nan')
+                           for row in intervals],
+                label=level, drawstyle='steps-pre')
+
+    # mark image boundaries
+    for row, next_row in zip(intervals, intervals[1:]):
+        if row['image'] != next_row['image']:
+            ax.axvline(int(row['accesses']), color='gray', linestyle=':',
+                       linewidth=1)
+
+    ax.set_xlabel('Accesses')
+    ax.set_ylabel('Miss rate (per interval)')
+    ax.set_ylim(bottom=0)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(filename)
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('timeline_csv', help='Timeline written by cache.py.')
+    parser.add_argument('output_filename', help='Filename for output plot.')
+    parser.add_argument('-l', '--levels', nargs='+', default=['L1', 'L2'])
+    args = parser.parse_args()
+
+    plot_timeline(args.timeline_csv, args.output_filename, levels=args.levels)
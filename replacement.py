@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+"""Replacement policies for `cache_model.CacheLevel`, and a report of how
+close each comes to Belady's optimal (OPT) policy.
+
+Policies keep whatever per-set state they need next to the level's
+`placement` (per set, an OrderedDict of line -> dirty in insertion order)
+and are told about every lookup:
+
+* `touch(set_index, entries, line, is_store, position)` on a hit,
+* `victim(set_index, entries)` when a full set needs room,
+* `evict(set_index, line)` once the victim is gone, and
+* `insert(set_index, entries, line, position)` once a line is placed,
+
+where `position` is the index of the lookup in the level's sequence of
+lookups.  As in pycachesim, store hits do not update the replacement
+state of the practical policies (OPT has to track them).
+
+OPT evicts the line whose next use is furthest away.  Next uses are
+precomputed from the sequence of lines the level looks up, in one
+backward pass (see `next_uses`); as that sequence does not depend on the
+level's own policy, it is recorded by a first simulation pass (see
+`cache_model.simulate_policies`).
+
+Usage
+-----
+    $ python replacement.py rot 250 2 --geometries 8:32768 2:32768 \\
+          --seed 0
+
+"""
+
+from __future__ import division, print_function
+import random
+
+POLICIES = ('LRU', 'FIFO', 'RANDOM', 'PLRU', 'SRRIP', 'BRRIP', 'OPT')
+
+
+class LRU(object):
+    """Least recently used (the OrderedDict is kept in recency order)."""
+
+    def __init__(self, sets, ways, seed=None):
+        pass
+
+    def touch(self, set_index, entries, line, is_store, position):
+        if not is_store:
+            entries.move_to_end(line)
+
+    def victim(self, set_index, entries):
+        return next(iter(entries))
+
+    def evict(self, set_index, line):
+        pass
+
+    def insert(self, set_index, entries, line, position):
+        pass
+
+
+class FIFO(LRU):
+    """First in, first out (the OrderedDict is kept in insertion order)."""
+
+    def touch(self, set_index, entries, line, is_store, position):
+        pass
+
+
+class Random(LRU):
+    """Evicts a uniformly random line of the set (seeded)."""
+
+    def __init__(self, sets, ways, seed=None):
+        self.rng = random.Random(seed)
+
+    def touch(self, set_index, entries, line, is_store, position):
+        pass
+
+    def victim(self, set_index, entries):
+        return self.rng.choice(list(entries))
+
+
+class TreePLRU(LRU):
+    """Tree pseudo-LRU: `ways - 1` bits per set, each pointing to the half
+    of its subtree holding the victim; an access points the bits on its
+    path away from its way."""
+
+    def __init__(self, sets, ways, seed=None):
+        if ways & (ways - 1):
+            raise ValueError('Tree-PLRU needs a power of two ways, got %s.'
+                             '' % ways)
+        self.ways = ways
+        self.bits = [[0] * (ways - 1) for _ in range(sets)]
+        self.lines = [[None] * ways for _ in range(sets)]
+        self.way_of = [{} for _ in range(sets)]
+
+    def _point_away(self, set_index, way):
+        bits = self.bits[set_index]
+        node, lo, hi = 0, 0, self.ways
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if way < mid:
+                bits[node], node, hi = 1, 2 * node + 1, mid
+            else:
+                bits[node], node, lo = 0, 2 * node + 2, mid
+
+    def touch(self, set_index, entries, line, is_store, position):
+        if not is_store:
+            self._point_away(set_index, self.way_of[set_index][line])
+
+    def victim(self, set_index, entries):
+        bits = self.bits[set_index]
+        node, lo, hi = 0, 0, self.ways
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if bits[node]:
+                node, lo = 2 * node + 2, mid
+            else:
+                node, hi = 2 * node + 1, mid
+        return self.lines[set_index][lo]
+
+    def evict(self, set_index, line):
+        way = self.way_of[set_index].pop(line)
+        self.lines[set_index][way] = None
+
+    def insert(self, set_index, entries, line, position):
+        way = self.lines[set_index].index(None)
+        self.lines[set_index][way] = line
+        self.way_of[set_index][line] = way
+        self._point_away(set_index, way)
+
+
+class SRRIP(LRU):
+    """Static re-reference interval prediction (Jaleel et al., ISCA 2010)
+    with `bits`-bit predictions: lines are inserted with a long
+    re-reference interval (max - 1), promoted to 0 on a hit, and the
+    first line (in insertion order) predicted distant (max) is evicted,
+    ageing the whole set until there is one."""
+
+    bimodal = False
+
+    def __init__(self, sets, ways, seed=None, bits=2, epsilon=1 / 32):
+        self.max = 2**bits - 1
+        self.epsilon = epsilon
+        self.rrpv = [{} for _ in range(sets)]
+        self.rng = random.Random(seed)
+
+    def touch(self, set_index, entries, line, is_store, position):
+        if not is_store:
+            self.rrpv[set_index][line] = 0
+
+    def victim(self, set_index, entries):
+        rrpv = self.rrpv[set_index]
+        age = self.max - max(rrpv[line] for line in entries)
+        if age:
+            for line in entries:
+                rrpv[line] += age
+        return next(line for line in entries if rrpv[line] == self.max)
+
+    def evict(self, set_index, line):
+        del self.rrpv[set_index][line]
+
+    def insert(self, set_index, entries, line, position):
+        distant = self.bimodal and self.rng.random() >= self.epsilon
+        self.rrpv[set_index][line] = self.max if distant else self.max - 1
+
+
+class BRRIP(SRRIP):
+    """Bimodal RRIP: inserts with a distant prediction except with
+    probability `epsilon` (seeded), so that scans do not flush the set."""
+
+    bimodal = True
+
+
+class Belady(LRU):
+    """Offline optimal policy: evicts the line whose next use (given by
+    `next_use`, indexed by lookup position) is furthest away."""
+
+    def __init__(self, sets, ways, seed=None, next_use=None):
+        if next_use is None:
+            raise ValueError('OPT needs the next use of every lookup '
+                             '(see `next_uses`).')
+        self.next_use = next_use
+        self.key = [{} for _ in range(sets)]
+
+    def touch(self, set_index, entries, line, is_store, position):
+        self.key[set_index][line] = self.next_use[position]
+
+    def victim(self, set_index, entries):
+        return max(entries, key=self.key[set_index].__getitem__)
+
+    def evict(self, set_index, line):
+        del self.key[set_index][line]
+
+    def insert(self, set_index, entries, line, position):
+        self.key[set_index][line] = self.next_use[position]
+
+
+_classes = {'LRU': LRU, 'FIFO': FIFO, 'RANDOM': Random, 'PLRU': TreePLRU,
+            'SRRIP': SRRIP, 'BRRIP': BRRIP, 'OPT': Belady}
+
+
+def create_policy(name, sets, ways, seed=None, next_use=None):
+    """Returns a policy (one of `POLICIES`) for a level of this geometry."""
+    if name not in _classes:
+        raise ValueError('Unknown replacement policy %r (expected one of %s).'
+                         '' % (name, ', '.join(POLICIES)))
+    if name == 'OPT':
+        return Belady(sets, ways, next_use=next_use)
+    return _classes[name](sets, ways, seed=seed)
+
+
+def next_uses(lines):
+    """Returns, for each position in `lines`, the position of the next
+    occurrence of the same line (`len(lines)` if there is none)."""
+    never = len(lines)
+    next_use = [never] * len(lines)
+    last = {}
+    for i in range(len(lines) - 1, -1, -1):
+        next_use[i] = last.get(lines[i], never)
+        last[lines[i]] = i
+    return next_use
+
+
+def policy_report(kernel, image_size, n_images, geometries,
+                  policies=POLICIES, parallelism=1, store_to_cache=False,
+                  seed=0, level='L1', l2_size=2097152, block_size=64):
+    """Misses of each policy (at `level`, the same policy at both levels)
+    for each (ways, L1 size) of `geometries`.
+
+    Returns
+    -------
+    report (list of tuples)
+        (ways, l1_size, policy, misses, misses / OPT misses).
+    """
+    from cache import iterate_accesses, generator_dict
+    from cache_model import simulate_policies
+    random.seed(seed)
+    trace = list(iterate_accesses(generator_dict[kernel], (image_size,) * 2,
+                                  n_images, parallelism=parallelism,
+                                  store_to_cache=store_to_cache))
+    report = []
+    for ways, l1_size in geometries:
+        misses = {}
+        for policy in policies:
+            stats = simulate_policies(trace, l1_policy=policy,
+                                      l2_policy=policy, seed=seed,
+                                      l1_ways=ways, l1_block_size=block_size,
+                                      l1_size=l1_size, l2_ways=ways,
+                                      l2_block_size=block_size,
+                                      l2_size=l2_size)
+            misses[policy] = next(s['MISS_count'] for s in stats
+                                  if s['name'] == level)
+        best = misses.get('OPT')
+        for policy in policies:
+            report.append((ways, l1_size, policy, misses[policy],
+                           misses[policy] / best if best else None))
+    return report
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('kernel', help='which kernel (rot, hflip, or vflip).')
+    parser.add_argument('image_size', type=int, help='Width of (square) images.')
+    parser.add_argument('n_images', type=int, help='Number of images to process.')
+    parser.add_argument('--geometries', nargs='+', default=['8:32768'],
+                        help='L1 (and L2) ways and L1 size, as WAYS:SIZE.')
+    parser.add_argument('--policies', nargs='+', default=list(POLICIES),
+                        choices=POLICIES)
+    parser.add_argument('--level', default='L1', choices=['L1', 'L2'])
+    parser.add_argument('-p', '--parallelism', type=int, default=1)
+    parser.add_argument('--store_to_cache', default=False, action='store_true')
+    parser.add_argument('--l2_size', type=int, default=2097152)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    geometries = [tuple(int(x) for x in g.split(':')) for g in args.geometries]
+    print('%5s %8s %-6s %10s %8s' % ('ways', 'l1_size', 'policy',
+                                     '%s misses' % args.level, 'vs. OPT'))
+    for row in policy_report(args.kernel, args.image_size, args.n_images,
+                             geometries, policies=args.policies,
+                             parallelism=args.parallelism,
+                             store_to_cache=args.store_to_cache,
+                             seed=args.seed, level=args.level,
+                             l2_size=args.l2_size):
+        print('%5s %8s %-6s %10s %8s' % (row[:4] + (
+            '-' if row[4] is None else '%.3f' % row[4],)))
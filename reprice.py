@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""Re-prices stored cache simulations without re-simulating them.
+
+`cache.main(..., counts_dir=...)` (and the `run_*`/`xrun_*` experiment
+scripts) store the raw per-level event counts of every workload they
+simulate (see `cache.load_or_simulate_counts`).  This script applies a
+(possibly different) DRAM cost model, DRAM multiplier or CACTI technology
+node to all stored counts, which takes seconds rather than a full
+re-simulation.
+
+Output CSV files start with the columns of the `run_*` experiment results
+(time per pixel (ns), energy per pixel (nJ), rows, ways, l1_size) followed by
+the rest of each workload's parameters (the DRAM configuration as the
+parameters in which it differs from `dram.DDR3Config()`).  Workloads simulated with the DRAM model are
+priced with their stored DRAM configuration.
+
+Usage
+-----
+* What the `xrun_*` scripts compute (DRAM costs doubled), for rot only::
+
+    $ python reprice.py -m 2 --kernel rot -o results/reprice_x2.csv
+
+
+* Different DRAM constants at a 45 nm CACTI node::
+
+    $ python reprice.py --dram_access_time 40 --dram_read_energy 20 \\
+          --dram_write_energy 60 --technology 0.045 -o results/reprice_45nm.csv
+
+"""
+
+from __future__ import division, print_function
+import os
+import csv
+import json
+from cache import (price, COUNTS_DIR, DRAM_ACCESS_TIME, DRAM_READ_ENERGY,
+                   DRAM_WRITE_ENERGY)
+
+WORKLOAD_COLUMNS = ['kernel', 'n_images', 'image_size', 'l1_block_size',
+                    'l2_ways', 'l2_block_size', 'l2_size', 'store_to_cache',
+                    'seed', 'dram', 'dram_config', 'l1_policy', 'l2_policy',
+                    'fused', 'warmup_images', 'warmup_accesses']
+
+# parameters `cache.main` only stores when they differ from these
+WORKLOAD_DEFAULTS = {'dram': None, 'dram_config': None, 'l1_policy': 'LRU',
+                     'l2_policy': 'LRU', 'fused': True, 'warmup_images': 0,
+                     'warmup_accesses': 0}
+
+
+def _dram_config(workload):
+    """The stored workload's `dram.DDR3Config` (None for the default)."""
+    if workload['dram_config'] is None:
+        return None
+    from dram import DDR3Config
+    return DDR3Config(**workload['dram_config'])
+
+
+def _column(workload, column):
+    if column == 'dram_config' and workload['dram'] is not None:
+        # the parameters that differ from the default configuration
+        from dram import DDR3Config
+        default = vars(DDR3Config())
+        changed = sorted((k, v) for k, v in
+                         (workload['dram_config'] or {}).items()
+                         if default.get(k) != v)
+        return ' '.join('%s=%s' % kv for kv in changed) or 'default'
+    return workload[column]
+
+
+def stored_counts(counts_dir=COUNTS_DIR, **filters):
+    """Yields the stored (workload, counts) whose workload matches all
+    `filters` (e.g. `kernel='rot'`)."""
+    for name in sorted(os.listdir(counts_dir)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(counts_dir, name)) as f:
+            record = json.load(f)
+        workload = dict(WORKLOAD_DEFAULTS, **record['workload'])
+        if all(workload[k] == v for k, v in filters.items()):
+            yield workload, record['counts']
+
+
+def reprice(out_filename, counts_dir=COUNTS_DIR, filters=None, verbose=True,
+            **pricing):
+    """Prices all stored counts (see `cache.price` for `pricing`) and writes
+    the results to `out_filename`.  Returns the number of workloads."""
+    out_dir = os.path.dirname(out_filename)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    n = 0
+    with open(out_filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['time per pixel (ns)', 'energy per pixel (nJ)',
+                         'rows', 'ways', 'l1_size'] + WORKLOAD_COLUMNS)
+        for workload, counts in stored_counts(counts_dir, **(filters or {})):
+            time_pp, energy_pp = price(
+                counts, image_size=workload['image_size'],
+                n_images=workload['n_images'], l1_ways=workload['l1_ways'],
+                l2_ways=workload['l2_ways'],
+                l1_block_size=workload['l1_block_size'],
+                l2_block_size=workload['l2_block_size'],
+                l1_size=workload['l1_size'], l2_size=workload['l2_size'],
+                dram_config=_dram_config(workload), **pricing)
+            writer.writerow([time_pp, energy_pp, workload['parallelism'],
+                             workload['l1_ways'], workload['l1_size']] +
+                            [_column(workload, c) for c in WORKLOAD_COLUMNS])
+            n += 1
+    if verbose:
+        print('Priced %s stored workloads -> %s' % (n, out_filename))
+    return n
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--out', required=True,
+                        help='Where to write the re-priced results (CSV).')
+    parser.add_argument('--counts_dir', default=COUNTS_DIR)
+    parser.add_argument('-m', '--dram_multiplier', default=1, type=float,
+                        help="Multiply DRAM costs by this factor.")
+    parser.add_argument('--dram_access_time', type=float,
+                        default=DRAM_ACCESS_TIME)
+    parser.add_argument('--dram_read_energy', type=float,
+                        default=DRAM_READ_ENERGY)
+    parser.add_argument('--dram_write_energy', type=float,
+                        default=DRAM_WRITE_ENERGY)
+    parser.add_argument('--technology', type=float, default=None,
+                        help="CACTI technology node in microns.")
+    parser.add_argument('--calibration', default=None,
+                        help="Scale factors JSON (see calibrate.py).")
+    parser.add_argument('--kernel', default=None)
+    parser.add_argument('--image_size', type=int, default=None)
+    parser.add_argument('--n_images', type=int, default=None)
+    parser.add_argument('--store_to_cache', default=None,
+                        choices=['true', 'false'])
+    args = parser.parse_args()
+
+    filters = {k: getattr(args, k) for k in ('kernel', 'image_size', 'n_images')
+               if getattr(args, k) is not None}
+    if args.store_to_cache is not None:
+        filters['store_to_cache'] = args.store_to_cache == 'true'
+
+    reprice(args.out,
+            counts_dir=args.counts_dir,
+            filters=filters,
+            dram_access_time=args.dram_access_time,
+            dram_read_energy_per_access=args.dram_read_energy,
+            dram_write_energy_per_access=args.dram_write_energy,
+            dram_multiplier=args.dram_multiplier,
+            technology=args.technology,
+            calibration=args.calibration)
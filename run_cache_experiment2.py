@@ -16,6 +16,8 @@ l1_sizes = [2**n for n in range(12, 16)]  # note 2**15 = 32768
 degrees_of_associativity = [1]
 rows_of_parallelism = [1, 4, 8]
 results_dir = 'results/new-batch-size-test'
+counts_dir = 'results/counts'  # simulated counts, shared by run_* and xrun_*
+seed = 0  # rotation angles; stored counts are per seed
 # os.mkdir(results_dir)
 
 for size in sizes:
@@ -50,6 +52,8 @@ for size in sizes:
                                                       parallelism=rows,
                                                       store_to_cache=store_to_cache,
                                                       dram_multiplier=dram_multiplier,
+                                                      counts_dir=counts_dir,
+                                                      seed=seed,
                                                       verbose=False)
                         except Exception as e:
                             time_pp, energy_pp = 'error', 'error'
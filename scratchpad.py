@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+"""Double-buffered DMA scratchpad model of a kernel (the accelerator
+alternative to the caches of `cache.create_cache`).
+
+The output image is processed in `tile_size` x `tile_size` tiles.  Before
+a tile is computed, a DMA engine copies the bounding box of the source
+pixels the tile reads (under the kernel's transform and border mode,
+reflect_101, exactly as in `cache.iterate_accesses`) from DRAM into a
+scratchpad SRAM, one row of the box per request; the finished output
+tile is copied back.  With double buffering the scratchpad holds two
+boxes and two output tiles, so the transfers for tile i + 1 (and the
+write-back of tile i - 1) overlap the compute of tile i.
+
+Costs
+* DMA: every request moves whole bursts (`burst_size` bytes, aligned),
+  so the bytes moved include the overfetch of the bounding box (pixels
+  in the box the tile never reads) and of burst alignment.  A transfer
+  takes a row-miss latency (tRCD + CL, or + CWL for writes) plus its
+  bytes at the peak bandwidth of the DDR3 configuration (see dram.py);
+  each burst costs DRAM_READ_ENERGY or DRAM_WRITE_ENERGY.
+* Scratchpad: a direct-mapped SRAM of `block_size` words priced by CACTI
+  (`cache.get_cactus_results`).  Compute reads it once per load and
+  writes it once per output pixel, serialized as for L1 in
+  `cache.price`; DMA fills and drains cost one access per word but use
+  the other buffer, so they do not stall compute.
+
+Usage
+-----
+* Sweep tile sizes (written in the format of the cache experiments, see
+  run_cache_experiment.py)::
+
+    $ python scratchpad.py rot 250 2 --tile_sizes 8 16 32 64 --seed 0 \\
+          -o results/scratchpad/rot_2x250.csv
+
+
+* Same without double buffering (transfers and compute serialized)::
+
+    $ python scratchpad.py rot 250 2 --tile_sizes 8 16 32 64 --seed 0 \\
+          --single_buffered
+
+"""
+
+from __future__ import division, print_function
+import os
+from random import seed as random_seed
+import numpy as np
+from cache import (generator_dict, get_cactus_results, DRAM_READ_ENERGY,
+                   DRAM_WRITE_ENERGY)
+
+TILE_SIZES = [4, 8, 16, 32, 64, 128]
+
+
+def reflect_101(x, dimension_length):
+    """`cache.reflect_101` on arrays."""
+    return np.where(x < 0, -x,
+                    np.where(x >= dimension_length,
+                             dimension_length - 2 - x % dimension_length, x))
+
+
+def source_pixels(transform_generator, image_dimensions):
+    """Returns (loads per output pixel, xs, ys), where xs[j][y', x'] and
+    ys[j][y', x'] are the coordinates of the j-th pixel that output pixel
+    (x', y') reads (after the border function), for one image (drawing
+    its random parameters, if any)."""
+    w, h = image_dimensions
+    interp_nec, transform = transform_generator(image_dimensions)
+    x_prime, y_prime = np.meshgrid(np.arange(w), np.arange(h))
+    x, y = transform(x_prime, y_prime)
+    if not interp_nec:
+        return (1, [reflect_101(np.asarray(x), w)],
+                [reflect_101(np.asarray(y), h)])
+    x1, x2 = (reflect_101(np.floor(x).astype(int), w),
+              reflect_101(np.ceil(x).astype(int), w))
+    y1, y2 = (reflect_101(np.floor(y).astype(int), h),
+              reflect_101(np.ceil(y).astype(int), h))
+    return 4, [x1, x2, x1, x2], [y1, y1, y2, y2]
+
+
+def _bursts(y0, y1, x0, x1, w, offset, burst_size, pixel_size=3):
+    """Bursts moved to copy columns x0..x1 of rows y0..y1 (inclusive), one
+    request per row."""
+    rows = np.arange(y0, y1 + 1)
+    start = (rows * w + x0) * pixel_size + offset
+    end = (rows * w + x1 + 1) * pixel_size + offset
+    return int(np.sum((end - 1) // burst_size - start // burst_size + 1))
+
+
+def count_tiles(kernel, image_size, n_images, tile_size, seed=None,
+                burst_size=64, pixel_size=3):
+    """Counts the transfers and accesses of every tile of `n_images`
+    images (angles drawn as in `cache.simulate_counts` with this `seed`).
+
+    Returns
+    -------
+    counts (dict)
+        'tiles': a list of (loads, stores, bytes in, bytes out) per tile
+        in processing order; 'max_box_bytes': the largest bounding box;
+        'used_bytes': bytes of distinct source pixels the tiles read
+        (summed per tile); and 'pixels'.
+    """
+    if seed is not None:
+        random_seed(seed)
+    w = h = image_size
+    tiles, max_box_bytes, used_bytes = [], 0, 0
+    for k in range(n_images):
+        read_offset = w*h*pixel_size*k
+        write_offset = w*h*pixel_size*(k + n_images)
+        n_loads, xs, ys = source_pixels(generator_dict[kernel], (w, h))
+        for ty in range(0, h, tile_size):
+            for tx in range(0, w, tile_size):
+                window = (slice(ty, ty + tile_size), slice(tx, tx + tile_size))
+                sx = np.concatenate([x[window].ravel() for x in xs])
+                sy = np.concatenate([y[window].ravel() for y in ys])
+                x0, x1, y0, y1 = sx.min(), sx.max(), sy.min(), sy.max()
+                bytes_in = burst_size * _bursts(y0, y1, x0, x1, w, read_offset,
+                                                burst_size, pixel_size)
+                ty1 = min(ty + tile_size, h) - 1
+                tx1 = min(tx + tile_size, w) - 1
+                bytes_out = burst_size * _bursts(ty, ty1, tx, tx1, w,
+                                                 write_offset, burst_size,
+                                                 pixel_size)
+                outputs = (ty1 - ty + 1) * (tx1 - tx + 1)
+                tiles.append((n_loads * outputs, outputs, bytes_in, bytes_out))
+                max_box_bytes = max(max_box_bytes, (x1 - x0 + 1) *
+                                    (y1 - y0 + 1) * pixel_size)
+                used_bytes += np.unique(sy * w + sx).size * pixel_size
+    return {'tiles': tiles, 'max_box_bytes': int(max_box_bytes),
+            'used_bytes': int(used_bytes), 'pixels': n_images * w * h}
+
+
+def scratchpad_size_for(counts, tile_size, pixel_size=3, buffers=2):
+    """Smallest power of two holding `buffers` bounding boxes and output
+    tiles."""
+    need = buffers * (counts['max_box_bytes'] + tile_size**2 * pixel_size)
+    return 2**int(np.ceil(np.log2(need)))
+
+
+def price_tiles(counts, scratchpad_size, block_size=64, burst_size=64,
+                double_buffered=True, dram_config=None,
+                dram_read_energy_per_access=DRAM_READ_ENERGY,
+                dram_write_energy_per_access=DRAM_WRITE_ENERGY,
+                technology=None, verbose=False):
+    """Prices the tiles of `count_tiles`.
+
+    Returns
+    -------
+    time_per_pixel, energy_per_pixel (float)
+        In ns and nJ.
+    """
+    from dram import DDR3Config
+    config = DDR3Config() if dram_config is None else dram_config
+    bandwidth = config.channels * config.burst_bytes / (config.tBURST *
+                                                        config.tCK)
+    read_latency = (config.tRCD + config.tCL) * config.tCK
+    write_latency = (config.tRCD + config.tCWL) * config.tCK
+    sram_access_time, sram_read_energy, sram_write_energy = \
+        get_cactus_results(1, block_size, scratchpad_size,
+                           technology=technology)
+
+    tiles = np.array(counts['tiles'], dtype=float)
+    loads, stores, bytes_in, bytes_out = tiles.T
+    compute = (loads + stores) * sram_access_time
+    dma_in = read_latency + bytes_in / bandwidth
+    dma_out = write_latency + bytes_out / bandwidth
+
+    if double_buffered:
+        # while tile i computes, the engine fetches tile i + 1 and drains
+        # tile i - 1
+        transfers = np.append(dma_in[1:], 0) + np.insert(dma_out[:-1], 0, 0)
+        total_time = (dma_in[0] + np.maximum(compute, transfers).sum() +
+                      dma_out[-1])
+    else:
+        total_time = (dma_in + compute + dma_out).sum()
+
+    sram_energy = ((loads.sum() + bytes_out.sum() / block_size) *
+                   sram_read_energy +
+                   (stores.sum() + bytes_in.sum() / block_size) *
+                   sram_write_energy)
+    dram_energy = (bytes_in.sum() / burst_size * dram_read_energy_per_access +
+                   bytes_out.sum() / burst_size * dram_write_energy_per_access)
+    total_energy = sram_energy + dram_energy
+
+    time_per_pixel = total_time / counts['pixels']
+    energy_per_pixel = total_energy / counts['pixels']
+    if verbose:
+        print()
+        print('Time per Pixel (ns):', time_per_pixel)
+        print('Energy per Pixel (nJ):', energy_per_pixel)
+        print('Tiles: %s, scratchpad: %s bytes'
+              '' % (len(tiles), scratchpad_size))
+        print('DMA bytes in / out: %s / %s'
+              '' % (bytes_in.sum(), bytes_out.sum()))
+        print('Overfetch: %s' % overfetch(counts))
+        print('Compute / DMA time: %s / %s'
+              '' % (compute.sum(), dma_in.sum() + dma_out.sum()))
+        print('SRAM / DRAM energy: %s / %s' % (sram_energy, dram_energy))
+    return time_per_pixel, energy_per_pixel
+
+
+def overfetch(counts):
+    """Fraction of the DMA'd source bytes no output pixel of the tile
+    reads (bounding box and burst alignment overfetch)."""
+    bytes_in = sum(tile[2] for tile in counts['tiles'])
+    return 1 - counts['used_bytes'] / bytes_in
+
+
+def main(kernel, image_size, n_images, tile_size, scratchpad_size=None,
+         block_size=64, burst_size=64, double_buffered=True, seed=None,
+         dram_config=None, technology=None, verbose=True):
+    """Counts (see `count_tiles`) and prices (see `price_tiles`) a
+    workload.  The scratchpad defaults to the smallest that fits (see
+    `scratchpad_size_for`).
+
+    Returns
+    -------
+    time_per_pixel, energy_per_pixel (float)
+        In ns and nJ.
+    counts (dict)
+        As returned by `count_tiles`, plus 'scratchpad_size'.
+    """
+    counts = count_tiles(kernel, image_size, n_images, tile_size, seed=seed,
+                         burst_size=burst_size)
+    if scratchpad_size is None:
+        scratchpad_size = scratchpad_size_for(
+            counts, tile_size, buffers=2 if double_buffered else 1)
+    counts['scratchpad_size'] = scratchpad_size
+    time_pp, energy_pp = price_tiles(counts, scratchpad_size,
+                                     block_size=block_size,
+                                     burst_size=burst_size,
+                                     double_buffered=double_buffered,
+                                     dram_config=dram_config,
+                                     technology=technology, verbose=verbose)
+    return time_pp, energy_pp, counts
+
+
+def sweep(kernel, image_size, n_images, tile_sizes=TILE_SIZES,
+          out_filename=None, **kwargs):
+    """Runs `main` for each tile size and returns (and writes to
+    `out_filename`, if given) the results as CSV, in the format of the
+    cache experiments (see run_cache_experiment.py)."""
+    results = ('time per pixel (ns),energy per pixel (nJ),tile_size,'
+               'scratchpad_size,dma bytes per pixel,overfetch\n')
+    for tile_size in tile_sizes:
+        print('tile_size=%s' % tile_size)
+        time_pp, energy_pp, counts = main(kernel, image_size, n_images,
+                                          tile_size, verbose=False, **kwargs)
+        dma_bytes = sum(tile[2] + tile[3] for tile in counts['tiles'])
+        results += ('%s,%s,%s,%s,%s,%s\n'
+                    '' % (time_pp, energy_pp, tile_size,
+                          counts['scratchpad_size'],
+                          dma_bytes / counts['pixels'], overfetch(counts)))
+    if out_filename is not None:
+        out_dir = os.path.dirname(out_filename)
+        if out_dir and not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        with open(out_filename, 'w+') as f:
+            f.write(results)
+    return results
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('kernel', help='which kernel (rot, hflip, or vflip).')
+    parser.add_argument('image_size', type=int, help='Width of (square) images.')
+    parser.add_argument('n_images', type=int, help='Number of images to process.')
+    parser.add_argument('--tile_sizes', nargs='+', type=int, default=TILE_SIZES,
+                        help='Output tile widths to sweep.')
+    parser.add_argument('--scratchpad_size', type=int, default=None,
+                        help='Scratchpad bytes (defaults to the smallest '
+                             'that fits two bounding boxes and output tiles).')
+    parser.add_argument('--block_size', type=int, default=64,
+                        help='Scratchpad word size in bytes.')
+    parser.add_argument('--burst_size', type=int, default=64,
+                        help='DMA burst size in bytes.')
+    parser.add_argument('--single_buffered', default=False,
+                        action='store_true',
+                        help="Don't overlap transfers with compute.")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed the random rotation angles.")
+    parser.add_argument('--dram_cfg', default=None,
+                        help="Read the DRAM clock and geometry from this "
+                             "CACTI main memory configuration (e.g. "
+                             "ddr3-cvlab.cfg).")
+    parser.add_argument('--technology', type=float, default=None,
+                        help="CACTI technology node in microns.")
+    parser.add_argument('-o', '--out', default=None,
+                        help='Where to write the results (CSV).')
+    args = parser.parse_args()
+
+    dram_config = None
+    if args.dram_cfg is not None:
+        from dram import DDR3Config
+        dram_config = DDR3Config.from_cacti_cfg(args.dram_cfg)
+    print(sweep(args.kernel, args.image_size, args.n_images,
+                tile_sizes=args.tile_sizes, out_filename=args.out,
+                scratchpad_size=args.scratchpad_size,
+                block_size=args.block_size, burst_size=args.burst_size,
+                double_buffered=not args.single_buffered, seed=args.seed,
+                dram_config=dram_config, technology=args.technology))
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""In-process version of the `analyze.sh` sweeps.
+
+`analyze.sh` starts a new `python benchmark.py` under `perf stat` for every
+(mode, image size) and (mode, batch size) point, so every point also pays
+for interpreter startup and the cv2/albumentations imports.  This script
+loads everything once, loops over the points in-process and only counts
+events while the augmentations themselves run.  Results for all points go
+to a single CSV file.
+
+Usage
+-----
+* Same sweeps as `analyze.sh` (counters opened with perf_event_open)::
+
+    $ python sweep.py test_images -o results/sweep.csv
+
+
+* Randomly generated images, only the image size sweep, batch path::
+
+    $ python sweep.py none --generate --sweep image_size --batch
+
+
+* Gate an outer `perf stat` instead (it then reports totals over the
+measured regions only)::
+
+    $ mkfifo ctl.fifo ack.fifo
+    $ perf stat -D -1 --control fifo:ctl.fifo,ack.fifo -e LLC-load-misses \\
+          python sweep.py test_images --perf_control ctl.fifo ack.fifo
+
+"""
+
+from __future__ import division, print_function
+import os
+import csv
+from time import perf_counter
+import numpy as np
+from benchmark import get_augmentation_fcn, augment_batch, load_dataset_cache
+from hwcounters import PerfCounters, PerfControl, DEFAULT_EVENTS
+
+
+# same parameters as analyze.sh
+MODES = ['no_interpolation_necessary', 'interpolation_necessary', 'affine',
+         'rot', 'rot90', 'flip', 'hflip', 'vflip', 'scale', 'ssr', 'none']
+DEFAULT_IMAGE_SIZE = 250
+DEFAULT_BATCH_SIZE = 100
+IMAGE_SIZES = range(50, 2001, 50)
+BATCH_SIZES = range(1, 501)
+
+
+def load_images(image_dir, size, n_images, cache_dir='.dataset_cache'):
+    """Returns at least `n_images` images of shape (size, size, 3).
+
+    Images come from the dataset cache of `image_dir` (see
+    `benchmark.load_dataset_cache`), or are randomly generated if
+    `image_dir` is None.
+    """
+    if image_dir is None:
+        return np.random.randint(0, 256, (n_images, size, size, 3),
+                                 dtype='uint8')
+    images = load_dataset_cache(image_dir, size, cache_dir=cache_dir)
+    if len(images) < n_images:
+        raise ValueError('"%s" contains only %s images (%s needed).'
+                         '' % (image_dir, len(images), n_images))
+    return images
+
+
+def measure(mode, images, counters, batch=False, out=None):
+    """Runs augmentation `mode` on `images`, counting only that region.
+
+    Returns
+    -------
+    seconds (float)
+        Wall time of the measured region.
+    counts (dict)
+        Event counts from `counters` (empty if `counters` is a
+        `PerfControl`, as `perf stat` itself reports the counts).
+    """
+    augment = None if batch or mode == 'none' else get_augmentation_fcn(mode)
+    counters.start()
+    start = perf_counter()
+    if mode == 'none':
+        for image in images:
+            pass
+    elif batch:
+        augment_batch(images, mode, out=out)
+    else:
+        for image in images:
+            augment(**{'image': image})['image']
+    seconds = perf_counter() - start
+    counters.stop()
+    counts = counters.read() if isinstance(counters, PerfCounters) else {}
+    return seconds, counts
+
+
+def sweep(points, image_dir=None, counters=None, batch=False, repeats=1,
+          seed=0, out_filename='results/sweep.csv', events=DEFAULT_EVENTS,
+          cache_dir='.dataset_cache', verbose=True):
+    """Measures each (sweep name, mode, image size, batch size) point.
+
+    Images for each image size are loaded (or generated) once and shared by
+    all points of that size.  Each point is measured `repeats` times, and
+    every repeat is written as its own row of `out_filename`.
+    """
+    if counters is None:
+        counters = PerfCounters(events)
+    columns = ['sweep', 'mode', 'image_size', 'batch_size', 'repeat',
+               'seconds'] + list(events)
+
+    out_dir = os.path.dirname(out_filename)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    # group points by image size so each size is loaded once
+    max_batch = {}
+    for _, _, size, n in points:
+        max_batch[size] = max(n, max_batch.get(size, 0))
+
+    with open(out_filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for size in sorted(max_batch):
+            images = load_images(image_dir, size, max_batch[size], cache_dir)
+            out = np.empty((max_batch[size],) + images.shape[1:], 'uint8')
+            out.fill(0)
+            for name, mode, _, n in [p for p in points if p[2] == size]:
+                for r in range(repeats):
+                    np.random.seed(seed + r)
+                    seconds, counts = measure(mode, images[:n], counters,
+                                              batch=batch, out=out[:n])
+                    writer.writerow([name, mode, size, n, r, seconds] +
+                                    [counts.get(e) for e in events])
+                    if verbose:
+                        print('%s %s size=%s n=%s: %.6f s'
+                              '' % (name, mode, size, n, seconds))
+                f.flush()
+
+
+def sweep_points(sweeps=('image_size', 'batch_size'), modes=MODES,
+                 image_sizes=IMAGE_SIZES, batch_sizes=BATCH_SIZES,
+                 default_image_size=DEFAULT_IMAGE_SIZE,
+                 default_batch_size=DEFAULT_BATCH_SIZE):
+    """Returns the (sweep, mode, image size, batch size) points to measure."""
+    points = []
+    if 'image_size' in sweeps:
+        points += [('image_size', mode, s, default_batch_size)
+                   for s in image_sizes for mode in modes]
+    if 'batch_size' in sweeps:
+        points += [('batch_size', mode, default_image_size, n)
+                   for n in batch_sizes for mode in modes]
+    return points
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('image_dir',
+        help='directory of images.  Ignored if `--generate` flag invoked.')
+    parser.add_argument('--generate', default=False, action='store_true',
+        help='Use randomly generated images.')
+    parser.add_argument('-o', '--out', default='results/sweep.csv',
+        help='Where to write results.')
+    parser.add_argument('--sweep', default='both',
+                        choices=['image_size', 'batch_size', 'both'])
+    parser.add_argument('--modes', nargs='+', default=MODES)
+    parser.add_argument('--image_sizes', nargs=3, type=int,
+                        default=(50, 50, 2000), metavar=('MIN', 'DELTA', 'MAX'))
+    parser.add_argument('--batch_sizes', nargs=3, type=int,
+                        default=(1, 1, 500), metavar=('MIN', 'DELTA', 'MAX'))
+    parser.add_argument('--default_image_size', type=int,
+                        default=DEFAULT_IMAGE_SIZE)
+    parser.add_argument('--default_batch_size', type=int,
+                        default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('-r', '--repeats', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch', default=False, action='store_true',
+        help='Use the batched augmentation path (see `benchmark.augment_batch`).')
+    parser.add_argument('-e', '--events', nargs='+', default=DEFAULT_EVENTS)
+    parser.add_argument('--perf_control', nargs=2, default=None,
+                        metavar=('CTL_FIFO', 'ACK_FIFO'),
+        help="Toggle an outer `perf stat --control` instead of opening "
+             "counters in-process.")
+    parser.add_argument('--dataset_cache', default='.dataset_cache',
+        help='Directory for the decoded/resized dataset cache.')
+    args = parser.parse_args()
+
+    points = sweep_points(
+        sweeps=('image_size', 'batch_size') if args.sweep == 'both'
+        else (args.sweep,),
+        modes=args.modes,
+        image_sizes=range(args.image_sizes[0], args.image_sizes[2] + 1,
+                          args.image_sizes[1]),
+        batch_sizes=range(args.batch_sizes[0], args.batch_sizes[2] + 1,
+                          args.batch_sizes[1]),
+        default_image_size=args.default_image_size,
+        default_batch_size=args.default_batch_size)
+
+    if args.perf_control is not None:
+        counters = PerfControl(*args.perf_control)
+    else:
+        # opened before any OpenCV call, so they count its pool's threads
+        counters = PerfCounters(args.events)
+        for event, reason in counters.unavailable.items():
+            print('Warning: %s unavailable (%s).' % (event, reason))
+
+    sweep(points,
+          image_dir=None if args.generate else args.image_dir,
+          counters=counters,
+          batch=args.batch,
+          repeats=args.repeats,
+          seed=args.seed,
+          out_filename=args.out,
+          events=args.events,
+          cache_dir=args.dataset_cache)
+    counters.close()
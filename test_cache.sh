@@ -13,7 +13,16 @@ l2ways=8
 l2bs=64
 
 for kernel in {rot,hflip,vflip}; do
-	args="cache.py $kernel $w $n $l1ways $l1bs $l1sz $l2ways $l2bs $l2sz"
+	args="cache.py $kernel $w $n $l1ways $l2ways --l1_block_size $l1bs --l1_size $l1sz --l2_block_size $l2bs --l2_size $l2sz"
 	echo "$args"
-    python "$args"
+	python $args
 done
+
+# images simulated one at a time (--precision) must be independent draws
+python -c "
+import cache
+c = cache.Convergence(0.05, seed=0)
+cache.main('ssr', 50, 4, 8, 8, precision=0.05, seed=0, convergence=c,
+           verbose=False)
+assert c.rows[0][2:4] != c.rows[1][2:4], 'consecutive ssr images priced the same'
+"
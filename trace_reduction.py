@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""Reports how much line coalescing (see `cache.coalesce_accesses`) shrinks
+each kernel's trace, and how much faster simulation gets.
+
+Each kernel is simulated with and without coalescing, both with pycachesim
+(`cache.create_cache`) and with the pure-Python model (`cache_model.py`),
+and the statistics of all levels are checked to be identical.  Filtering
+costs more than pycachesim (which replays in C) saves, so coalescing only
+speeds up the pure-Python model; with pycachesim the speedup is below 1.
+
+Usage
+-----
+    $ python trace_reduction.py -s 250 -n 2 --store_to_cache
+
+"""
+
+from __future__ import division, print_function
+import random
+from time import perf_counter
+from cache import create_cache, simulate_reads, generator_dict
+from cache_model import create_hierarchy
+
+BACKENDS = {'pycachesim': create_cache, 'cache_model': create_hierarchy}
+
+
+def _simulate(backend, kernel, image_size, n_images, geometry, coalesce,
+              parallelism=1, store_to_cache=False, seed=0):
+    random.seed(seed)
+    cs = BACKENDS[backend](**geometry)
+    credit = {} if coalesce else None
+    start = perf_counter()
+    _, n_accesses = simulate_reads(generator_dict[kernel], (image_size,) * 2,
+                                   n_images, cs, parallelism=parallelism,
+                                   store_to_cache=store_to_cache,
+                                   credit=credit)
+    seconds = perf_counter() - start
+    stats = [level.stats() for level in cs.levels()]
+    for name, n in (credit or {}).items():
+        stats[0][name] += n
+    return seconds, n_accesses, stats
+
+
+def reduction(kernel, image_size, n_images, geometry, backend='pycachesim',
+              **kwargs):
+    """Returns (trace reduction ratio, speedup) of coalescing."""
+    from cache import coalesce_accesses, iterate_accesses
+    random.seed(kwargs.get('seed', 0))
+    credit = {}
+    trace = iterate_accesses(generator_dict[kernel], (image_size,) * 2,
+                             n_images,
+                             parallelism=kwargs.get('parallelism', 1),
+                             store_to_cache=kwargs.get('store_to_cache', False))
+    n_kept = 0
+    for loads, stores in coalesce_accesses(trace, credit,
+                                           cl_size=geometry['l1_block_size']):
+        n_kept += len(loads) + len(stores or ())
+    n_total = n_kept + credit['LOAD_count'] + credit['STORE_count']
+
+    t_full, _, full = _simulate(backend, kernel, image_size, n_images,
+                                geometry, False, **kwargs)
+    t_coalesced, _, coalesced = _simulate(backend, kernel, image_size,
+                                          n_images, geometry, True, **kwargs)
+    assert full == coalesced, 'coalescing changed the statistics'
+    return n_total / n_kept, t_full / t_coalesced
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', '--kernels', nargs='+',
+                        default=['rot', 'hflip', 'vflip'])
+    parser.add_argument('-s', '--image_size', type=int, default=250)
+    parser.add_argument('-n', '--n_images', type=int, default=2)
+    parser.add_argument('-p', '--parallelism', type=int, default=1)
+    parser.add_argument('--store_to_cache', default=False, action='store_true')
+    parser.add_argument('--l1', nargs=3, type=int, default=(8, 64, 32768),
+                        metavar=('WAYS', 'BLOCK_SIZE', 'SIZE'))
+    parser.add_argument('--l2', nargs=3, type=int, default=(8, 64, 2097152),
+                        metavar=('WAYS', 'BLOCK_SIZE', 'SIZE'))
+    parser.add_argument('-b', '--backends', nargs='+', default=list(BACKENDS),
+                        choices=list(BACKENDS))
+    args = parser.parse_args()
+
+    geometry = dict(zip(('l1_ways', 'l1_block_size', 'l1_size'), args.l1))
+    geometry.update(zip(('l2_ways', 'l2_block_size', 'l2_size'), args.l2))
+    print('%-6s %-12s %16s %8s' % ('kernel', 'backend', 'reduction ratio',
+                                   'speedup'))
+    for kernel in args.kernels:
+        for backend in args.backends:
+            ratio, speedup = reduction(kernel, args.image_size, args.n_images,
+                                       geometry, backend=backend,
+                                       parallelism=args.parallelism,
+                                       store_to_cache=args.store_to_cache)
+            print('%-6s %-12s %16.2f %8.2f' % (kernel, backend, ratio, speedup))
@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+"""Distributes cache simulator sweeps over many hosts via a shared directory.
+
+The queue is a directory on a shared filesystem (e.g. NFS); no broker or
+database is needed, only atomic `rename`:
+
+* `pending/<id>.json` -- points waiting to be run,
+* `leased/<id>~<worker>.json` -- points being run.  A worker leases a point
+  by renaming it here (only one rename can succeed), and heartbeats by
+  touching the file while it runs,
+* `done/<id>.json` -- results (the point and `cache.main`'s return value),
+* `tmp/` -- files being written, renamed into place when complete.
+
+Leases whose heartbeat is older than `lease_timeout` seconds (as measured
+by the file server's clock) are moved back to `pending/` by whichever worker
+notices first, so points of crashed workers are retried.
+
+Usage
+-----
+* Enqueue a `run_cache_experiment.py`-style sweep, then start workers (on
+any number of hosts), then collect the results::
+
+    $ python workqueue.py enqueue /nfs/queue --kernels rot hflip vflip \\
+          --sizes 50 100 250 500 1000 2000 --batch_sizes 1 2 4 8 16 32 64
+    $ python workqueue.py work /nfs/queue -j 16
+    $ python workqueue.py status /nfs/queue
+    $ python workqueue.py collect /nfs/queue -o results/distributed
+
+
+* Check that leasing, retries and results work with local processes::
+
+    $ python workqueue.py selftest
+
+"""
+
+from __future__ import division, print_function
+import os
+import json
+import time
+import random
+import socket
+import threading
+from itertools import count
+from importlib import import_module
+
+DEFAULT_LEASE_TIMEOUT = 600
+DEFAULT_HEARTBEAT = 30
+SUBDIRS = ('pending', 'leased', 'done', 'tmp')
+_batches = count()
+
+
+def worker_name():
+    return '%s.%s' % (socket.gethostname(), os.getpid())
+
+
+class WorkQueue(object):
+    """A work queue in directory `root` (see module docstring)."""
+
+    def __init__(self, root, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        self.root = root
+        self.lease_timeout = lease_timeout
+        for subdir in SUBDIRS:
+            path = os.path.join(root, subdir)
+            if not os.path.exists(path):
+                try:
+                    os.makedirs(path)
+                except OSError:  # created by another worker meanwhile
+                    pass
+
+    def _path(self, subdir, name=''):
+        return os.path.join(self.root, subdir, name)
+
+    def _write(self, subdir, name, record):
+        """Writes `record` to `subdir/name` atomically."""
+        tmp = self._path('tmp', '%s.%s' % (name, worker_name()))
+        with open(tmp, 'w') as f:
+            json.dump(record, f)
+        os.rename(tmp, self._path(subdir, name))
+
+    def now(self):
+        """The file server's current time (avoids clock skew between hosts)."""
+        clock = self._path('tmp', 'clock.%s' % worker_name())
+        with open(clock, 'w'):
+            pass
+        t = os.stat(clock).st_mtime
+        os.remove(clock)
+        return t
+
+    def enqueue(self, tasks):
+        """Adds `tasks` (JSON-serializable dicts) and returns their ids."""
+        batch = '%s-%s-%s' % (time.strftime('%Y%m%d%H%M%S'), worker_name(),
+                              next(_batches))
+        ids = []
+        for k, task in enumerate(tasks):
+            task_id = '%s-%08d' % (batch, k)
+            self._write('pending', task_id + '.json',
+                        {'id': task_id, 'task': task})
+            ids.append(task_id)
+        return ids
+
+    def lease(self):
+        """Leases a pending task.
+
+        Returns
+        -------
+        lease (Lease or None)
+            None if no task is pending (though some may still be leased).
+        """
+        names = os.listdir(self._path('pending'))
+        random.shuffle(names)  # fewer collisions between workers
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            leased = self._path('leased', '%s~%s.json' % (name[:-len('.json')],
+                                                          worker_name()))
+            try:
+                # touch first, so the lease starts with a fresh heartbeat
+                os.utime(self._path('pending', name), None)
+                os.rename(self._path('pending', name), leased)
+            except OSError:  # leased by another worker first
+                continue
+            with open(leased) as f:
+                record = json.load(f)
+            return Lease(self, record['id'], record['task'], leased)
+        return None
+
+    def requeue_expired(self):
+        """Moves expired leases back to pending; returns their number."""
+        now = self.now()
+        n = 0
+        for name in os.listdir(self._path('leased')):
+            path = self._path('leased', name)
+            try:
+                if now - os.stat(path).st_mtime <= self.lease_timeout:
+                    continue
+                os.rename(path, self._path('pending',
+                                           name.split('~')[0] + '.json'))
+                n += 1
+            except OSError:  # finished or requeued meanwhile
+                continue
+        return n
+
+    def counts(self):
+        return {subdir: len([n for n in os.listdir(self._path(subdir))
+                             if n.endswith('.json')])
+                for subdir in ('pending', 'leased', 'done')}
+
+    def results(self):
+        """Yields (task, result) of every finished task."""
+        for name in sorted(os.listdir(self._path('done'))):
+            if name.endswith('.json'):
+                with open(self._path('done', name)) as f:
+                    record = json.load(f)
+                yield record['task'], record['result']
+
+
+class Lease(object):
+    """A leased task.  Call `heartbeat()` more often than the lease timeout
+    (or use as a context manager, which heartbeats from a thread), then
+    `complete(result)`."""
+
+    def __init__(self, queue, task_id, task, path):
+        self.queue = queue
+        self.id = task_id
+        self.task = task
+        self.path = path
+        self.heartbeat_interval = min(DEFAULT_HEARTBEAT,
+                                      queue.lease_timeout / 3)
+        self._stop = threading.Event()
+
+    def heartbeat(self):
+        try:
+            os.utime(self.path, None)
+            return True
+        except OSError:  # expired and requeued by another worker
+            return False
+
+    def complete(self, result):
+        self.queue._write('done', self.id + '.json',
+                          {'id': self.id, 'task': self.task, 'result': result,
+                           'worker': worker_name()})
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        def beat():
+            while not self._stop.wait(self.heartbeat_interval):
+                self.heartbeat()
+        self._thread = threading.Thread(target=beat)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_task(task):
+    """Runs a task, i.e. calls `task['function']` ("module:function",
+    defaults to "cache:main") with keyword arguments `task['kwargs']`."""
+    module, function = task.get('function', 'cache:main').split(':')
+    return getattr(import_module(module), function)(**task['kwargs'])
+
+
+def work(root, lease_timeout=DEFAULT_LEASE_TIMEOUT, poll=10, exit_when_empty=True,
+         verbose=True):
+    """Leases and runs tasks until none is pending or leased."""
+    queue = WorkQueue(root, lease_timeout)
+    n = 0
+    while True:
+        lease = queue.lease()
+        if lease is None:
+            if queue.requeue_expired():
+                continue
+            if exit_when_empty and not queue.counts()['leased']:
+                return n
+            time.sleep(poll)
+            continue
+        with lease:
+            try:
+                result = run_task(lease.task)
+            except Exception as e:
+                # deterministic failures are recorded, not retried
+                result = {'error': repr(e)}
+        lease.complete(result)
+        n += 1
+        if verbose:
+            print('%s: %s -> %s' % (worker_name(), lease.id, result))
+
+
+def _work_in_subprocess(args):
+    return work(*args)
+
+
+def work_in_processes(root, processes, lease_timeout=DEFAULT_LEASE_TIMEOUT,
+                      poll=10, verbose=True):
+    """Runs `processes` workers on this host; returns tasks completed."""
+    if processes == 1:
+        return work(root, lease_timeout, poll, verbose=verbose)
+    from multiprocessing import Pool
+    with Pool(processes) as pool:
+        return sum(pool.map(_work_in_subprocess,
+                            [(root, lease_timeout, poll, True, verbose)] *
+                            processes))
+
+
+def sweep_tasks(kernels=('rot', 'hflip', 'vflip'), sizes=(50, 100, 250, 500),
+                batch_sizes=(2,), l1_sizes=(4096, 8192, 16384, 32768),
+                degrees_of_associativity=(1, 2, 4, 8, 0),
+                rows_of_parallelism=range(1, 17), store_to_cache=False,
+                dram_multiplier=1, seed=None, counts_dir=None):
+    """The points of `run_cache_experiment.py` (same parameters) as tasks."""
+    from cache import is_random
+    if counts_dir is not None and seed is None and any(map(is_random,
+                                                           kernels)):
+        raise ValueError('Stored counts of random kernels need a seed.')
+    tasks = []
+    for size in sizes:
+        for n_images in batch_sizes:
+            for kernel in kernels:
+                for rows in rows_of_parallelism:
+                    for l1_size in l1_sizes:
+                        for ways in degrees_of_associativity:
+                            tasks.append({'function': 'cache:main', 'kwargs': dict(
+                                kernel=kernel, image_size=size,
+                                n_images=n_images, l1_ways=ways, l2_ways=ways,
+                                l1_block_size=64, l2_block_size=64,
+                                l1_size=l1_size, l2_size=2097152,
+                                parallelism=rows,
+                                store_to_cache=store_to_cache,
+                                dram_multiplier=dram_multiplier, seed=seed,
+                                counts_dir=counts_dir, verbose=False)})
+    return tasks
+
+
+def collect(root, results_dir):
+    """Writes finished `cache:main` tasks to CSV files named and formatted as
+    `run_cache_experiment.py` writes them; returns the filenames."""
+    files = {}
+    for task, result in WorkQueue(root).results():
+        kw = task['kwargs']
+        out_basename = kw['kernel'] + '_%sx%s' % (kw['n_images'],
+                                                  kw['image_size']) + '.csv'
+        if kw['store_to_cache']:
+            out_basename = 'store2cache_' + out_basename
+        if isinstance(result, dict):
+            time_pp, energy_pp = 'error', 'error'
+        else:
+            time_pp, energy_pp = result
+        files.setdefault(out_basename, []).append(
+            (kw['parallelism'], kw['l1_size'], kw['l1_ways'], time_pp, energy_pp))
+
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    filenames = []
+    for out_basename, rows in sorted(files.items()):
+        filename = os.path.join(results_dir, out_basename)
+        with open(filename, 'w+') as f:
+            f.write('time per pixel (ns),energy per pixel (nJ),rows,ways,l1_size\n')
+            for rows_, l1_size, ways, time_pp, energy_pp in sorted(
+                    rows, key=lambda r: (r[0], r[1])):
+                f.write('%s,%s,%s,%s,%s\n'
+                        '' % (time_pp, energy_pp, rows_, ways, l1_size))
+        filenames.append(filename)
+    return filenames
+
+
+def _selftest_task(x, crash=False):
+    if crash:
+        os._exit(1)  # dies holding its lease
+    return x * x
+
+
+def selftest(processes=4, n_tasks=40, lease_timeout=2):
+    """Runs a queue with local worker processes, one of which crashes while
+    holding a lease, and checks every task completes exactly once."""
+    import shutil
+    import tempfile
+    from multiprocessing import Process
+    root = tempfile.mkdtemp(prefix='workqueue_selftest_')
+    try:
+        queue = WorkQueue(root, lease_timeout)
+        queue.enqueue([{'function': 'workqueue:_selftest_task',
+                        'kwargs': {'x': 0, 'crash': True}}])
+        crasher = Process(target=work, args=(root, lease_timeout, 0.1, True,
+                                             False))
+        crasher.start()
+        crasher.join()
+        assert queue.counts() == {'pending': 0, 'leased': 1, 'done': 0}
+
+        # the crashed lease is requeued (uncrashing) once it expires
+        name = os.listdir(os.path.join(root, 'leased'))[0]
+        with open(os.path.join(root, 'leased', name)) as f:
+            record = json.load(f)
+        record['task']['kwargs']['crash'] = False
+        with open(os.path.join(root, 'leased', name), 'w') as f:
+            json.dump(record, f)
+
+        queue.enqueue([{'function': 'workqueue:_selftest_task',
+                        'kwargs': {'x': x}} for x in range(1, n_tasks)])
+        workers = [Process(target=work, args=(root, lease_timeout, 0.1, True,
+                                              False))
+                   for _ in range(processes)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+
+        results = sorted(r for _, r in queue.results())
+        assert queue.counts() == {'pending': 0, 'leased': 0, 'done': n_tasks}
+        assert results == [x * x for x in range(n_tasks)], results
+        print('selftest passed: %s tasks, %s workers, 1 expired lease retried.'
+              '' % (n_tasks, processes))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('enqueue', help='Add sweep points.')
+    p.add_argument('queue')
+    p.add_argument('--kernels', nargs='+', default=['rot', 'hflip', 'vflip'])
+    p.add_argument('--sizes', nargs='+', type=int, default=[50, 100, 250, 500])
+    p.add_argument('--batch_sizes', nargs='+', type=int, default=[2])
+    p.add_argument('--l1_sizes', nargs='+', type=int,
+                   default=[4096, 8192, 16384, 32768])
+    p.add_argument('--ways', nargs='+', type=int, default=[1, 2, 4, 8, 0])
+    p.add_argument('--rows', nargs='+', type=int, default=list(range(1, 17)))
+    p.add_argument('--store_to_cache', default=False, action='store_true')
+    p.add_argument('-m', '--dram_multiplier', default=1, type=float)
+    p.add_argument('--seed', type=int, default=None)
+    p.add_argument('--counts_dir', default=None,
+                   help='Shared directory for simulated counts (see '
+                        'reprice.py).')
+
+    p = subparsers.add_parser('work', help='Run leased points until done.')
+    p.add_argument('queue')
+    p.add_argument('-j', '--processes', type=int, default=1)
+    p.add_argument('--lease_timeout', type=float,
+                   default=DEFAULT_LEASE_TIMEOUT,
+                   help='Seconds without heartbeat before a lease expires.')
+    p.add_argument('--poll', type=float, default=10,
+                   help='Seconds to wait while others hold the last leases.')
+
+    p = subparsers.add_parser('status', help='Count pending/leased/done.')
+    p.add_argument('queue')
+
+    p = subparsers.add_parser('collect', help='Write results CSV files.')
+    p.add_argument('queue')
+    p.add_argument('-o', '--results_dir', default='results/distributed')
+
+    p = subparsers.add_parser('selftest', help='Local multi-process test.')
+    p.add_argument('-j', '--processes', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        tasks = sweep_tasks(kernels=args.kernels, sizes=args.sizes,
+                            batch_sizes=args.batch_sizes,
+                            l1_sizes=args.l1_sizes,
+                            degrees_of_associativity=args.ways,
+                            rows_of_parallelism=args.rows,
+                            store_to_cache=args.store_to_cache,
+                            dram_multiplier=args.dram_multiplier,
+                            seed=args.seed, counts_dir=args.counts_dir)
+        WorkQueue(args.queue).enqueue(tasks)
+        print('Enqueued %s points.' % len(tasks))
+    elif args.command == 'work':
+        n = work_in_processes(args.queue, args.processes, args.lease_timeout,
+                              args.poll)
+        print('%s completed %s points.' % (socket.gethostname(), n))
+    elif args.command == 'status':
+        print(WorkQueue(args.queue).counts())
+    elif args.command == 'collect':
+        for filename in collect(args.queue, args.results_dir):
+            print(filename)
+    else:
+        selftest(processes=args.processes)